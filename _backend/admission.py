@@ -0,0 +1,238 @@
+import math
+import time
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+from change_detection import WINDOW_CHUNK
+
+# Rough per-pixel cost of rendering the visualization and change map
+VISUALIZATION_BYTES_PER_PIXEL = 24
+# Fixed per-analysis overhead (maps, predictions, interpreter objects)
+BASE_ANALYSIS_BYTES = 32 * 1024 * 1024
+# Assumed analysis duration until the first one has finished
+DEFAULT_ANALYSIS_SECONDS = 30.0
+
+
+def estimate_analysis_bytes(image_paths, window_size=(64, 64), stride=32, scale=1.0):
+    """
+    Estimate the peak memory of a change detection run from image dimensions
+
+    Only the image headers are read. The estimate covers both decoded images,
+    one chunk of float32 windows (windows are extracted WINDOW_CHUNK at a
+    time) and the visualization canvases.
+
+    Args:
+        image_paths (list): Paths of the before and after images
+        window_size (tuple): Size of sliding window
+        stride (int): Step size for sliding window
+        scale (float): Inference scale relative to the native resolution
+
+    Returns:
+        int: Estimated peak footprint in bytes
+    """
+    images = 0
+    largest_stack = 0
+    largest_image = 0
+
+    for path in image_paths:
+        with Image.open(path) as image:
+            width, height = image.size
+        width = max(int(width * scale), 1)
+        height = max(int(height * scale), 1)
+
+        rows = max(-(-(height - window_size[1]) // stride), 0) + 1
+        cols = max(-(-(width - window_size[0]) // stride), 0) + 1
+        stack = min(rows * cols, WINDOW_CHUNK) * window_size[0] * window_size[1] * 3 * 4
+
+        images += width * height * 3
+        largest_stack = max(largest_stack, stack)
+        largest_image = max(largest_image, width * height)
+
+    return BASE_ANALYSIS_BYTES + images + largest_stack + largest_image * VISUALIZATION_BYTES_PER_PIXEL
+
+
+async def run_to_completion(func, *args, **kwargs):
+    """
+    Run blocking work in the threadpool, holding off cancellation until it returns
+
+    A thread can't be interrupted, so if the caller is cancelled (e.g. the
+    client of a stream went away) the cancellation is only passed on once the
+    thread has finished. An admission reservation around the call is thus
+    released when the memory it stands for is, not while the thread still
+    holds it.
+
+    Returns:
+        The return value of func
+    """
+    task = asyncio.ensure_future(run_in_threadpool(func, *args, **kwargs))
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        while not task.done():
+            try:
+                await asyncio.wait([task])
+            except asyncio.CancelledError:
+                pass
+        raise
+
+
+class _Ticket:
+    """
+    One admitted or queued analysis
+    """
+    def __init__(self, ticket_id, cost, label):
+        self.id = ticket_id
+        self.cost = cost
+        self.label = label
+        self.queued_at = time.monotonic()
+        self.started_at = None
+
+
+class AdmissionController:
+    """
+    Memory-aware admission control for analysis requests
+
+    Analyses run while the sum of their estimated footprints stays within the
+    budget. Requests that don't fit wait in a FIFO queue; a full queue is
+    answered with 429 and a queue wait that runs out with 503, both carrying a
+    Retry-After header derived from recent analysis durations. Background work
+    is never rejected: it waits outside the queue, for as long as it takes,
+    until no request is queued and its cost fits.
+    """
+    def __init__(self, budget_bytes, max_queue=8, queue_timeout=60.0):
+        """
+        Args:
+            budget_bytes (int): Memory available to concurrent analyses
+            max_queue (int): Maximum number of waiting requests
+            queue_timeout (float): Seconds a request may wait for admission
+        """
+        self.budget_bytes = budget_bytes
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = {}
+        self.queue = deque()
+        self.average_duration = DEFAULT_ANALYSIS_SECONDS
+        self.rejected = 0
+        self.background_waiting = 0
+        self._used = 0
+        self._ids = itertools.count(1)
+        self._condition = asyncio.Condition()
+
+    def _retry_after(self):
+        """
+        Estimate when capacity frees up, in whole seconds
+        """
+        waiting = len(self.queue) + 1
+        running = max(len(self.in_flight), 1)
+        return max(math.ceil(self.average_duration * waiting / running), 1)
+
+    def _reject(self, status_code, detail):
+        self.rejected += 1
+        raise HTTPException(status_code=status_code, detail=detail,
+                            headers={"Retry-After": str(self._retry_after())})
+
+    def _fits(self, ticket):
+        return self._used + ticket.cost <= self.budget_bytes
+
+    def _start(self, ticket):
+        ticket.started_at = time.monotonic()
+        self._used += ticket.cost
+        self.in_flight[ticket.id] = ticket
+
+    @asynccontextmanager
+    async def admit(self, cost, label="", background=False):
+        """
+        Hold a share of the memory budget for the duration of an analysis
+
+        Args:
+            cost (int): Estimated peak footprint in bytes
+            label (str): Description shown in the status report
+            background (bool): Wait without a queue limit or timeout, yielding
+                to queued requests, instead of being rejected
+
+        Raises:
+            HTTPException: 413 if the request can never fit the budget,
+                429 if the queue is full, 503 if the queue wait timed out
+                (neither for background work)
+        """
+        if cost > self.budget_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Analysis needs about {cost // 2**20} MB, more than the {self.budget_bytes // 2**20} MB budget"
+            )
+
+        ticket = _Ticket(next(self._ids), cost, label)
+        async with self._condition:
+            if not self.queue and self._fits(ticket):
+                self._start(ticket)
+            elif background:
+                self.background_waiting += 1
+                try:
+                    await self._condition.wait_for(lambda: not self.queue and self._fits(ticket))
+                finally:
+                    self.background_waiting -= 1
+                self._start(ticket)
+            else:
+                if len(self.queue) >= self.max_queue:
+                    self._reject(429, "Too many analyses in progress, try again later")
+
+                self.queue.append(ticket)
+                try:
+                    # FIFO: only the head of the queue may start
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self.queue[0] is ticket and self._fits(ticket)),
+                        self.queue_timeout
+                    )
+                except asyncio.TimeoutError:
+                    self.queue.remove(ticket)
+                    self._condition.notify_all()
+                    self._reject(503, "Timed out waiting for analysis capacity")
+                except BaseException:
+                    # Client went away while queued
+                    self.queue.remove(ticket)
+                    self._condition.notify_all()
+                    raise
+
+                self.queue.popleft()
+                self._start(ticket)
+                # The next request in line may fit as well
+                self._condition.notify_all()
+
+        try:
+            yield ticket
+        finally:
+            async with self._condition:
+                del self.in_flight[ticket.id]
+                self._used -= ticket.cost
+                duration = time.monotonic() - ticket.started_at
+                self.average_duration = 0.8 * self.average_duration + 0.2 * duration
+                self._condition.notify_all()
+
+    def status(self):
+        """
+        Returns:
+            dict: Budget usage with the in-flight and queued analyses
+        """
+        now = time.monotonic()
+        return {
+            "budget_bytes": self.budget_bytes,
+            "in_flight_bytes": self._used,
+            "available_bytes": self.budget_bytes - self._used,
+            "in_flight": [
+                {"label": t.label, "bytes": t.cost, "running_seconds": round(now - t.started_at, 1)}
+                for t in self.in_flight.values()
+            ],
+            "queued": [
+                {"label": t.label, "bytes": t.cost, "waiting_seconds": round(now - t.queued_at, 1)}
+                for t in self.queue
+            ],
+            "background_waiting": self.background_waiting,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "average_duration": round(self.average_duration, 1),
+            "rejected": self.rejected
+        }
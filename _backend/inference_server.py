@@ -0,0 +1,232 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+
+
+class _PendingRequest:
+    """
+    Windows submitted by one caller, consumed in slices by the batching workers
+    """
+    def __init__(self, windows):
+        self.windows = windows
+        self.future = Future()
+        self.enqueued = time.monotonic()
+        self.taken = 0
+        self.remaining = len(windows)
+        self.output = None
+
+
+class InferenceServer:
+    """
+    Shared in-process inference service with cross-request dynamic batching
+
+    Windows submitted by concurrent analyses are queued together and packed
+    into full-size batches. A batch is dispatched as soon as it is full, or
+    once the oldest queued window has waited ``max_delay`` seconds. Each model
+    replica has its own worker thread, and results are scattered back to the
+    submitting request.
+
+    The server exposes a Keras-style ``predict`` so it can stand in for the
+    model of a HighResolutionChangeDetector.
+    """
+    # Callers may submit whole window stacks; the server does its own batching
+    accepts_any_batch = True
+
+    def __init__(self, model_path, replicas=1, batch_size=128, max_delay=0.01, threads_per_replica=None):
+        """
+        Load the model replicas and start the batching workers
+
+        Args:
+            model_path (str): Path to the trained Keras model
+            replicas (int): Number of model replicas, one worker thread each
+            batch_size (int): Maximum number of windows per predict call
+            max_delay (float): Seconds a partial batch waits for more windows
+            threads_per_replica (int): Size of the core group serving one
+                replica, defaults to an even share of the CPU cores
+        """
+        # Imported on first use, so the backend starts without TensorFlow
+        import tensorflow as tf
+
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.threads_per_replica = threads_per_replica or max((os.cpu_count() or 1) // replicas, 1)
+        self._configure_threading(tf, replicas)
+
+        self.replicas = [tf.keras.models.load_model(model_path) for _ in range(replicas)]
+        self.stats = {'requests': 0, 'windows': 0, 'batches': 0}
+
+        self._pending = deque()
+        self._queued_windows = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._workers = [
+            threading.Thread(target=self._serve, args=(replica,), daemon=True, name=f"inference-{index}")
+            for index, replica in enumerate(self.replicas)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _configure_threading(self, tf, replicas):
+        """
+        Split the CPU cores into one group per replica
+
+        TensorFlow thread pools are process wide, so each predict call gets
+        ``threads_per_replica`` intra-op threads and up to ``replicas`` calls
+        run side by side. This only works before the TensorFlow runtime has
+        started; otherwise the existing settings are kept.
+        """
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(self.threads_per_replica)
+            tf.config.threading.set_inter_op_parallelism_threads(replicas)
+        except RuntimeError:
+            print("TensorFlow runtime already initialized, keeping its thread settings")
+
+    def submit(self, windows):
+        """
+        Queue a window stack for prediction
+
+        Args:
+            windows (numpy.ndarray): Window stack of any length
+
+        Returns:
+            concurrent.futures.Future: Resolves to the class probabilities,
+                one row per window
+        """
+        request = _PendingRequest(windows)
+        if len(windows) == 0:
+            request.future.set_result(np.zeros((0,) + self.replicas[0].output_shape[1:], dtype=np.float32))
+            return request.future
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Inference server is closed")
+            self._pending.append(request)
+            self._queued_windows += len(windows)
+            self.stats['requests'] += 1
+            self._condition.notify()
+        return request.future
+
+    def predict(self, windows, verbose=0):
+        """
+        Predict class probabilities, blocking until the result is ready
+
+        Args:
+            windows (numpy.ndarray): Window stack
+            verbose (int): Ignored, accepted for Keras compatibility
+
+        Returns:
+            numpy.ndarray: Class probabilities, one row per window
+        """
+        return self.submit(windows).result()
+
+    def _next_batch(self):
+        """
+        Wait for a full batch or the latency budget, then take the queued slices
+
+        Returns:
+            list: (request, start, stop) slices, or None once the server is closed
+        """
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+
+            # Give other requests until the oldest window's deadline to fill the batch
+            deadline = self._pending[0].enqueued + self.max_delay
+            while self._queued_windows < self.batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            slices = []
+            size = 0
+            while self._pending and size < self.batch_size:
+                request = self._pending[0]
+                if request.future.done():
+                    # Failed in an earlier batch; its other windows aren't worth predicting
+                    self._drop(request)
+                    continue
+                stop = min(request.taken + self.batch_size - size, len(request.windows))
+                slices.append((request, request.taken, stop))
+                size += stop - request.taken
+                request.taken = stop
+                if stop == len(request.windows):
+                    self._pending.popleft()
+
+            self._queued_windows -= size
+            if self._pending:
+                # Let another replica pick up the rest
+                self._condition.notify()
+            return slices
+
+    def _drop(self, request):
+        """
+        Take a request out of the queue with the windows no batch took yet;
+        the caller holds the condition
+        """
+        if request in self._pending:
+            self._pending.remove(request)
+            self._queued_windows -= len(request.windows) - request.taken
+            request.taken = len(request.windows)
+
+    def _serve(self, replica):
+        """
+        Worker loop of one model replica
+        """
+        while True:
+            slices = self._next_batch()
+            if slices is None:
+                return
+            if not slices:
+                continue
+
+            batch = np.concatenate([request.windows[start:stop] for request, start, stop in slices])
+            try:
+                predictions = replica.predict(batch, verbose=0)
+            except Exception as e:
+                # Only the requests in this batch fail; their queued windows are dropped
+                with self._condition:
+                    for request, _, _ in slices:
+                        self._drop(request)
+                        if not request.future.done():
+                            request.future.set_exception(e)
+                continue
+
+            # Scatter the rows back to their requests
+            offset = 0
+            with self._condition:
+                self.stats['batches'] += 1
+                self.stats['windows'] += len(batch)
+                for request, start, stop in slices:
+                    if request.output is None:
+                        request.output = np.empty((len(request.windows),) + predictions.shape[1:], dtype=predictions.dtype)
+                    request.output[start:stop] = predictions[offset:offset + stop - start]
+                    offset += stop - start
+                    request.remaining -= stop - start
+                    if request.remaining == 0 and not request.future.done():
+                        request.future.set_result(request.output)
+
+    def report(self):
+        """
+        Returns:
+            dict: Request, window and batch counts with the mean batch fill
+        """
+        with self._condition:
+            report = dict(self.stats, queued_windows=self._queued_windows, replicas=len(self.replicas))
+        report['mean_batch_size'] = report['windows'] / report['batches'] if report['batches'] else 0.0
+        return report
+
+    def close(self):
+        """
+        Finish the queued work and stop the workers
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
@@ -1,16 +1,22 @@
 from fastapi import FastAPI, HTTPException, Depends, Request, File, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
+from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 from datetime import datetime
-from bson.objectid import ObjectId
 import sys
 import os
+import re
+import json
+import asyncio
+import hashlib
+import threading
+import uuid
+import numpy as np
 from dotenv import load_dotenv
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
 
 load_dotenv()
 # Load environment variables from .env file
@@ -19,7 +25,14 @@ load_dotenv()
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import from change_detection
-from change_detection import HighResolutionChangeDetector
+from change_detection import HighResolutionChangeDetector, roi_polygon
+from inference_server import InferenceServer
+from admission import AdmissionController, estimate_analysis_bytes, run_to_completion
+from storage import CloudinaryStorage, LocalStorage, ArtifactIndex, ArtifactUploader
+from repositories import Database
+from precompute import RegionPrecomputer
+from tile_pyramid import write_tile_pyramid, read_metadata, touch_pyramid, evict_pyramids, TILE_FORMAT
+from model_architecture import MODEL_VARIANTS, model_variant_path
 
 app = FastAPI()
 
@@ -32,20 +45,180 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# MongoDB Connection - Use environment variable
-mongodb_url = os.getenv("MONGODB_URL")
-client = MongoClient(mongodb_url)
-db = client["land_analysis"]
-analysis_collection = db["analysis_history"]
-regions_collection = db["available_regions"]
-
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET"),
-    secure=True
+# MongoDB Connection - Use environment variable. The async client is opened
+# on startup; DATABASE_BACKEND=memory swaps in in-process repositories.
+database = Database(
+    os.getenv("MONGODB_URL"),
+    backend=os.getenv("DATABASE_BACKEND", "mongo"),
+    max_pool_size=int(os.getenv("MONGODB_MAX_POOL_SIZE", "100")),
+    min_pool_size=int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+    timeout_ms=int(os.getenv("MONGODB_TIMEOUT_MS", "5000"))
 )
 
+# Artifact storage: Cloudinary, or a local directory served under /artifacts
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary")
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+UPLOAD_RETRIES = int(os.getenv("UPLOAD_RETRIES", "3"))
+UPLOAD_TIMEOUT = float(os.getenv("UPLOAD_TIMEOUT", "30"))
+
+if STORAGE_BACKEND == "local":
+    LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artifacts'))
+    artifact_storage = LocalStorage(
+        LOCAL_STORAGE_DIR,
+        os.getenv("PUBLIC_BASE_URL", "http://localhost:8000") + "/artifacts"
+    )
+    app.mount("/artifacts", StaticFiles(directory=LOCAL_STORAGE_DIR), name="artifacts")
+else:
+    artifact_storage = CloudinaryStorage(timeout=UPLOAD_TIMEOUT)
+
+# Artifacts are content addressed; the index maps content hashes to stored
+# URLs and is backed by the database once it is connected
+artifact_uploader = ArtifactUploader(
+    artifact_storage,
+    max_workers=UPLOAD_WORKERS,
+    retries=UPLOAD_RETRIES,
+    index=ArtifactIndex()
+)
+
+# Tile pyramids of the analysis layers, stored under their content hash and
+# served by the backend
+TILES_ENABLED = os.getenv("TILES_ENABLED", "1") == "1"
+TILES_DIR = os.getenv("TILES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tiles'))
+TILE_WORKERS = int(os.getenv("TILE_WORKERS", "4"))
+TILE_QUALITY = int(os.getenv("TILE_QUALITY", "80"))
+# Disk space of all pyramids; the least recently used go first, 0 disables the cap
+TILES_MAX_BYTES = int(os.getenv("TILES_MAX_BYTES", str(10 * 2**30)))
+# Tile URLs change with their content, so they can be cached for good
+TILE_CACHE_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
+
+# Trained model variants live in <project>/models; MODEL_VARIANT picks the default.
+# MODELS_DIR and IMAGES_DIR point the backend elsewhere, e.g. for load tests
+MODELS_DIR = os.getenv("MODELS_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models'))
+IMAGES_DIR = os.getenv("IMAGES_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'images'))
+DEFAULT_MODEL_VARIANT = os.getenv("MODEL_VARIANT", "baseline")
+# Optional cascade: a fast variant screens all windows, the full model handles uncertain ones
+CASCADE_FAST_VARIANT = os.getenv("CASCADE_FAST_VARIANT")
+CASCADE_THRESHOLD = float(os.getenv("CASCADE_THRESHOLD", "0.9"))
+# Test-time augmentation: unset, "all" or "low_confidence"
+TTA_MODE = os.getenv("TTA_MODE") or None
+TTA_THRESHOLD = float(os.getenv("TTA_THRESHOLD", "0.7"))
+TTA_MAX_FRACTION = float(os.getenv("TTA_MAX_FRACTION", "0.1"))
+# Shared inference servers batch the windows of concurrent analyses together
+INFERENCE_REPLICAS = int(os.getenv("INFERENCE_REPLICAS", "1"))
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "128"))
+INFERENCE_MAX_DELAY_MS = float(os.getenv("INFERENCE_MAX_DELAY_MS", "10"))
+
+inference_servers = {}
+# Servers are started from threadpool threads, so concurrent first requests
+# must not both load the same model
+inference_servers_lock = threading.Lock()
+
+# Admission control: concurrent analyses share a memory budget, defaulting to
+# half of the physical memory
+ANALYSIS_MEMORY_BUDGET_MB = int(os.getenv(
+    "ANALYSIS_MEMORY_BUDGET_MB",
+    os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**21
+))
+ANALYSIS_MAX_QUEUE = int(os.getenv("ANALYSIS_MAX_QUEUE", "8"))
+ANALYSIS_QUEUE_TIMEOUT = float(os.getenv("ANALYSIS_QUEUE_TIMEOUT", "60"))
+
+admission = AdmissionController(
+    ANALYSIS_MEMORY_BUDGET_MB * 2**20,
+    max_queue=ANALYSIS_MAX_QUEUE,
+    queue_timeout=ANALYSIS_QUEUE_TIMEOUT
+)
+
+
+def get_model_path(variant=None):
+    """
+    Resolve the model file of a variant, raising HTTP errors for bad names or missing files.
+    """
+    variant = variant or DEFAULT_MODEL_VARIANT
+    if variant not in MODEL_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"Unknown model variant: {variant}")
+    
+    model_path = model_variant_path(variant, MODELS_DIR)
+    if not os.path.exists(model_path):
+        raise HTTPException(status_code=404, detail=f"Model file not found at: {model_path}")
+    return model_path
+
+
+def get_inference_server(variant=None):
+    """
+    Return the shared inference server of a model variant, starting it on first use.
+    Starting one loads the model, so call this from the threadpool, not the event loop.
+    """
+    model_path = get_model_path(variant)
+    with inference_servers_lock:
+        if model_path not in inference_servers:
+            inference_servers[model_path] = InferenceServer(
+                model_path,
+                replicas=INFERENCE_REPLICAS,
+                batch_size=INFERENCE_BATCH_SIZE,
+                max_delay=INFERENCE_MAX_DELAY_MS / 1000.0
+            )
+        return inference_servers[model_path]
+
+
+def detector_cache_key(variant=None):
+    """
+    Identify the model files and inference settings a label map was produced with.
+    """
+    variant = variant or DEFAULT_MODEL_VARIANT
+    model_path = get_model_path(variant)
+    settings = [model_path, os.path.getmtime(model_path), TTA_MODE, TTA_THRESHOLD, TTA_MAX_FRACTION]
+    if CASCADE_FAST_VARIANT:
+        fast_model_path = get_model_path(CASCADE_FAST_VARIANT)
+        settings += [fast_model_path, os.path.getmtime(fast_model_path), CASCADE_THRESHOLD]
+    return f"{variant}-{hashlib.sha1(repr(settings).encode()).hexdigest()[:12]}"
+
+
+def create_detector(variant=None):
+    """
+    Build a change detector for a model variant, with the configured cascade and TTA if any.
+    The first call per variant loads the model, so call this from the threadpool.
+    """
+    fast_model = get_inference_server(CASCADE_FAST_VARIANT) if CASCADE_FAST_VARIANT else None
+    return HighResolutionChangeDetector(
+        model=get_inference_server(variant),
+        fast_model=fast_model,
+        cascade_threshold=CASCADE_THRESHOLD,
+        tta=TTA_MODE,
+        tta_threshold=TTA_THRESHOLD,
+        tta_max_fraction=TTA_MAX_FRACTION
+    )
+
+
+def parse_roi(roi):
+    """
+    Validate a region of interest given as a list or JSON text, raising 400 for malformed ones.
+    """
+    if roi is None or roi == "":
+        return None
+    try:
+        if isinstance(roi, str):
+            roi = json.loads(roi)
+        roi_polygon(roi)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid ROI: {e}")
+    return roi
+
+
+# Background classification of predefined regions; the per-year maps are
+# stored so analyses only diff and render
+precomputer = RegionPrecomputer(
+    IMAGES_DIR,
+    os.getenv("PRECOMPUTE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'region_maps')),
+    regions=None,
+    create_detector=create_detector,
+    model_key=detector_cache_key,
+    admission=admission,
+    window_size=(64, 64),
+    stride=32,
+    sweep_interval=float(os.getenv("PRECOMPUTE_SWEEP_INTERVAL", "3600"))
+)
+
+
 # Models
 class RegionModel(BaseModel):
     name: str
@@ -68,6 +241,8 @@ class PredefinedRegionRequest(BaseModel):
     folder: str
     before_image_year: int
     after_image_year: int
+    model_variant: Optional[str] = None
+    roi: Optional[list] = None  # Bounding box [x0, y0, x1, y1] or polygon [[x, y], ...] in image pixels
     
     class Config:
         populate_by_name = True  # Allows both _id and id to be used
@@ -97,48 +272,168 @@ class RegionResponse(BaseModel):
     name: str
     folder: str
     sample_url: str
+    precompute_status: Optional[str] = None  # pending, running, complete, empty or failed
+    precomputed_years: Optional[List[int]] = None
     
     class Config:
         allow_population_by_field_name = True  # Allows both _id and id to be used
 
 
-# function for upload image to cloudinary
-def upload_to_cloudinary(image_path, folder="land_analysis"):
+async def store_analysis(analysis_record, vis_path, change_map_path):
     """
-    Upload an image to Cloudinary and return the URL.
+    Upload the rendered images and save the analysis record.
+    
+    The uploads run in parallel while the record is inserted with an
+    upload_pending flag; once both URLs are known the record is completed.
     
     Args:
-        image_path (str): Path to the image file
-        folder (str): Cloudinary folder to upload to
+        analysis_record (AnalysisHistoryModel): Record without artifact URLs
+        vis_path (str): Path of the visualization image
+        change_map_path (str): Path of the change map image
         
     Returns:
-        str: URL of the uploaded image
+        AnalysisHistoryModel: The record with its artifact URLs
     """
+    uploads = [artifact_uploader.submit(vis_path), artifact_uploader.submit(change_map_path)]
+    
+    # Upload threads can't be cancelled and read the image files, which the
+    # caller removes once this returns, so every exit waits for both of them.
+    # The shields keep a cancelled caller from cancelling the uploads themselves.
+    def settle_uploads():
+        return asyncio.gather(*(asyncio.shield(upload) for upload in uploads), return_exceptions=True)
+    
     try:
-        # Check if Cloudinary configuration is set
-        if not cloudinary.config().cloud_name:
-            # Configure Cloudinary if not already done
-            cloudinary.config(
-                cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-                api_key=os.getenv("CLOUDINARY_API_KEY"),
-                api_secret=os.getenv("CLOUDINARY_API_SECRET"),
-                secure=True
-            )
-            
-        
-        # Upload the image
-        upload_result = cloudinary.uploader.upload(
-            image_path,
-            folder=folder,
-            resource_type="image"
-        )
+        document = dict(analysis_record.model_dump(), upload_pending=True)
+        record_id = await database.history.insert(document)
+    except BaseException:
+        await settle_uploads()
+        raise
+    
+    try:
+        cloud_vis_url, cloud_change_map_url = await asyncio.gather(*(asyncio.shield(upload) for upload in uploads))
+    except BaseException:
+        await settle_uploads()
+        await database.history.delete(record_id)
+        raise
+    print("Images uploaded to artifact storage")
+    
+    await database.history.complete_upload(
+        record_id,
+        {"cloud_vis_url": cloud_vis_url, "cloud_change_map_url": cloud_change_map_url}
+    )
+    
+    analysis_record.cloud_vis_url = cloud_vis_url
+    analysis_record.cloud_change_map_url = cloud_change_map_url
+    return analysis_record
+
+
+def analysis_statistics(detector, results):
+    """
+    Statistics of a change detection result that are available before rendering.
+    """
+    return {
+        "classes": detector.classes,
+        "class_distribution1": results['class_distribution1'],
+        "class_distribution2": results['class_distribution2'],
+        "no_data_fraction1": results['no_data_fraction1'],
+        "no_data_fraction2": results['no_data_fraction2'],
+        "transition_matrix": results['transition_matrix'],
+        "change_percentages": results['change_percentages']
+    }
+
+
+def write_analysis_tiles(detector, results):
+    """
+    Write the tile pyramid of a result under its content hash and return its URL path.
+    An identical pyramid written before is reused. Each new pyramid evicts the least
+    recently used ones beyond TILES_MAX_BYTES.
+    """
+    layers = detector.tile_layers(results)
+    digest = hashlib.sha256(f"{TILE_QUALITY}".encode())
+    for name, image in layers.items():
+        digest.update(f"{name}{image.shape}".encode())
+        digest.update(np.ascontiguousarray(image).data)
+    key = digest.hexdigest()[:32]
+    
+    output_dir = os.path.join(TILES_DIR, key)
+    if read_metadata(output_dir) is not None:
+        touch_pyramid(output_dir)
+    else:
+        write_tile_pyramid(layers, output_dir, quality=TILE_QUALITY, max_workers=TILE_WORKERS)
+        if TILES_MAX_BYTES:
+            evicted = evict_pyramids(TILES_DIR, TILES_MAX_BYTES, keep={key})
+            if evicted:
+                print(f"Evicted {len(evicted)} tile pyramids to stay within {TILES_MAX_BYTES // 2**20} MB")
+    return f"/tiles/{key}"
+
+
+def stream_analysis(run):
+    """
+    Run an analysis in the background and stream its events as Server-Sent Events.
+    
+    Args:
+        run (callable): Takes an emit(event, data) function and returns the
+            analysis coroutine; emit may be called from worker threads
         
-        # Return the URL
-        return upload_result["secure_url"]
+    Returns:
+        StreamingResponse: Stage events followed by 'complete' with the
+        response body, or 'error' with status code and detail
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
     
-    except Exception as e:
-        print(f"Error uploading to Cloudinary: {str(e)}")
-        raise e
+    def emit(event, data=None):
+        loop.call_soon_threadsafe(events.put_nowait, (event, data or {}))
+    
+    async def runner():
+        try:
+            emit("complete", await run(emit))
+        except HTTPException as he:
+            emit("error", {"status_code": he.status_code, "detail": he.detail})
+        except Exception as e:
+            emit("error", {"status_code": 500, "detail": str(e)})
+        finally:
+            emit(None)
+    
+    async def event_stream():
+        task = asyncio.create_task(runner())
+        try:
+            yield f"event: started\ndata: {{}}\n\n"
+            while True:
+                event, data = await events.get()
+                if event is None:
+                    break
+                payload = jsonable_encoder(data, custom_encoder={np.generic: lambda value: value.item(),
+                                                                 np.ndarray: lambda value: value.tolist()})
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            # Stop the analysis if the client went away
+            if not task.done():
+                task.cancel()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.on_event("startup")
+async def connect_database():
+    await database.connect()
+    artifact_uploader.index.repository = database.artifact_index
+    precomputer.regions = database.regions
+    precomputer.start(workers=int(os.getenv("PRECOMPUTE_WORKERS", "1")))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await precomputer.stop()
+    for server in inference_servers.values():
+        await run_in_threadpool(server.close)
+    inference_servers.clear()
+    artifact_uploader.close()
+    await database.close()
 
 
 # ✅ Route: Home
@@ -147,16 +442,53 @@ async def home():
     return {"message": "Welcome to the Change Detection API"}
 
 
+# ✅ Route: Analysis Capacity
+@app.get("/analysis/status")
+async def get_analysis_status():
+    return {
+        "admission": admission.status(),
+        "inference_servers": {
+            os.path.basename(path): server.report() for path, server in inference_servers.items()
+        },
+        "artifacts": artifact_uploader.stats
+    }
+
+
+# ✅ Route: Tile Pyramids
+def get_tile_dir(key):
+    """
+    Directory of a stored tile pyramid; keys are hex content hashes.
+    """
+    if not re.fullmatch(r"[0-9a-f]{32}", key):
+        raise HTTPException(status_code=404, detail="Tiles not found")
+    return os.path.join(TILES_DIR, key)
+
+
+@app.get("/tiles/{key}/tiles.json")
+async def get_tile_metadata(key: str):
+    metadata = read_metadata(get_tile_dir(key))
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="Tiles not found")
+    # Viewers load the metadata first, so this is when a pyramid counts as used
+    touch_pyramid(get_tile_dir(key))
+    return JSONResponse(metadata, headers=TILE_CACHE_HEADERS)
+
+
+@app.get("/tiles/{key}/{layer}/{z}/{x}/{y}." + TILE_FORMAT)
+async def get_tile(key: str, layer: str, z: int, x: int, y: int):
+    if not re.fullmatch(r"[a-z_]+", layer):
+        raise HTTPException(status_code=404, detail="Tile not found")
+    
+    tile_path = os.path.join(get_tile_dir(key), layer, str(z), str(x), f"{y}.{TILE_FORMAT}")
+    if not os.path.exists(tile_path):
+        raise HTTPException(status_code=404, detail="Tile not found")
+    return FileResponse(tile_path, media_type=f"image/{TILE_FORMAT}", headers=TILE_CACHE_HEADERS)
+
+
 # ✅ Route: Get Available Regions
 @app.get("/available-regions", response_model=List[RegionResponse])
 async def get_available_regions():
-    regions = list(regions_collection.find())
-    
-    # Convert ObjectId to string for each document
-    for region in regions:
-        region["_id"] = str(region["_id"])
-    
-    return regions
+    return await database.regions.list()
 
 
 # ✅ Route: Add Available Region
@@ -164,13 +496,16 @@ async def get_available_regions():
 async def add_available_region(region: RegionModel):
     try:
         # Check if region already exists
-        existing_region = regions_collection.find_one({"name": region.name})
+        existing_region = await database.regions.find_by_name(region.name)
         if existing_region:
             raise HTTPException(status_code=400, detail="Region with this name already exists")
         
         # Insert new region
-        regions_collection.insert_one(region.model_dump())
-        return {"message": "Region added successfully"}
+        region_id = await database.regions.insert(region.model_dump())
+        
+        # Classify the region's images in the background
+        await precomputer.enqueue(region_id, region.folder)
+        return {"message": "Region added successfully", "_id": region_id, "precompute_status": "pending"}
     
     except HTTPException as he:
         raise he
@@ -179,205 +514,285 @@ async def add_available_region(region: RegionModel):
 
 
 # ✅ Route: Analyze Predefined Region
-@app.post("/analysis/predefined_region/{user_id}")
-async def analyze_predefined_region(request: PredefinedRegionRequest, user_id: str):
-    try:
-        # Convert string ID to ObjectId
-        print(user_id)
-        obj_instance = ObjectId(request.id)
-        
-        # Find the region
-        region = regions_collection.find_one({"_id": obj_instance})
-        if not region:
-            raise HTTPException(status_code=404, detail="Region not found")
-        
-        # Convert ObjectId to string for serialization
-        region["_id"] = str(region["_id"])
+async def run_predefined_analysis(request, user_id, emit=None):
+    """
+    Analyze a predefined region, reporting stage events through emit(event, data).
+    """
+    emit = emit or (lambda event, data=None: None)
+    
+    # Find the region
+    print(user_id)
+    region = await database.regions.get(request.id)
+    if not region:
+        raise HTTPException(status_code=404, detail="Region not found")
+
+    # Stored maps only need diffing and rendering, so the model (and TensorFlow)
+    # is only loaded when a year still has to be classified
+    detector = HighResolutionChangeDetector(load_model=False)
+    roi = parse_roi(request.roi)
+    
+    # Construct image paths based on region data and request parameters
+    before_image_path = os.path.join(IMAGES_DIR, request.folder, f"{request.before_image_year}.jpg")
+    after_image_path = os.path.join(IMAGES_DIR, request.folder, f"{request.after_image_year}.jpg")
 
-        # Initialize the change detector
-        model_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', 'change_detection.keras')
-        
-        # Check if model file exists
-        if not os.path.exists(model_path):
-            raise HTTPException(status_code=404, detail=f"Model file not found at: {model_path}")
-            
-        detector = HighResolutionChangeDetector(model_path)
-        
-        # Construct image paths based on region data and request parameters
-        before_image_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-                                        'images', request.folder, f"{request.before_image_year}.jpg")
-        after_image_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-                                       'images', request.folder, f"{request.after_image_year}.jpg")
-
-        # Check if image paths exist
-        if not os.path.exists(before_image_path):
-            raise HTTPException(status_code=404, detail=f"Before image not found: {before_image_path}")
-        
-        if not os.path.exists(after_image_path):
-            raise HTTPException(status_code=404, detail=f"After image not found: {after_image_path}")
+    # Check if image paths exist
+    if not os.path.exists(before_image_path):
+        raise HTTPException(status_code=404, detail=f"Before image not found: {before_image_path}")
+    
+    if not os.path.exists(after_image_path):
+        raise HTTPException(status_code=404, detail=f"After image not found: {after_image_path}")
+    
+    # Create img directory if it doesn't exist
+    img_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'img')
+    os.makedirs(img_dir, exist_ok=True)
+    
+    # The random suffix keeps concurrent analyses from sharing output files
+    timestamp = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'img', f"{region['folder']}_{timestamp}.jpg")
+    
+    # Wait for memory budget, then detect changes and generate the visualization
+    cost = await run_in_threadpool(estimate_analysis_bytes, [before_image_path, after_image_path], (64, 64), 32)
+    async with admission.admit(cost, label=f"predefined_region:{request.folder}"):
+        emit("admitted")
         
-        # Detect changes between the images
+        # Use the precomputed classifications, classifying missing years now
         print(f"Detecting changes for region: {region['name']}")
-        results = detector.detect_changes(
+        label_maps = []
+        for stage, year, image_path in (("image1", request.before_image_year, before_image_path),
+                                        ("image2", request.after_image_year, after_image_path)):
+            label_maps.append(await precomputer.get_or_compute_map(
+                request.folder, year, image_path, lambda: create_detector(request.model_variant),
+                request.model_variant,
+                progress=lambda event: emit(event["event"], event), stage=stage
+            ))
+        results = await run_to_completion(
+            detector.detect_changes_from_maps,
             before_image_path,
             after_image_path,
-            window_size=(64, 64),
-            stride=32
+            *label_maps,
+            roi=roi
         )
+        emit("statistics", analysis_statistics(detector, results))
         
-        # Create img directory if it doesn't exist
-        img_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'img')
-        os.makedirs(img_dir, exist_ok=True)
-        
-        # Generate visualization
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'img', f"{region['folder']}_{timestamp}.jpg")
-        # Create img directory if it doesn't exist
-        os.makedirs(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'img'), exist_ok=True)
-        
-        vis_path, change_map_path, critical_changes = detector.generate_change_visualization(results, output_path)
+        vis_path, change_map_path, critical_changes = await run_to_completion(
+            detector.generate_change_visualization, results, output_path
+        )
+        emit("rendered", {"critical_changes": critical_changes})
         
-        print(f"Change detection complete for {region['name']}")
-        print(f"Visualization saved to: {vis_path}")
-        print(f"Change map saved to: {change_map_path}")
+        tiles = await run_to_completion(write_analysis_tiles, detector, results) if TILES_ENABLED else None
+        del results['image1'], results['image2']
+    emit("tiles", {"tiles": tiles})
+    
+    print(f"Change detection complete for {region['name']}")
+    print(f"Visualization saved to: {vis_path}")
+    print(f"Change map saved to: {change_map_path}")
+
+
+    # Create a new analysis history record
+    analysis_record = AnalysisHistoryModel(
+        user_id= user_id,  # Using user_id 1 as specified
+        input_type="predefined_region",
+        before_image_year=request.before_image_year,
+        after_image_year=request.after_image_year,
+        cloud_vis_url="",
+        cloud_change_map_url="",
+        analysis={
+            "change_percentages": results['change_percentages'],
+            "critical_changes": critical_changes,
+            "roi": roi,
+            "tiles": tiles
+        }
+    )
+    
+    # Upload the images while the record is inserted into MongoDB
+    analysis_record = await store_analysis(analysis_record, vis_path, change_map_path)
 
+    # Delete local files after upload
+    os.remove(vis_path)
+    os.remove(change_map_path)
+    print("Images removed from server")
 
-        # Upload visualization to Cloudinary
-        cloud_vis_url = upload_to_cloudinary(vis_path)
-        cloud_change_map_url = upload_to_cloudinary(change_map_path)
-        print("Images uploaded to Cloudinary")
+    # Return proper response
+    return {
+        "message": "Analysis started successfully",
+        "analysis": analysis_record
+    }
 
-        # Delete local files after upload
-        os.remove(vis_path)
-        os.remove(change_map_path)
-        print("Images removed from server")
 
-        # Create a new analysis history record
-        analysis_record = AnalysisHistoryModel(
-            user_id= user_id,  # Using user_id 1 as specified
-            input_type="predefined_region",
-            before_image_year=request.before_image_year,
-            after_image_year=request.after_image_year,
-            cloud_vis_url=cloud_vis_url,
-            cloud_change_map_url=cloud_change_map_url,
-            analysis={
-                "change_percentages": results['change_percentages'],
-                "critical_changes": critical_changes
-            }
-        )
-        
-        # Insert the record into MongoDB
-        analysis_collection.insert_one(analysis_record.model_dump())
-
-        # Return proper response
-        return {
-            "message": "Analysis started successfully",
-            "analysis": analysis_record
-        }
+@app.post("/analysis/predefined_region/{user_id}")
+async def analyze_predefined_region(request: PredefinedRegionRequest, user_id: str):
+    try:
+        return await run_predefined_analysis(request, user_id)
     
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/analysis/predefined_region/{user_id}/stream")
+async def stream_predefined_region(request: PredefinedRegionRequest, user_id: str):
+    return stream_analysis(lambda emit: run_predefined_analysis(request, user_id, emit))
     
     
 
 # ✅ Route: Analyze User Uploaded Region
-@app.post("/analysis/user_uploaded_region/{user_id}")
-async def analyze_user_uploaded_region(
-    user_id: str,
-    before_image: UploadFile = File(...),
-    after_image: UploadFile = File(...),
-    before_image_year: int = Form(...),
-    after_image_year: int = Form(...)
-):
+def save_uploaded_images(user_id, before_image, after_image):
+    """
+    Save the uploaded image pair to the temp directory and return both paths.
+    """
+    # Create temporary directory for uploaded files if it doesn't exist
+    temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
+    os.makedirs(temp_dir, exist_ok=True)
+    
+    # Save uploaded files to temporary location
+    # The random suffix keeps concurrent uploads of one user apart
+    timestamp = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    before_image_path = os.path.join(temp_dir, f"before_{user_id}_{timestamp}.jpg")
+    after_image_path = os.path.join(temp_dir, f"after_{user_id}_{timestamp}.jpg")
+    
+    with open(before_image_path, "wb") as f:
+        f.write(before_image.file.read())
+    
+    with open(after_image_path, "wb") as f:
+        f.write(after_image.file.read())
+    
+    return before_image_path, after_image_path
+
+
+async def run_uploaded_analysis(user_id, before_image_path, after_image_path, before_image_year,
+                                after_image_year, source_gsd=None, model_variant=None, roi=None,
+                                emit=None):
+    """
+    Analyze a saved upload pair, reporting stage events through emit(event, data).
+    The uploaded and rendered files are removed afterwards, also on errors.
+    """
+    emit = emit or (lambda event, data=None: None)
+    temp_files = [before_image_path, after_image_path]
+    
     try:
-        # Create temporary directory for uploaded files if it doesn't exist
-        temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # Save uploaded files to temporary location
-        before_image_path = os.path.join(temp_dir, f"before_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg")
-        after_image_path = os.path.join(temp_dir, f"after_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg")
-        
-        with open(before_image_path, "wb") as f:
-            f.write(before_image.file.read())
-        
-        with open(after_image_path, "wb") as f:
-            f.write(after_image.file.read())
-        
-        # Initialize the change detector
-        model_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', 'change_detection.keras')
-        
-        # Check if model file exists
-        if not os.path.exists(model_path):
-            raise HTTPException(status_code=404, detail=f"Model file not found at: {model_path}")
-            
-        detector = HighResolutionChangeDetector(model_path)
-        
-        # Detect changes between the images
-        print(f"Detecting changes for user uploaded images")
-        results = detector.detect_changes(
-            before_image_path,
-            after_image_path,
-            window_size=(64, 64),
-            stride=32
-        )
+        # Initialize the change detector; the first analysis loads the model,
+        # which must not block the event loop
+        detector = await run_in_threadpool(create_detector, model_variant)
         
         # Create img directory if it doesn't exist
         img_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'img')
         os.makedirs(img_dir, exist_ok=True)
         
-        # Generate visualization
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
         output_path = os.path.join(img_dir, f"user_{user_id}_{timestamp}.jpg")
         
-        vis_path, change_map_path, critical_changes = detector.generate_change_visualization(results, output_path)
+        # Wait for memory budget, then detect changes and generate the visualization
+        cost = await run_in_threadpool(
+            estimate_analysis_bytes, [before_image_path, after_image_path], (64, 64), 32,
+            scale=detector.resolve_scale(source_gsd=source_gsd)
+        )
+        async with admission.admit(cost, label=f"user_uploaded:{user_id}"):
+            emit("admitted")
+            
+            print(f"Detecting changes for user uploaded images")
+            # High-resolution uploads are downsampled to the model's ground sample distance
+            results = await run_to_completion(
+                detector.detect_changes,
+                before_image_path,
+                after_image_path,
+                window_size=(64, 64),
+                stride=32,
+                source_gsd=source_gsd,
+                progress=lambda event: emit(event["event"], event),
+                roi=roi
+            )
+            emit("statistics", analysis_statistics(detector, results))
+            
+            vis_path, change_map_path, critical_changes = await run_to_completion(
+                detector.generate_change_visualization, results, output_path
+            )
+            temp_files += [vis_path, change_map_path]
+            emit("rendered", {"critical_changes": critical_changes})
+            
+            tiles = await run_to_completion(write_analysis_tiles, detector, results) if TILES_ENABLED else None
+            del results['image1'], results['image2']
+        emit("tiles", {"tiles": tiles})
         
         print("Change detection complete for user uploaded images")
         print(f"Visualization saved to: {vis_path}")
         print(f"Change map saved to: {change_map_path}")
 
-        # Upload visualization to Cloudinary
-        cloud_vis_url = upload_to_cloudinary(vis_path)
-        cloud_change_map_url = upload_to_cloudinary(change_map_path)
-        print("Images uploaded to Cloudinary")
-
         # Create a new analysis history record
         analysis_record = AnalysisHistoryModel(
             user_id=user_id,
             input_type="user_uploaded",
             before_image_year=before_image_year,
             after_image_year=after_image_year,
-            cloud_vis_url=cloud_vis_url,
-            cloud_change_map_url=cloud_change_map_url,
+            cloud_vis_url="",
+            cloud_change_map_url="",
             analysis={
                 "change_percentages": results['change_percentages'],
-                "critical_changes": critical_changes
+                "critical_changes": critical_changes,
+                "roi": roi,
+                "tiles": tiles
             }
         )
         
-        # Insert the record into MongoDB
-        analysis_collection.insert_one(analysis_record.model_dump())
+        # Upload the images while the record is inserted into MongoDB
+        analysis_record = await store_analysis(analysis_record, vis_path, change_map_path)
         
+        return {
+            "message": "Analysis completed successfully",
+            "analysis": analysis_record
+        }
+    
+    finally:
         # Clean up temporary files
-        for file_path in [before_image_path, after_image_path, vis_path, change_map_path]:
+        for file_path in temp_files:
             if os.path.exists(file_path):
                 os.remove(file_path)
         print("Temporary files cleaned up")
-        
-        return {
-            "message": "Analysis completed successfully",
-            "analysis": analysis_collection
-        }
+
+
+@app.post("/analysis/user_uploaded_region/{user_id}")
+async def analyze_user_uploaded_region(
+    user_id: str,
+    before_image: UploadFile = File(...),
+    after_image: UploadFile = File(...),
+    before_image_year: int = Form(...),
+    after_image_year: int = Form(...),
+    source_gsd: Optional[float] = Form(None),
+    model_variant: Optional[str] = Form(None),
+    roi: Optional[str] = Form(None)
+):
+    try:
+        roi = parse_roi(roi)
+        before_image_path, after_image_path = save_uploaded_images(user_id, before_image, after_image)
+        return await run_uploaded_analysis(
+            user_id, before_image_path, after_image_path, before_image_year, after_image_year,
+            source_gsd=source_gsd, model_variant=model_variant, roi=roi
+        )
     
+    except HTTPException as he:
+        raise he
     except Exception as e:
-        # Clean up any temporary files in case of error
-        temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
-        if os.path.exists(temp_dir):
-            for filename in os.listdir(temp_dir):
-                if filename.startswith(f"before_{user_id}_") or filename.startswith(f"after_{user_id}_"):
-                    os.remove(os.path.join(temp_dir, filename))
-        
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/analysis/user_uploaded_region/{user_id}/stream")
+async def stream_user_uploaded_region(
+    user_id: str,
+    before_image: UploadFile = File(...),
+    after_image: UploadFile = File(...),
+    before_image_year: int = Form(...),
+    after_image_year: int = Form(...),
+    source_gsd: Optional[float] = Form(None),
+    model_variant: Optional[str] = Form(None),
+    roi: Optional[str] = Form(None)
+):
+    # The uploads are saved before streaming starts; the request body is gone afterwards
+    roi = parse_roi(roi)
+    before_image_path, after_image_path = save_uploaded_images(user_id, before_image, after_image)
+    return stream_analysis(lambda emit: run_uploaded_analysis(
+        user_id, before_image_path, after_image_path, before_image_year, after_image_year,
+        source_gsd=source_gsd, model_variant=model_variant, roi=roi, emit=emit
+    ))
     
 
 # ✅ Route: Fetch User Analysis History
@@ -385,7 +800,7 @@ async def analyze_user_uploaded_region(
 async def get_user_history(user_id: str):
     try:
         # Find all analysis records for the given user_id
-        history_records = list(analysis_collection.find({"user_id": user_id}))
+        history_records = await database.history.list_for_user(user_id)
         
         # Format the results to match the response model
         formatted_records = []
@@ -0,0 +1,220 @@
+import os
+import asyncio
+from fastapi.concurrency import run_in_threadpool
+from change_detection import GridMap
+from admission import estimate_analysis_bytes, run_to_completion
+
+
+class RegionPrecomputer:
+    """
+    Background classification of the yearly images of predefined regions
+
+    Each ``images/<folder>/<year>.jpg`` is classified once into a GridMap and
+    stored as ``<cache_dir>/<folder>/<year>_<model key>_w<size>_s<stride>.npz``,
+    so a predefined-region analysis only has to diff and render. The model
+    key changes whenever the model or the inference settings change, which
+    makes stale maps miss the cache instead of being reused.
+
+    Regions are queued when they are registered and by a periodic sweep; their
+    ``precompute_status`` is pending, running, complete, empty (no yearly
+    images to classify) or failed. Detectors are created in the threadpool,
+    since loading a model would otherwise block the event loop.
+    """
+    def __init__(self, images_dir, cache_dir, regions, create_detector, model_key,
+                 admission=None, window_size=(64, 64), stride=32, sweep_interval=3600):
+        """
+        Args:
+            images_dir (str): Directory with one folder of yearly images per region
+            cache_dir (str): Directory for the stored grid maps
+            regions: Region repository with async list/update
+            create_detector (callable): Returns a detector for the default model
+            model_key (callable): Maps a model variant (None for the default)
+                to a string identifying the model and inference settings
+            admission (AdmissionController): Memory budget shared with the
+                analysis endpoints, or None
+            window_size (tuple): Size of sliding window
+            stride (int): Step size for sliding window
+            sweep_interval (float): Seconds between sweeps over all regions
+        """
+        self.images_dir = images_dir
+        self.cache_dir = cache_dir
+        self.regions = regions
+        self.create_detector = create_detector
+        self.model_key = model_key
+        self.admission = admission
+        self.window_size = window_size
+        self.stride = stride
+        self.sweep_interval = sweep_interval
+        self._queue = asyncio.Queue()
+        self._queued = set()
+        self._tasks = []
+
+    def year_images(self, folder):
+        """
+        Returns:
+            dict: Year to image path for every <year>.jpg of a region folder
+        """
+        region_dir = os.path.join(self.images_dir, folder)
+        if not os.path.isdir(region_dir):
+            return {}
+        years = {}
+        for filename in os.listdir(region_dir):
+            stem, extension = os.path.splitext(filename)
+            if extension.lower() == '.jpg' and stem.isdigit():
+                years[int(stem)] = os.path.join(region_dir, filename)
+        return years
+
+    def map_path(self, folder, year, key):
+        name = f"{year}_{key}_w{self.window_size[0]}x{self.window_size[1]}_s{self.stride}.npz"
+        return os.path.join(self.cache_dir, folder, name)
+
+    def load_map(self, folder, year, variant=None):
+        """
+        Returns:
+            GridMap: The stored map for the current model, or None
+        """
+        path = self.map_path(folder, year, self.model_key(variant))
+        return GridMap.load(path) if os.path.exists(path) else None
+
+    def store_map(self, folder, year, label_map, variant=None):
+        """
+        Store a map atomically, so readers never see a partial file
+        """
+        path = self.map_path(folder, year, self.model_key(variant))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            label_map.save(f)
+        os.replace(temp_path, path)
+
+    def missing_years(self, folder):
+        """
+        Returns:
+            list: Years of a region without a stored map for the current model
+        """
+        key = self.model_key(None)
+        return sorted(year for year in self.year_images(folder)
+                      if not os.path.exists(self.map_path(folder, year, key)))
+
+    async def get_or_compute_map(self, folder, year, image_path, get_detector, variant=None,
+                                 progress=None, stage='image'):
+        """
+        Load a stored map, or classify the image now and store the result
+
+        Args:
+            get_detector (callable): Returns the detector to classify with; only
+                called on a cache miss, so stored maps never load the model
+            progress (callable): Receives the detector's progress events
+            stage (str): Stage name put into the progress events
+
+        Returns:
+            GridMap: Map of the region's image for that year
+        """
+        label_map = await run_in_threadpool(self.load_map, folder, year, variant)
+        if label_map is not None:
+            if progress is not None:
+                progress({'event': 'image_classified', 'stage': stage, 'report': {'mode': 'precomputed'}})
+            return label_map
+
+        detector = await run_in_threadpool(get_detector)
+        # Called within an admission reservation, which must outlive the thread
+        label_map = await run_to_completion(
+            detector.predict_label_map, image_path, self.window_size, self.stride,
+            progress=progress, stage=stage
+        )
+        await run_to_completion(self.store_map, folder, year, label_map, variant)
+        return label_map
+
+    async def enqueue(self, region_id, folder):
+        """
+        Queue a region for background classification unless it is queued already
+        """
+        if region_id in self._queued:
+            return
+        self._queued.add(region_id)
+        await self.regions.update(region_id, {"precompute_status": "pending"})
+        await self._queue.put((region_id, folder))
+
+    async def _precompute(self, region_id, folder):
+        await self.regions.update(region_id, {"precompute_status": "running"})
+        images = self.year_images(folder)
+        missing = self.missing_years(folder)
+        detector = await run_in_threadpool(self.create_detector) if missing else None
+
+        for year in missing:
+            print(f"Precomputing {folder}/{year}")
+            if self.admission is not None:
+                # Reads the image header, so off the event loop; background work
+                # waits for budget instead of being rejected like a client request
+                cost = await run_in_threadpool(estimate_analysis_bytes, [images[year]], self.window_size, self.stride)
+                async with self.admission.admit(cost, label=f"precompute:{folder}/{year}", background=True):
+                    label_map = await run_to_completion(
+                        detector.predict_label_map, images[year], self.window_size, self.stride
+                    )
+            else:
+                label_map = await run_in_threadpool(
+                    detector.predict_label_map, images[year], self.window_size, self.stride
+                )
+            await run_in_threadpool(self.store_map, folder, year, label_map)
+
+        await self._mark_done(region_id, images)
+
+    async def _mark_done(self, region_id, images):
+        """
+        Record a region whose images all have a stored map; a region without
+        any images is marked empty rather than complete
+        """
+        await self.regions.update(region_id, {
+            "precompute_status": "complete" if images else "empty",
+            "precomputed_years": sorted(images),
+            "precompute_model": self.model_key(None)
+        })
+
+    async def _worker(self):
+        while True:
+            region_id, folder = await self._queue.get()
+            try:
+                await self._precompute(region_id, folder)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Precomputing region {folder} failed: {e}")
+                await self.regions.update(region_id, {"precompute_status": "failed"})
+            finally:
+                self._queued.discard(region_id)
+                self._queue.task_done()
+
+    async def sweep(self):
+        """
+        Queue every region that lacks a map for the current model
+        """
+        for region in await self.regions.list():
+            if self.missing_years(region["folder"]):
+                await self.enqueue(region["_id"], region["folder"])
+                continue
+            images = self.year_images(region["folder"])
+            if region.get("precompute_status") != ("complete" if images else "empty"):
+                await self._mark_done(region["_id"], images)
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Region sweep failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self, workers=1):
+        """
+        Start the background workers and the periodic sweep
+        """
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
+        self._tasks.append(asyncio.create_task(self._sweep_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,223 @@
+import itertools
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+
+def _object_id(document_id):
+    """
+    Convert a string ID to an ObjectId, or None if it isn't a valid one
+    """
+    try:
+        return ObjectId(document_id)
+    except (InvalidId, TypeError):
+        return None
+
+
+def _with_string_id(document):
+    if document is not None:
+        document["_id"] = str(document["_id"])
+    return document
+
+
+class RegionRepository:
+    """
+    Available regions stored in MongoDB
+    """
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def list(self):
+        return [_with_string_id(region) async for region in self.collection.find()]
+
+    async def get(self, region_id):
+        object_id = _object_id(region_id)
+        if object_id is None:
+            return None
+        return _with_string_id(await self.collection.find_one({"_id": object_id}))
+
+    async def find_by_name(self, name):
+        return _with_string_id(await self.collection.find_one({"name": name}))
+
+    async def insert(self, document):
+        result = await self.collection.insert_one(document)
+        return str(result.inserted_id)
+
+    async def update(self, region_id, fields):
+        await self.collection.update_one({"_id": _object_id(region_id)}, {"$set": fields})
+
+
+class HistoryRepository:
+    """
+    Analysis history records stored in MongoDB
+    """
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, document):
+        result = await self.collection.insert_one(document)
+        return str(result.inserted_id)
+
+    async def complete_upload(self, record_id, urls):
+        """
+        Fill in the artifact URLs of a record and clear its upload_pending flag
+        """
+        await self.collection.update_one(
+            {"_id": _object_id(record_id)},
+            {"$set": urls, "$unset": {"upload_pending": ""}}
+        )
+
+    async def delete(self, record_id):
+        await self.collection.delete_one({"_id": _object_id(record_id)})
+
+    async def list_for_user(self, user_id):
+        """
+        Records of a user, leaving out those whose images are still uploading
+        """
+        cursor = self.collection.find({"user_id": user_id, "upload_pending": {"$ne": True}})
+        return [_with_string_id(record) async for record in cursor]
+
+
+class ArtifactIndexRepository:
+    """
+    Content hash to artifact URL entries stored in MongoDB
+    """
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, digest):
+        entry = await self.collection.find_one({"_id": digest})
+        return entry["url"] if entry else None
+
+    async def put(self, digest, url):
+        await self.collection.update_one({"_id": digest}, {"$set": {"url": url}}, upsert=True)
+
+
+class InMemoryRegionRepository:
+    """
+    In-process stand-in for RegionRepository, for tests and benchmarks
+    """
+    def __init__(self, regions=()):
+        self.regions = {}
+        for region in regions:
+            self.regions[str(ObjectId())] = dict(region)
+
+    async def list(self):
+        return [dict(region, _id=region_id) for region_id, region in self.regions.items()]
+
+    async def get(self, region_id):
+        region = self.regions.get(region_id)
+        return dict(region, _id=region_id) if region is not None else None
+
+    async def find_by_name(self, name):
+        for region_id, region in self.regions.items():
+            if region["name"] == name:
+                return dict(region, _id=region_id)
+        return None
+
+    async def insert(self, document):
+        region_id = str(ObjectId())
+        self.regions[region_id] = dict(document)
+        return region_id
+
+    async def update(self, region_id, fields):
+        self.regions[region_id].update(fields)
+
+
+class InMemoryHistoryRepository:
+    """
+    In-process stand-in for HistoryRepository, for tests and benchmarks
+    """
+    def __init__(self):
+        self.records = {}
+        self._ids = itertools.count(1)
+
+    async def insert(self, document):
+        record_id = str(next(self._ids))
+        self.records[record_id] = dict(document)
+        return record_id
+
+    async def complete_upload(self, record_id, urls):
+        self.records[record_id].update(urls)
+        self.records[record_id].pop("upload_pending", None)
+
+    async def delete(self, record_id):
+        self.records.pop(record_id, None)
+
+    async def list_for_user(self, user_id):
+        return [
+            dict(record, _id=record_id) for record_id, record in self.records.items()
+            if record["user_id"] == user_id and not record.get("upload_pending")
+        ]
+
+
+class InMemoryArtifactIndexRepository:
+    """
+    In-process stand-in for ArtifactIndexRepository, for tests and benchmarks
+    """
+    def __init__(self):
+        self.entries = {}
+
+    async def get(self, digest):
+        return self.entries.get(digest)
+
+    async def put(self, digest, url):
+        self.entries[digest] = url
+
+
+class Database:
+    """
+    Owns the MongoDB client and exposes the repositories
+
+    The client is created in ``connect`` and closed in ``close``, which the
+    application calls from its startup and shutdown hooks. With
+    ``backend="memory"`` the in-process repositories are used instead.
+    """
+    def __init__(self, url=None, name="land_analysis", backend="mongo",
+                 max_pool_size=100, min_pool_size=0, timeout_ms=5000):
+        """
+        Args:
+            url (str): MongoDB connection string
+            name (str): Database name
+            backend (str): "mongo" or "memory"
+            max_pool_size (int): Maximum number of pooled connections
+            min_pool_size (int): Connections kept open while idle
+            timeout_ms (int): Server selection, connect and socket timeout in ms
+        """
+        self.url = url
+        self.name = name
+        self.backend = backend
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.timeout_ms = timeout_ms
+        self.client = None
+        self.regions = None
+        self.history = None
+        self.artifact_index = None
+
+    async def connect(self):
+        if self.backend == "memory":
+            self.regions = InMemoryRegionRepository()
+            self.history = InMemoryHistoryRepository()
+            self.artifact_index = InMemoryArtifactIndexRepository()
+            return
+
+        # Motor is only needed for the MongoDB backend
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        self.client = AsyncIOMotorClient(
+            self.url,
+            maxPoolSize=self.max_pool_size,
+            minPoolSize=self.min_pool_size,
+            serverSelectionTimeoutMS=self.timeout_ms,
+            connectTimeoutMS=self.timeout_ms,
+            socketTimeoutMS=self.timeout_ms
+        )
+        db = self.client[self.name]
+        self.regions = RegionRepository(db["available_regions"])
+        self.history = HistoryRepository(db["analysis_history"])
+        self.artifact_index = ArtifactIndexRepository(db["artifact_index"])
+
+    async def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
@@ -0,0 +1,211 @@
+import os
+import time
+import random
+import shutil
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import cloudinary
+import cloudinary.uploader
+
+
+class CloudinaryStorage:
+    """
+    Artifact storage on Cloudinary
+
+    The SDK keeps a module-level connection pool, so configuring it once and
+    reusing it for every upload keeps the HTTPS connections alive.
+    """
+    def __init__(self, cloud_name=None, api_key=None, api_secret=None, timeout=30):
+        """
+        Args:
+            cloud_name (str): Cloudinary cloud name, defaults to CLOUDINARY_CLOUD_NAME
+            api_key (str): API key, defaults to CLOUDINARY_API_KEY
+            api_secret (str): API secret, defaults to CLOUDINARY_API_SECRET
+            timeout (float): Seconds before an upload request is abandoned
+        """
+        cloudinary.config(
+            cloud_name=cloud_name or os.getenv("CLOUDINARY_CLOUD_NAME"),
+            api_key=api_key or os.getenv("CLOUDINARY_API_KEY"),
+            api_secret=api_secret or os.getenv("CLOUDINARY_API_SECRET"),
+            secure=True
+        )
+        self.timeout = timeout
+
+    def upload(self, image_path, folder="land_analysis", name=None):
+        """
+        Upload an image and return its URL
+
+        Args:
+            image_path (str): Path to the image file
+            folder (str): Cloudinary folder to upload to
+            name (str): Public ID to store it under; an existing image with
+                that ID is kept. Defaults to a random ID.
+
+        Returns:
+            str: URL of the uploaded image
+        """
+        options = {"public_id": name, "overwrite": False} if name else {}
+        upload_result = cloudinary.uploader.upload(
+            image_path,
+            folder=folder,
+            resource_type="image",
+            timeout=self.timeout,
+            **options
+        )
+        return upload_result["secure_url"]
+
+
+class LocalStorage:
+    """
+    Artifact storage in a local directory
+
+    Stands in for Cloudinary in development, tests and benchmarks. The
+    optional latency imitates the round trip of a remote service.
+    """
+    def __init__(self, root, base_url, latency=0.0):
+        """
+        Args:
+            root (str): Directory the artifacts are copied to
+            base_url (str): URL under which ``root`` is served
+            latency (float): Seconds added to every upload
+        """
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        self.latency = latency
+        os.makedirs(root, exist_ok=True)
+
+    def upload(self, image_path, folder="land_analysis", name=None):
+        """
+        Copy an image into the storage directory and return its URL
+
+        Args:
+            image_path (str): Path to the image file
+            folder (str): Sub-directory to store it in
+            name (str): File name without extension, defaults to the source name
+
+        Returns:
+            str: URL of the stored image
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        target_dir = os.path.join(self.root, folder)
+        os.makedirs(target_dir, exist_ok=True)
+        file_name = os.path.basename(image_path)
+        if name:
+            file_name = name + os.path.splitext(file_name)[1]
+        shutil.copyfile(image_path, os.path.join(target_dir, file_name))
+        return f"{self.base_url}/{folder}/{file_name}"
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    SHA-256 hex digest of a file's contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactIndex:
+    """
+    Lookup table from content hash to the URL of the stored artifact
+
+    Entries are cached in memory and, when a repository is given, persisted
+    in it so they survive restarts and are shared between processes.
+    """
+    def __init__(self, repository=None):
+        """
+        Args:
+            repository: Optional store with async ``get(digest)`` and
+                ``put(digest, url)``, e.g. repositories.ArtifactIndexRepository
+        """
+        self.repository = repository
+        self._cache = {}
+
+    async def get(self, digest):
+        url = self._cache.get(digest)
+        if url is None and self.repository is not None:
+            url = await self.repository.get(digest)
+            if url is not None:
+                self._cache[digest] = url
+        return url
+
+    async def put(self, digest, url):
+        self._cache[digest] = url
+        if self.repository is not None:
+            await self.repository.put(digest, url)
+
+
+class ArtifactUploader:
+    """
+    Concurrent, retrying uploads to an artifact storage backend
+
+    Uploads run on a shared thread pool, so the artifacts of one analysis go
+    up in parallel while the caller carries on, e.g. with the database write.
+    Artifacts are stored under their content hash: content that was stored
+    before is looked up in the index and never transferred again.
+    """
+    def __init__(self, storage, max_workers=4, retries=3, backoff=0.5, index=None):
+        """
+        Args:
+            storage: Backend with an ``upload(image_path, folder, name)`` method
+            max_workers (int): Number of uploads in flight at once
+            retries (int): Attempts after the first failed one
+            backoff (float): Delay before the first retry, doubled on each
+                further retry and jittered by up to 50%
+            index (ArtifactIndex): Hash to URL table, defaults to an in-memory one
+        """
+        self.storage = storage
+        self.index = index if index is not None else ArtifactIndex()
+        self.stats = {"uploaded": 0, "reused": 0}
+        self.retries = retries
+        self.backoff = backoff
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload")
+
+    async def _store(self, image_path, folder):
+        loop = asyncio.get_running_loop()
+        digest = await loop.run_in_executor(self.executor, file_digest, image_path)
+        url = await self.index.get(digest)
+        if url is not None:
+            self.stats["reused"] += 1
+            return url
+
+        url = await loop.run_in_executor(self.executor, self._upload_with_retry, image_path, folder, digest)
+        await self.index.put(digest, url)
+        self.stats["uploaded"] += 1
+        return url
+
+    def _upload_with_retry(self, image_path, folder, name):
+        for attempt in range(self.retries + 1):
+            try:
+                return self.storage.upload(image_path, folder, name)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt * (1 + random.random() / 2)
+                print(f"Upload of {image_path} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def submit(self, image_path, folder="land_analysis"):
+        """
+        Start an upload in the background
+
+        Returns:
+            asyncio.Future: Resolves to the URL of the uploaded image
+        """
+        return asyncio.ensure_future(self._store(image_path, folder))
+
+    async def upload_all(self, image_paths, folder="land_analysis"):
+        """
+        Upload several images in parallel
+
+        Returns:
+            list: URLs in the order of ``image_paths``
+        """
+        return list(await asyncio.gather(*(self.submit(path, folder) for path in image_paths)))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
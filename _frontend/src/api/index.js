@@ -52,6 +52,29 @@ export const analyzeUserUploadedRegion = async(analysisData, userId) => {
     }
 }
 
+// Tiles API
+// `tilesPath` is the `analysis.tiles` value of an analysis record, e.g. "/tiles/<hash>"
+export const getTileMetadata = async(tilesPath) => {
+    try {
+        const response = await api.get(`${tilesPath}/tiles.json`)
+        return response.data
+    } catch (error) {
+        console.error("Error fetching tile metadata:", error)
+        throw error
+    }
+}
+
+// XYZ URL template of one layer ("before", "after", "classes_before", "classes_after" or "changes"),
+// for map libraries that load only the visible tiles
+export const getTileUrlTemplate = (tilesPath, layer, format = "webp") => {
+    return `${API_URL}${tilesPath}/${layer}/{z}/{x}/{y}.${format}`
+}
+
+// URL of a single tile, e.g. the zoom 0 tile as a thumbnail
+export const getTileUrl = (tilesPath, layer, z, x, y, format = "webp") => {
+    return `${API_URL}${tilesPath}/${layer}/${z}/${x}/${y}.${format}`
+}
+
 // History API
 export const getUserHistory = async(userId) => {
     try {
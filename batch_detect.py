@@ -0,0 +1,291 @@
+import os
+import csv
+import json
+import time
+import argparse
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+RESULT_FILE = 'result.json'
+
+# Detector of the current worker process, created once by _init_worker
+_detector = None
+_options = None
+
+def read_manifest(manifest_path, images_dir='./images'):
+    """
+    Read the region/year pairs to analyze
+    
+    The manifest is a CSV file with a header, or a JSON list of objects, with
+    the fields ``region``, ``before_year`` and ``after_year``. Images default to
+    ``<images_dir>/<region>/<year>.jpg``; ``before_image`` and ``after_image``
+    override the paths. An optional ``roi`` holds a JSON bounding box or polygon.
+    
+    Args:
+        manifest_path (str): Path to the .csv or .json manifest
+        images_dir (str): Directory with one folder of yearly images per region
+    
+    Returns:
+        list: One dict per pair with id, region, years, image paths and roi
+    """
+    if manifest_path.endswith('.json'):
+        with open(manifest_path) as f:
+            rows = json.load(f)
+    else:
+        with open(manifest_path, newline='') as f:
+            rows = list(csv.DictReader(f))
+    
+    pairs = []
+    for row in rows:
+        region = str(row['region'])
+        before_year, after_year = int(row['before_year']), int(row['after_year'])
+        roi = row.get('roi') or None
+        if isinstance(roi, str):
+            roi = json.loads(roi)
+        
+        pairs.append({
+            'id': f"{region}_{before_year}_{after_year}",
+            'region': region,
+            'before_year': before_year,
+            'after_year': after_year,
+            'before_image': row.get('before_image') or os.path.join(images_dir, region, f"{before_year}.jpg"),
+            'after_image': row.get('after_image') or os.path.join(images_dir, region, f"{after_year}.jpg"),
+            'roi': roi
+        })
+    
+    ids = [pair['id'] for pair in pairs]
+    duplicates = sorted({pair_id for pair_id in ids if ids.count(pair_id) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate pairs in manifest: {', '.join(duplicates)}")
+    return pairs
+
+def _init_worker(model_path, options, threads):
+    """
+    Load TensorFlow and the model once per worker process
+    """
+    global _detector, _options
+    import tensorflow as tf
+    from change_detection import HighResolutionChangeDetector
+    
+    if threads:
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except RuntimeError:
+            # Already initialized, e.g. when running in the main process
+            pass
+    
+    _detector = HighResolutionChangeDetector(model_path)
+    _options = options
+
+def _write_json(path, data):
+    """
+    Write JSON atomically, so a crash never leaves a partial file behind
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, path)
+
+def run_pair(pair, output_dir):
+    """
+    Analyze one pair with the worker's detector and store its results
+    
+    Args:
+        pair (dict): Pair from read_manifest
+        output_dir (str): Batch output directory
+    
+    Returns:
+        dict: The stored result, with status 'complete' or 'failed'
+    """
+    pair_dir = os.path.join(output_dir, pair['id'])
+    os.makedirs(pair_dir, exist_ok=True)
+    start = time.perf_counter()
+    
+    try:
+        for path in (pair['before_image'], pair['after_image']):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Image not found: {path}")
+        
+        results = _detector.detect_changes(
+            pair['before_image'],
+            pair['after_image'],
+            window_size=_options['window_size'],
+            stride=_options['stride'],
+            adaptive=_options['adaptive'],
+            skip_unchanged=_options['skip_unchanged'],
+            source_gsd=_options['source_gsd'],
+            roi=pair['roi']
+        )
+        
+        critical_changes = None
+        if _options['render']:
+            output_path = os.path.join(pair_dir, 'change_detection.jpg')
+            _, _, critical_changes = _detector.generate_change_visualization(results, output_path)
+            critical_changes = {name: float(value) for name, value in critical_changes.items()}
+        
+        result = dict(pair, status='complete', seconds=round(time.perf_counter() - start, 2))
+        result.update({
+            'change_percentages': [
+                {key: value if key == 'class' else float(value) for key, value in change.items()}
+                for change in results['change_percentages']
+            ],
+            'critical_changes': critical_changes,
+            'transition_matrix': results['transition_matrix'].tolist(),
+            'no_data_fraction1': results['no_data_fraction1'],
+            'no_data_fraction2': results['no_data_fraction2'],
+            'inference_report': results['inference_report']
+        })
+        # Completed pairs are recognized by this file when resuming
+        _write_json(os.path.join(pair_dir, RESULT_FILE), result)
+        return result
+    
+    except Exception as e:
+        traceback.print_exc()
+        return dict(pair, status='failed', seconds=round(time.perf_counter() - start, 2), error=str(e))
+
+def load_completed(output_dir, pairs):
+    """
+    Results of the pairs that completed in an earlier run
+    
+    Returns:
+        dict: Pair ID to stored result
+    """
+    completed = {}
+    for pair in pairs:
+        path = os.path.join(output_dir, pair['id'], RESULT_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                completed[pair['id']] = json.load(f)
+    return completed
+
+def write_summary(output_dir, pairs, results):
+    """
+    Write summary.json and summary.csv with one entry per manifest pair
+    
+    Args:
+        output_dir (str): Batch output directory
+        pairs (list): Pairs in manifest order
+        results (dict): Pair ID to result, for the pairs that have one
+    """
+    summary = [results.get(pair['id'], dict(pair, status='pending')) for pair in pairs]
+    _write_json(os.path.join(output_dir, 'summary.json'), summary)
+    
+    classes = []
+    for result in summary:
+        for change in result.get('change_percentages', []):
+            if change['class'] not in classes:
+                classes.append(change['class'])
+    
+    fields = ['id', 'region', 'before_year', 'after_year', 'status', 'seconds',
+              'deforestation', 'urbanization', 'water_changes', 'error']
+    fields += [f"{name}_change" for name in classes]
+    
+    with open(os.path.join(output_dir, 'summary.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for result in summary:
+            row = dict(result)
+            row.update(result.get('critical_changes') or {})
+            for change in result.get('change_percentages', []):
+                row[f"{change['class']}_change"] = change['change']
+            writer.writerow(row)
+
+def run_batch(pairs, output_dir, model_path, options, workers=1, resume=True):
+    """
+    Run change detection for every pair, skipping completed ones when resuming
+    
+    Args:
+        pairs (list): Pairs from read_manifest
+        output_dir (str): Directory for per-pair results and the summary
+        model_path (str): Path to the trained model
+        options (dict): detect_changes settings (window_size, stride, adaptive,
+            skip_unchanged, source_gsd) and render
+        workers (int): Worker processes; each loads the model once
+        resume (bool): Skip pairs that already have a stored result
+    
+    Returns:
+        dict: Pair ID to result for every pair that ran or was completed before
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = load_completed(output_dir, pairs) if resume else {}
+    todo = [pair for pair in pairs if pair['id'] not in results]
+    print(f"{len(pairs)} pairs, {len(pairs) - len(todo)} already complete, {len(todo)} to run")
+    
+    if not todo:
+        write_summary(output_dir, pairs, results)
+        return results
+    
+    # Share the cores between the workers instead of oversubscribing them
+    threads = max((os.cpu_count() or 1) // workers, 1) if workers > 1 else None
+    
+    def record(result, done):
+        results[result['id']] = result
+        print(f"[{done}/{len(todo)}] {result['id']}: {result['status']} ({result['seconds']}s)")
+        # Keep the summary current so an interrupted run still leaves one
+        write_summary(output_dir, pairs, results)
+    
+    if workers <= 1:
+        _init_worker(model_path, options, threads)
+        for done, pair in enumerate(todo, 1):
+            record(run_pair(pair, output_dir), done)
+    else:
+        # Spawned workers start without the parent's TensorFlow state
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(model_path, options, threads)) as executor:
+            futures = [executor.submit(run_pair, pair, output_dir) for pair in todo]
+            for done, future in enumerate(as_completed(futures), 1):
+                record(future.result(), done)
+    
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run change detection for a manifest of region/year pairs')
+    parser.add_argument('manifest', help='CSV or JSON list with region, before_year and after_year')
+    parser.add_argument('--output-dir', default='./results/batch')
+    parser.add_argument('--images-dir', default='./images')
+    parser.add_argument('--model-path', default=None,
+                        help="Defaults to the variant's path in ./models")
+    parser.add_argument('--variant', default='baseline', help='Model variant to load')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes, each loading the model once')
+    parser.add_argument('--window-size', type=int, default=64)
+    parser.add_argument('--stride', type=int, default=32)
+    parser.add_argument('--adaptive', action='store_true', help='Use adaptive refinement')
+    parser.add_argument('--skip-unchanged', action='store_true',
+                        help='Only reclassify windows of the second image that changed visually')
+    parser.add_argument('--source-gsd', type=float, default=None,
+                        help='Ground sample distance of the images in m/pixel')
+    parser.add_argument('--no-render', action='store_true', help='Skip the visualizations')
+    parser.add_argument('--no-resume', action='store_true', help='Run completed pairs again')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    
+    model_path = args.model_path
+    if model_path is None:
+        from model_architecture import model_variant_path
+        model_path = model_variant_path(args.variant, './models')
+    if not os.path.exists(model_path):
+        raise SystemExit(f"Model not found at {model_path}. Please run train_model.py first.")
+    
+    options = {
+        'window_size': (args.window_size, args.window_size),
+        'stride': args.stride,
+        'adaptive': args.adaptive,
+        'skip_unchanged': args.skip_unchanged,
+        'source_gsd': args.source_gsd,
+        'render': not args.no_render
+    }
+    pairs = read_manifest(args.manifest, args.images_dir)
+    results = run_batch(pairs, args.output_dir, model_path, options,
+                        workers=args.workers, resume=not args.no_resume)
+    
+    failed = [result['id'] for result in results.values() if result['status'] == 'failed']
+    print(f"Summary written to {os.path.join(args.output_dir, 'summary.csv')}")
+    if failed:
+        print(f"{len(failed)} pairs failed: {', '.join(failed)}")
+        raise SystemExit(1)
@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, '_backend')
+
+# Modules whose presence after an import shows a lazy import was defeated
+HEAVY_MODULES = ['tensorflow', 'keras', 'matplotlib', 'seaborn', 'sklearn', 'splitfolders']
+
+# Entry points and the directory they are imported from
+MODULES = {
+    'change_detection': ROOT,
+    'data_preprocessing': ROOT,
+    'model_architecture': ROOT,
+    'tile_pyramid': ROOT,
+    'test': ROOT,
+    'model_zoo': ROOT,
+    'train_model': ROOT,
+    'batch_detect': ROOT,
+    'main': BACKEND_DIR
+}
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(module, path, repeats=5):
+    """
+    Time a cold import of a module in fresh interpreters
+    
+    Args:
+        module (str): Module name
+        path (str): Directory the module is imported from
+        repeats (int): Number of fresh interpreters
+    
+    Returns:
+        dict: Median and minimum import seconds, median process wall time and
+        the heavy modules the import pulled in
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([path, ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+    # Let the backend import without MongoDB or Cloudinary
+    env.setdefault('DATABASE_BACKEND', 'memory')
+    env.setdefault('STORAGE_BACKEND', 'local')
+    env.setdefault('LOCAL_STORAGE_DIR', tempfile.mkdtemp(prefix='import_time_'))
+    
+    imports, processes, loaded = [], [], []
+    for _ in range(repeats):
+        code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code], cwd=path, env=env,
+                                capture_output=True, text=True)
+        processes.append(time.perf_counter() - start)
+        if output.returncode != 0:
+            return {'module': module, 'error': output.stderr.strip().splitlines()[-1]}
+        
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        imports.append(result['seconds'])
+        loaded = result['loaded']
+    
+    return {
+        'module': module,
+        'import_seconds': round(statistics.median(imports), 3),
+        'import_seconds_min': round(min(imports), 3),
+        'process_seconds': round(statistics.median(processes), 3),
+        'heavy_modules': loaded
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold import time of the entry points')
+    parser.add_argument('--modules', nargs='*', default=list(MODULES), choices=list(MODULES))
+    parser.add_argument('--repeats', type=int, default=5, help='Fresh interpreters per module')
+    parser.add_argument('--output', default=None, help='Also write the results as JSON, e.g. to track them over time')
+    args = parser.parse_args()
+    
+    rows = [measure(module, MODULES[module], args.repeats) for module in args.modules]
+    
+    print(f"{'module':<20} {'import (s)':>10} {'process (s)':>12}  heavy modules loaded")
+    for row in rows:
+        if 'error' in row:
+            print(f"{row['module']:<20} {'failed':>10} {'':>12}  {row['error']}")
+            continue
+        heavy = ', '.join(row['heavy_modules']) or '-'
+        print(f"{row['module']:<20} {row['import_seconds']:>10.3f} {row['process_seconds']:>12.3f}  {heavy}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': rows}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
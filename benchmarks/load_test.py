@@ -0,0 +1,487 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import cv2
+import httpx
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, '_backend')
+
+# Region registered for the predefined-region requests
+REGION_NAME = 'Load test region'
+REGION_FOLDER = 'loadtest'
+YEARS = (2018, 2022)
+# Smallest registered architecture; its weights stay random
+TINY_VARIANT = 'separable_0.25'
+DEFAULT_MIX = 'regions=4,history=4,predefined=1,upload=1'
+
+def build_tiny_model(models_dir, variant=TINY_VARIANT, seed=0):
+    """
+    Save an untrained model of a registered architecture
+    
+    The load test measures the serving path, so only the architecture matters
+    for latency; the random weights just give arbitrary class maps.
+    
+    Args:
+        models_dir (str): Directory the backend loads its models from
+        variant (str): Name registered in MODEL_VARIANTS
+        seed (int): Seed of the weight initialization
+    
+    Returns:
+        str: Path of the saved model
+    """
+    import tensorflow as tf
+    sys.path.insert(0, ROOT)
+    from model_architecture import MODEL_VARIANTS, model_variant_path
+    from change_detection import HighResolutionChangeDetector
+    
+    # One output per class the detector knows
+    num_classes = len(HighResolutionChangeDetector(load_model=False).classes)
+    tf.keras.utils.set_random_seed(seed)
+    model = MODEL_VARIANTS[variant]((64, 64, 3), num_classes)
+    model_path = model_variant_path(variant, models_dir)
+    os.makedirs(models_dir, exist_ok=True)
+    model.save(model_path)
+    return model_path
+
+def synthetic_pair(size, seed=0, changed_fraction=0.2):
+    """
+    Before/after images made of random land-cover-like patches
+    
+    Args:
+        size (int): Edge length in pixels
+        seed (int): Random seed
+        changed_fraction (float): Share of patches that differ in the after image
+    
+    Returns:
+        tuple: JPEG bytes of the before and after image
+    """
+    rng = np.random.default_rng(seed)
+    cells = -(-size // 64)
+    before = rng.integers(0, 256, (cells, cells, 3), dtype=np.uint8)
+    after = before.copy()
+    changed = rng.random((cells, cells)) < changed_fraction
+    after[changed] = rng.integers(0, 256, (int(changed.sum()), 3), dtype=np.uint8)
+    
+    images = []
+    for patches in (before, after):
+        image = cv2.resize(patches, (size, size), interpolation=cv2.INTER_NEAREST).astype(np.float32)
+        image = np.clip(image + rng.normal(0, 8, image.shape), 0, 255).astype(np.uint8)
+        images.append(cv2.imencode('.jpg', image)[1].tobytes())
+    return tuple(images)
+
+def prepare_workspace(work_dir, image_size, models_dir=None, variant=None):
+    """
+    Write the region images and the model, and build the backend environment
+    
+    Returns:
+        tuple: Environment variables for the backend and the upload image pair
+    """
+    before, after = synthetic_pair(image_size)
+    region_dir = os.path.join(work_dir, 'images', REGION_FOLDER)
+    os.makedirs(region_dir, exist_ok=True)
+    for year, data in zip(YEARS, (before, after)):
+        with open(os.path.join(region_dir, f"{year}.jpg"), 'wb') as f:
+            f.write(data)
+    
+    if models_dir is None:
+        models_dir = os.path.join(work_dir, 'models')
+        variant = variant or TINY_VARIANT
+        build_tiny_model(models_dir, variant)
+    
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_BACKEND': 'memory',
+        'STORAGE_BACKEND': 'local',
+        'LOCAL_STORAGE_DIR': os.path.join(work_dir, 'artifacts'),
+        'PRECOMPUTE_CACHE_DIR': os.path.join(work_dir, 'region_maps'),
+        'TILES_DIR': os.path.join(work_dir, 'tiles'),
+        'MODELS_DIR': models_dir,
+        'IMAGES_DIR': os.path.join(work_dir, 'images'),
+        'MODEL_VARIANT': variant or env.get('MODEL_VARIANT', 'baseline')
+    })
+    # The upload pair differs from the region images, so uploads never hit stored artifacts
+    return env, synthetic_pair(image_size, seed=1)
+
+def read_rss_mb(pid):
+    """
+    Current and peak resident set size of a process, from /proc (Linux only)
+    
+    Returns:
+        tuple: (current, peak) in MB, or (None, None) if unavailable
+    """
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    values[key] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return values.get('VmRSS'), values.get('VmHWM')
+
+def parse_mix(mix):
+    """
+    Parse a request mix such as ``regions=4,history=4,predefined=1,upload=1``
+    
+    Returns:
+        dict: Scenario name to relative weight
+    """
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}'. Available: {', '.join(SCENARIOS)}")
+        weights[name] = float(weight or 1)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+async def get_regions(client, context, rng):
+    return await client.get('/available-regions')
+
+async def get_history(client, context, rng):
+    return await client.get(f"/history/{rng.choice(context['users'])}")
+
+async def get_status(client, context, rng):
+    return await client.get('/analysis/status')
+
+async def analyze_predefined(client, context, rng):
+    return await client.post(f"/analysis/predefined_region/{rng.choice(context['users'])}", json={
+        '_id': context['region_id'],
+        'folder': REGION_FOLDER,
+        'before_image_year': YEARS[0],
+        'after_image_year': YEARS[1]
+    })
+
+async def analyze_upload(client, context, rng):
+    before, after = context['upload']
+    return await client.post(
+        f"/analysis/user_uploaded_region/{rng.choice(context['users'])}",
+        files={'before_image': ('before.jpg', before, 'image/jpeg'),
+               'after_image': ('after.jpg', after, 'image/jpeg')},
+        data={'before_image_year': str(YEARS[0]), 'after_image_year': str(YEARS[1])}
+    )
+
+# Request types the mix can be made of
+SCENARIOS = {
+    'regions': get_regions,
+    'history': get_history,
+    'status': get_status,
+    'predefined': analyze_predefined,
+    'upload': analyze_upload
+}
+
+async def setup_region(client, timeout=600):
+    """
+    Register the load test region and wait until its maps are precomputed
+    
+    Returns:
+        str: ID of the region
+    """
+    response = await client.post('/available-regions', json={
+        'name': REGION_NAME, 'folder': REGION_FOLDER, 'sample_url': ''
+    })
+    response.raise_for_status()
+    region_id = response.json()['_id']
+    
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        regions = (await client.get('/available-regions')).json()
+        status = next(region.get('precompute_status') for region in regions if region['_id'] == region_id)
+        if status == 'complete':
+            return region_id
+        if status == 'failed':
+            raise RuntimeError("Precomputing the load test region failed, see the server log")
+        if status == 'empty':
+            raise RuntimeError(f"The load test region folder '{REGION_FOLDER}' has no yearly images")
+        await asyncio.sleep(0.5)
+    raise TimeoutError("The load test region was not precomputed in time")
+
+async def run_load(client, context, mix, concurrency, duration, max_requests=None, seed=0):
+    """
+    Send requests from concurrent clients, each waiting for its previous response
+    
+    Args:
+        client (httpx.AsyncClient): Client for the backend
+        context (dict): Region ID, user IDs and upload images
+        mix (dict): Scenario name to relative weight
+        concurrency (int): Number of concurrent clients
+        duration (float): Seconds to keep sending requests
+        max_requests (int): Stop after this many requests, if set
+        seed (int): Seed of the scenario choice
+    
+    Returns:
+        tuple: Records of (scenario, status, seconds, error detail) and the
+        elapsed seconds
+    """
+    names, weights = list(mix), list(mix.values())
+    records = []
+    issued = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    
+    async def worker(index):
+        nonlocal issued
+        rng = random.Random(seed * 1000 + index)
+        while time.perf_counter() < deadline and (max_requests is None or issued < max_requests):
+            issued += 1
+            name = rng.choices(names, weights)[0]
+            sent = time.perf_counter()
+            try:
+                response = await SCENARIOS[name](client, context, rng)
+                status, detail = response.status_code, response.text if response.status_code >= 400 else None
+            except httpx.HTTPError as e:
+                status, detail = type(e).__name__, str(e)
+            records.append((name, status, time.perf_counter() - sent, detail))
+    
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return records, time.perf_counter() - start
+
+def summarize(records, elapsed):
+    """
+    Latency percentiles, throughput and status counts per scenario and overall
+    """
+    groups = {}
+    for name, *record in records:
+        groups.setdefault(name, []).append(record)
+    groups['all'] = [record for _, *record in records]
+    
+    summary = {}
+    for name, group in groups.items():
+        latencies = np.array([seconds for _, seconds, _ in group]) * 1000
+        statuses = {}
+        for status, _, _ in group:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        details = [detail for _, _, detail in group if detail is not None]
+        
+        summary[name] = {
+            'requests': len(group),
+            'errors': len(details),
+            'throughput': round(len(group) / elapsed, 2),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 1),
+            'p90_ms': round(float(np.percentile(latencies, 90)), 1),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 1),
+            'mean_ms': round(float(latencies.mean()), 1),
+            'max_ms': round(float(latencies.max()), 1),
+            'statuses': statuses,
+            'first_error': details[0][:500] if details else None
+        }
+    return summary
+
+async def sample_rss(pid, samples, interval=0.25):
+    while True:
+        current, _ = read_rss_mb(pid)
+        if current is not None:
+            samples.append(current)
+        await asyncio.sleep(interval)
+
+async def measure(client, pid, args, upload):
+    """
+    Set up the region, warm up every scenario once, then run the timed load
+    
+    Returns:
+        dict: Scenario summaries, elapsed time and RSS of the backend process
+    """
+    mix = parse_mix(args.mix)
+    context = {
+        'region_id': await setup_region(client),
+        'users': [f"loadtest_{index}" for index in range(args.users)],
+        'upload': upload
+    }
+    
+    # The first analysis loads the model; keep that out of the measurement
+    warmup_rng = random.Random(args.seed)
+    for name in mix:
+        response = await SCENARIOS[name](client, context, warmup_rng)
+        if response.status_code >= 400:
+            raise RuntimeError(f"Warm-up request '{name}' failed with {response.status_code}: {response.text}")
+    
+    rss_start, _ = read_rss_mb(pid)
+    samples = []
+    sampler = asyncio.create_task(sample_rss(pid, samples))
+    try:
+        records, elapsed = await run_load(client, context, mix, args.concurrency, args.duration,
+                                          args.requests, args.seed)
+    finally:
+        sampler.cancel()
+    rss_end, rss_peak = read_rss_mb(pid)
+    
+    return {
+        'elapsed_seconds': round(elapsed, 2),
+        'endpoints': summarize(records, elapsed),
+        'rss_mb': {
+            'start': rss_start and round(rss_start, 1),
+            'max_sampled': round(max(samples), 1) if samples else None,
+            'end': rss_end and round(rss_end, 1),
+            'peak': rss_peak and round(rss_peak, 1)
+        }
+    }
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def run_server_process(args, env, upload, work_dir):
+    """
+    Start the backend with uvicorn in a separate process and load it over HTTP
+    """
+    port = free_port()
+    log_path = os.path.join(work_dir, 'server.log')
+    with open(log_path, 'w') as log:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+             '--log-level', 'warning'],
+            cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+    
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout,
+                                     limits=httpx.Limits(max_connections=args.concurrency + 4)) as client:
+            deadline = time.monotonic() + 120
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"The backend exited during startup, see {log_path}")
+                try:
+                    (await client.get('/')).raise_for_status()
+                    break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"The backend did not start, see {log_path}")
+                    await asyncio.sleep(0.2)
+            
+            return await measure(client, server.pid, args, upload)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+async def run_in_process(args, env, upload):
+    """
+    Import the backend into this process and call it without a network hop
+    
+    The client shares the event loop with the app, so this suits quick
+    comparisons and hosts without uvicorn; absolute numbers are pessimistic.
+    """
+    os.environ.update(env)
+    sys.path[:0] = [BACKEND_DIR, ROOT]
+    import main
+    
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app),
+                                     base_url='http://loadtest', timeout=args.timeout) as client:
+            return await measure(client, os.getpid(), args, upload)
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(report, baseline=None):
+    """
+    Print the per-scenario table, with changes relative to a baseline report if given
+    """
+    print(f"{'scenario':<12} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+    for name, row in report['endpoints'].items():
+        print(f"{name:<12} {row['requests']:>8} {row['errors']:>6} {row['throughput']:>8.2f} "
+              f"{row['p50_ms']:>9.1f} {row['p90_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+        if row['first_error'] and name != 'all':
+            print(f"{'':<12} first error: {row['first_error'][:200]}")
+        
+        previous = (baseline or {}).get('endpoints', {}).get(name)
+        if previous:
+            changes = []
+            for key in ('throughput', 'p50_ms', 'p90_ms', 'p99_ms'):
+                if previous[key]:
+                    changes.append(f"{key} {100 * (row[key] - previous[key]) / previous[key]:+.1f}%")
+            print(f"{'':<12} vs {baseline.get('revision') or 'baseline'}: {', '.join(changes)}")
+    
+    rss = report['rss_mb']
+    if rss['peak'] is not None:
+        print(f"Backend RSS: {rss['start']} MB at start, {rss['end']} MB at end, {rss['peak']} MB peak")
+        previous = (baseline or {}).get('rss_mb', {}).get('peak')
+        if previous:
+            print(f"Peak RSS vs baseline: {rss['peak'] - previous:+.1f} MB")
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Load test the backend with in-memory repositories, local storage and a tiny model'
+    )
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f"Scenario weights from {', '.join(SCENARIOS)} (default {DEFAULT_MIX})")
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of load')
+    parser.add_argument('--requests', type=int, default=None, help='Stop after this many requests')
+    parser.add_argument('--users', type=int, default=20, help='Distinct user IDs for analyses and history')
+    parser.add_argument('--image-size', type=int, default=512, help='Edge length of the synthetic images')
+    parser.add_argument('--models-dir', default=None,
+                        help='Use the trained models in this directory instead of a tiny random one')
+    parser.add_argument('--variant', default=None,
+                        help=f"Model variant to serve (default {TINY_VARIANT} for the tiny model)")
+    parser.add_argument('--in-process', action='store_true',
+                        help='Run the app in this process instead of a uvicorn server')
+    parser.add_argument('--timeout', type=float, default=300, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Write the report as JSON')
+    parser.add_argument('--compare', default=None, help='JSON report of an earlier run to compare against')
+    parser.add_argument('--keep', action='store_true', help='Keep the working directory')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    parse_mix(args.mix)
+    work_dir = tempfile.mkdtemp(prefix='load_test_')
+    
+    try:
+        env, upload = prepare_workspace(work_dir, args.image_size, args.models_dir, args.variant)
+        if args.in_process:
+            result = asyncio.run(run_in_process(args, env, upload))
+        else:
+            result = asyncio.run(run_server_process(args, env, upload, work_dir))
+    finally:
+        if args.keep:
+            print(f"Working directory kept at {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    report = {
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'settings': {
+            'mix': parse_mix(args.mix),
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'requests': args.requests,
+            'users': args.users,
+            'image_size': args.image_size,
+            'variant': env['MODEL_VARIANT'],
+            'tiny_model': args.models_dir is None,
+            'in_process': args.in_process
+        },
+        **result
+    }
+    
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
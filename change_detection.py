@@ -1,22 +1,376 @@
 import numpy as np
 import cv2
-import matplotlib.pyplot as plt
-import tensorflow as tf
 import os
-from tensorflow.keras.preprocessing.image import img_to_array
-from matplotlib.colors import LinearSegmentedColormap
 import gc
+import math
 import datetime 
 
+# TensorFlow and matplotlib are imported where they are used, so statistics,
+# tiling and code that only handles stored maps start without them
+
+# Class index and label used for windows that carry no usable image data
+NO_DATA_CLASS = 255
+NO_DATA_LABEL = 'no-data'
+
+# Ground sample distance (m/pixel) of the EuroSAT patches the model was trained on
+EUROSAT_GSD = 10.0
+
+# Reduced-resolution decode flags, largest reduction first
+REDUCED_READ_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+]
+
+# Windows extracted and classified per step. Bounds the float32 window stack
+# (2048 windows of 64x64 are ~100 MB) and sets the progress granularity.
+WINDOW_CHUNK = 2048
+
+# Rows of the pixel change map expanded and cleaned up at a time. Bounds the
+# temporary buffers to (rows + 2 * halo) x width bytes instead of full images.
+CHANGE_MAP_BAND_ROWS = 512
+# The change map is cleaned up with an opening and a closing by a square
+# kernel. Each erosion or dilation reaches kernel // 2 pixels, so a pixel of
+# the result depends on input rows up to 4 * (kernel // 2) away.
+CHANGE_MAP_KERNEL = 5
+CHANGE_MAP_HALO = 4 * (CHANGE_MAP_KERNEL // 2)
+
+# Test-time augmentations applied to a (N, H, W, C) window stack. The first four
+# keep the window shape; the rotations and transposes need square windows.
+TTA_TRANSFORMS = [
+    lambda w: w,                                         # identity
+    lambda w: w[:, :, ::-1],                             # horizontal flip
+    lambda w: w[:, ::-1, :],                             # vertical flip
+    lambda w: w[:, ::-1, ::-1],                          # 180 degree rotation
+    lambda w: np.rot90(w, 1, axes=(1, 2)),               # 90 degree rotation
+    lambda w: np.rot90(w, 3, axes=(1, 2)),               # 270 degree rotation
+    lambda w: np.swapaxes(w, 1, 2),                      # transpose
+    lambda w: np.swapaxes(w, 1, 2)[:, ::-1, ::-1]        # anti-transpose
+]
+
+# Fixed rendering settings so identical results give byte-identical files,
+# which lets the backend deduplicate stored artifacts by content hash
+SAVEFIG_OPTIONS = {
+    'dpi': 300,
+    'bbox_inches': 'tight',
+    'pil_kwargs': {'quality': 75, 'subsampling': '4:2:0', 'progressive': False, 'optimize': False}
+}
+
+# Default thresholds of the inference pre-filter. Means and standard deviations
+# are measured on the grayscale window scaled to [0, 1]. Labels are either a
+# class name or NO_DATA_LABEL; the uniform rule is off until a threshold is set.
+DEFAULT_PREFILTER = {
+    'nodata_value': 0,            # Pixel value (all channels) marking no-data
+    'max_nodata_fraction': 0.5,   # Windows with more no-data pixels are skipped
+    'cloud_min_mean': 0.9,        # Bright and flat windows are treated as cloud
+    'cloud_max_std': 0.04,
+    'cloud_label': NO_DATA_LABEL,
+    'uniform_max_std': None,      # e.g. 0.015 to shortcut calm water bodies
+    'uniform_label': 'SeaLake',
+    'assigned_confidence': 1.0    # Confidence given to class labels set by a rule
+}
+
+def roi_polygon(roi):
+    """
+    Normalize a region of interest to polygon vertices
+    
+    Args:
+        roi: Bounding box (x0, y0, x1, y1) or a list of at least three (x, y)
+            polygon vertices, in pixels of the native image
+            
+    Returns:
+        tuple: (vertices as a float64 (n, 2) array, whether roi was a bounding box)
+    """
+    points = np.asarray(roi, dtype=np.float64)
+    if points.shape == (4,):
+        x0, y0, x1, y1 = points
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError("ROI bounding box must be (x0, y0, x1, y1) with x0 < x1 and y0 < y1")
+        return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]]), True
+    if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+        raise ValueError("ROI must be a bounding box (x0, y0, x1, y1) or a list of (x, y) polygon vertices")
+    return points, False
+
+def unpack_change_mask(packed, width):
+    """
+    Unpack a change mask from expand_change_map(..., packed=True)
+    
+    Args:
+        packed (numpy.ndarray): Bit-packed mask, 8 pixels per byte along rows
+        width (int): Width of the change map in pixels
+        
+    Returns:
+        numpy.ndarray: uint8 change map, 255 where the class changed
+    """
+    mask = np.unpackbits(packed, axis=1, count=width)
+    mask *= 255
+    return mask
+
+class GridMap:
+    """
+    Class and confidence map stored at cell resolution
+    
+    Sliding-window predictions only change on the grid spanned by the window
+    origins and sizes, so a cell of ``gcd(window width, window height, stride)``
+    pixels always carries a single class and confidence. Keeping the maps at that
+    resolution (with confidences quantized to uint8) makes statistics cheap; the
+    pixel maps are only expanded on demand, e.g. for rendering.
+    """
+
+    def __init__(self, classes, confidences, cell_size, image_shape):
+        """
+        Args:
+            classes (numpy.ndarray): Class index per cell (uint8)
+            confidences (numpy.ndarray): Confidence per cell quantized to 0-255 (uint8)
+            cell_size (int): Cell edge length in pixels
+            image_shape (tuple): (height, width) of the image the grid covers
+        """
+        self.classes = classes
+        self.confidences = confidences
+        self.cell_size = cell_size
+        self.image_shape = tuple(image_shape[:2])
+
+    @classmethod
+    def from_windows(cls, image_shape, positions, labels, confidences, window_size, stride):
+        """
+        Build a grid map from per-window predictions
+        
+        Where windows overlap, the prediction with the higher confidence wins,
+        the same rule the pixel maps used.
+        
+        Args:
+            image_shape (tuple): Shape of the image
+            positions (list): (x, y) window origins
+            labels (numpy.ndarray): Predicted class per window
+            confidences (numpy.ndarray): Top-1 confidence per window
+            window_size (tuple): Size of sliding window
+            stride (int): Step size of the sliding window grid
+            
+        Returns:
+            GridMap: Grid map covering the image
+        """
+        cell = math.gcd(math.gcd(window_size[0], window_size[1]), stride)
+        rows = -(-image_shape[0] // cell)
+        cols = -(-image_shape[1] // cell)
+        window_cols, window_rows = window_size[0] // cell, window_size[1] // cell
+        
+        class_grid = np.zeros((rows, cols), dtype=np.uint8)
+        confidence_grid = np.zeros((rows, cols), dtype=np.float32)
+        
+        for (x, y), class_idx, confidence in zip(positions, labels, confidences):
+            col, row = x // cell, y // cell
+            
+            # Only update if the new confidence is higher
+            region_confidence = confidence_grid[row:row + window_rows, col:col + window_cols]
+            update_mask = (region_confidence < confidence) | (region_confidence == 0)
+            
+            region_confidence[update_mask] = confidence
+            class_grid[row:row + window_rows, col:col + window_cols][update_mask] = class_idx
+        
+        return cls(class_grid, cls.quantize(confidence_grid), cell, image_shape)
+
+    @staticmethod
+    def quantize(confidences):
+        """
+        Quantize [0, 1] confidences to uint8
+        """
+        return np.rint(np.clip(confidences, 0, 1) * 255).astype(np.uint8)
+
+    @property
+    def shape(self):
+        return self.classes.shape
+
+    def cell_areas(self):
+        """
+        Pixel area of each cell; cells on the bottom and right edges may be partial
+        
+        Returns:
+            numpy.ndarray: Area per cell (int64)
+        """
+        heights = np.minimum(self.cell_size, self.image_shape[0] - np.arange(self.shape[0]) * self.cell_size)
+        widths = np.minimum(self.cell_size, self.image_shape[1] - np.arange(self.shape[1]) * self.cell_size)
+        return np.outer(heights, widths).astype(np.int64)
+
+    def expand(self, grid):
+        """
+        Expand any array on this grid to pixel resolution
+        
+        Args:
+            grid (numpy.ndarray): Array with the grid's shape
+            
+        Returns:
+            numpy.ndarray: Array with the image's (height, width)
+        """
+        expanded = np.repeat(np.repeat(grid, self.cell_size, axis=0), self.cell_size, axis=1)
+        return expanded[:self.image_shape[0], :self.image_shape[1]]
+
+    def expand_classes(self):
+        """
+        Returns:
+            numpy.ndarray: Pixel class map (uint8)
+        """
+        return self.expand(self.classes)
+
+    def expand_confidences(self):
+        """
+        Returns:
+            numpy.ndarray: Pixel confidence map (float32)
+        """
+        return self.expand(self.confidences).astype(np.float32) / 255.0
+
+    def resample(self, image_shape, cell_size=None):
+        """
+        Nearest-neighbour resample onto the grid of another image size
+        
+        Args:
+            image_shape (tuple): Target image shape
+            cell_size (int): Target cell size, defaults to this grid's
+            
+        Returns:
+            GridMap: Resampled grid map
+        """
+        cell_size = cell_size or self.cell_size
+        rows = -(-image_shape[0] // cell_size)
+        cols = -(-image_shape[1] // cell_size)
+        
+        # Map target cell centres into this grid
+        centre_y = (np.arange(rows) + 0.5) * cell_size * self.image_shape[0] / image_shape[0]
+        centre_x = (np.arange(cols) + 0.5) * cell_size * self.image_shape[1] / image_shape[1]
+        source_rows = np.minimum((centre_y // self.cell_size).astype(int), self.shape[0] - 1)
+        source_cols = np.minimum((centre_x // self.cell_size).astype(int), self.shape[1] - 1)
+        index = np.ix_(source_rows, source_cols)
+        
+        return GridMap(self.classes[index], self.confidences[index], cell_size, image_shape)
+
+    def crop(self, box):
+        """
+        Cut out the cells covering a pixel box whose origin lies on the cell grid
+        
+        Args:
+            box (tuple): (x0, y0, x1, y1) in pixels, x0 and y0 multiples of the cell size
+            
+        Returns:
+            GridMap: Grid map of the box
+        """
+        x0, y0, x1, y1 = box
+        cell = self.cell_size
+        index = (slice(y0 // cell, -(-y1 // cell)), slice(x0 // cell, -(-x1 // cell)))
+        return GridMap(self.classes[index].copy(), self.confidences[index].copy(), cell, (y1 - y0, x1 - x0))
+
+    def coverage(self, mask):
+        """
+        Fraction of each cell covered by a pixel mask
+        
+        Args:
+            mask (numpy.ndarray): Mask with the image's (height, width), nonzero inside
+            
+        Returns:
+            numpy.ndarray: Covered fraction per cell (float64)
+        """
+        rows, cols = self.shape
+        padded = np.zeros((rows * self.cell_size, cols * self.cell_size), dtype=np.float64)
+        padded[:mask.shape[0], :mask.shape[1]] = mask != 0
+        covered = padded.reshape(rows, self.cell_size, cols, self.cell_size).sum(axis=(1, 3))
+        return covered / self.cell_areas()
+
+    def mask_outside(self, coverage):
+        """
+        Label the cells outside a region of interest as no-data, in place
+        
+        Args:
+            coverage (numpy.ndarray): Covered fraction per cell, see coverage
+        """
+        outside = coverage == 0
+        self.classes[outside] = NO_DATA_CLASS
+        self.confidences[outside] = 0
+
+    def save(self, file):
+        """
+        Save the grid map as a compressed .npz
+        
+        Args:
+            file (str or file): Destination path or open binary file
+        """
+        np.savez_compressed(
+            file,
+            classes=self.classes,
+            confidences=self.confidences,
+            cell_size=self.cell_size,
+            image_shape=np.array(self.image_shape)
+        )
+
+    @classmethod
+    def load(cls, file):
+        """
+        Load a grid map written by save
+        
+        Returns:
+            GridMap: The stored grid map
+        """
+        with np.load(file) as data:
+            return cls(data['classes'], data['confidences'], int(data['cell_size']), tuple(data['image_shape']))
+
 class HighResolutionChangeDetector:
-    def __init__(self, model_path):
+    def __init__(self, model_path=None, prefilter=None, variant=None,
+                 fast_model_path=None, cascade_threshold=0.9,
+                 tta=None, tta_transforms=4, tta_threshold=0.7, tta_max_fraction=0.1,
+                 model=None, fast_model=None, load_model=True):
         """
         Initialize Change Detector
         
         Args:
             model_path (str): Path to trained model
+            prefilter (bool or dict): Label no-data, cloud and (optionally)
+                uniform windows from simple statistics instead of running the
+                model on them. True uses DEFAULT_PREFILTER, a dict overrides it.
+            variant (str): Name of a model variant in ./models (see
+                model_architecture.MODEL_VARIANTS), used when no model_path is given
+            fast_model_path (str): Small model for cascade inference. When set,
+                it classifies every window and only windows whose top-1
+                confidence is below ``cascade_threshold`` are re-run through
+                the full model.
+            cascade_threshold (float): Confidence below which a window escalates
+                to the full model
+            tta (str): Test-time augmentation mode: None, 'all' to average every
+                window over flips/rotations, or 'low_confidence' to augment only
+                windows whose confidence is below ``tta_threshold``
+            tta_transforms (int): Number of TTA_TRANSFORMS to use (identity
+                included); more than 4 requires square windows
+            tta_threshold (float): Confidence below which 'low_confidence' TTA applies
+            tta_max_fraction (float): Upper bound on the fraction of windows
+                augmented in 'low_confidence' mode; the least confident win
+            model: Already loaded classifier, used instead of loading
+                ``model_path``. Anything with a Keras-style
+                ``predict(windows, verbose=0)`` works, e.g. a shared inference server.
+            fast_model: Already loaded cascade model, used instead of ``fast_model_path``
+            load_model (bool): False creates a detector without a model, for
+                work on existing maps (compare_label_maps,
+                detect_changes_from_maps, rendering, tile_layers) without
+                importing TensorFlow
         """
-        self.model = tf.keras.models.load_model(model_path)
+        if tta not in (None, 'all', 'low_confidence'):
+            raise ValueError(f"Unknown TTA mode: {tta}")
+        if not 1 <= tta_transforms <= len(TTA_TRANSFORMS):
+            raise ValueError(f"tta_transforms must be between 1 and {len(TTA_TRANSFORMS)}")
+        if model is None and load_model:
+            import tensorflow as tf
+            from model_architecture import model_variant_path
+            model = tf.keras.models.load_model(model_path or model_variant_path(variant or 'baseline'))
+        if fast_model is None and fast_model_path and load_model:
+            import tensorflow as tf
+            fast_model = tf.keras.models.load_model(fast_model_path)
+        self.model = model
+        self.fast_model = fast_model
+        self.cascade_threshold = cascade_threshold
+        self.tta = tta
+        self.tta_transforms = TTA_TRANSFORMS[:tta_transforms]
+        self.tta_threshold = tta_threshold
+        self.tta_max_fraction = tta_max_fraction
+        self.inference_stats = {'windows': 0, 'escalated': 0, 'augmented': 0}
+        if prefilter:
+            self.prefilter = dict(DEFAULT_PREFILTER, **(prefilter if isinstance(prefilter, dict) else {}))
+        else:
+            self.prefilter = None
         self.classes = [
             'AnnualCrop', 'Forest', 'HerbaceousVegetation', 
             'Industrial', 'Pasture', 'PermanentCrop', 
@@ -33,6 +387,11 @@ class HighResolutionChangeDetector:
             'Residential': [255, 0, 255],      # Magenta
             'SeaLake': [0, 191, 255]           # Deep Sky Blue
         }
+        # Window counts of the most recent predict_large_image call
+        self.last_inference_report = None
+        # Optional callable receiving progress events, set per call
+        self.progress_callback = None
+        self._progress_stage = None
 
     def _sliding_window(self, image, window_size, stride):
         """
@@ -81,107 +440,733 @@ class HighResolutionChangeDetector:
         
         return np.array(windows), positions, original_image, image_shape
 
-    def predict_large_image(self, image_path, window_size=(64, 64), stride=32):
+    def _load_image(self, image_path, scale=1.0):
         """
-        Predict classes for a large image using sliding window
+        Load an image from disk in RGB channel order
+        
+        When ``scale`` is below 1 the image is decoded with the largest
+        IMREAD_REDUCED_* factor that does not overshoot (JPEG decodes these
+        directly at reduced size) and the remainder is covered by INTER_AREA
+        downsampling.
         
         Args:
-            image_path (str): Path to large image
+            image_path (str): Path to image
+            scale (float): Resize factor relative to the native resolution
+            
+        Returns:
+            numpy.ndarray: RGB image
+        """
+        reduction = 1
+        flag = cv2.IMREAD_COLOR
+        for factor, reduced_flag in REDUCED_READ_FLAGS:
+            if scale * factor <= 1.0:
+                reduction, flag = factor, reduced_flag
+                break
+        
+        image = cv2.imread(image_path, flag)
+        
+        remaining = scale * reduction
+        if remaining < 1.0:
+            image = cv2.resize(image, None, fx=remaining, fy=remaining, interpolation=cv2.INTER_AREA)
+        
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    def resolve_scale(self, scale=None, source_gsd=None, target_gsd=EUROSAT_GSD):
+        """
+        Work out the inference scale from an explicit factor or ground sample distances
+        
+        Args:
+            scale (float): Explicit resize factor, takes precedence when given
+            source_gsd (float): Ground sample distance of the input in m/pixel
+            target_gsd (float): Ground sample distance to run inference at
+            
+        Returns:
+            float: Resize factor in (0, 1]; imagery is never upsampled
+        """
+        if scale is None:
+            scale = source_gsd / target_gsd if source_gsd else 1.0
+        if scale <= 0:
+            raise ValueError(f"Scale must be positive, got {scale}")
+        return min(float(scale), 1.0)
+
+    def upsample_map(self, label_map, shape, interpolation=cv2.INTER_NEAREST):
+        """
+        Expand a class, confidence or change map to another resolution for rendering
+        
+        Args:
+            label_map (numpy.ndarray): Map computed at inference scale
+            shape (tuple): Target (height, width, ...) shape
+            interpolation (int): OpenCV interpolation flag
+            
+        Returns:
+            numpy.ndarray: Resized map
+        """
+        if label_map.shape[:2] == tuple(shape[:2]):
+            return label_map
+        return cv2.resize(label_map, (shape[1], shape[0]), interpolation=interpolation)
+
+    def _roi_region(self, roi, image_shape, scale=1.0, margin=0, align=1):
+        """
+        Rasterize a region of interest and find the crop of the image that covers it
+        
+        Args:
+            roi: Bounding box or polygon in native pixels, see roi_polygon
+            image_shape (tuple): Shape of the decoded image
+            scale (float): Scale the image was decoded at
+            margin (int): Halo in image pixels added around the ROI's bounding
+                box, so windows overlapping the ROI edge have their full context
+            align (int): The crop origin is moved down to a multiple of this,
+                which keeps the windows on the full image's stride grid
+                
+        Returns:
+            tuple: ((x0, y0, x1, y1) crop box, uint8 ROI mask of the crop)
+        """
+        points, is_box = roi_polygon(roi)
+        points = points * scale
+        height, width = image_shape[:2]
+        
+        left, top = np.floor(points.min(axis=0)).astype(int)
+        right, bottom = np.ceil(points.max(axis=0)).astype(int)
+        left, top = max(left, 0), max(top, 0)
+        right, bottom = min(right, width), min(bottom, height)
+        if right <= left or bottom <= top:
+            raise ValueError("ROI does not overlap the image")
+        
+        x0 = max(left - margin, 0) // align * align
+        y0 = max(top - margin, 0) // align * align
+        x1 = min(right + margin, width)
+        y1 = min(bottom + margin, height)
+        
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        if is_box:
+            mask[top - y0:bottom - y0, left - x0:right - x0] = 1
+        else:
+            cv2.fillPoly(mask, [np.round(points - (x0, y0)).astype(np.int32)], 1)
+        return (x0, y0, x1, y1), mask
+
+    def _roi_windows(self, roi_integral, positions, window_size):
+        """
+        Mark the windows that overlap the region of interest
+        
+        Args:
+            roi_integral (numpy.ndarray): Integral image of the ROI mask
+            positions (list): (x, y) window origins
             window_size (tuple): Size of sliding window
-            stride (int): Step size for sliding window
             
         Returns:
-            tuple: (class_map, confidence_map, original_image, image_shape)
+            numpy.ndarray: Boolean mask over the positions
+        """
+        return self._window_means(roi_integral, positions, window_size) > 0
+
+    def _window_grid(self, image_shape, window_size, stride):
+        """
+        Compute the top-left window coordinates of a sliding window grid
+        
+        Args:
+            image_shape (tuple): Shape of the image
+            window_size (tuple): Size of sliding window (width, height)
+            stride (tuple): Step size along x and y
+            
+        Returns:
+            tuple: (xs, ys) arrays of window origins
+        """
+        xs = np.arange(0, image_shape[1] - window_size[0] + 1, stride[0])
+        ys = np.arange(0, image_shape[0] - window_size[1] + 1, stride[1])
+        return xs, ys
+
+    def _extract_windows(self, image, positions, window_size):
+        """
+        Cut normalized windows out of an image
+        
+        Args:
+            image (numpy.ndarray): RGB image
+            positions (list): (x, y) window origins
+            window_size (tuple): Size of sliding window
+            
+        Returns:
+            numpy.ndarray: Float32 window stack scaled to [0, 1]
+        """
+        windows = np.empty((len(positions), window_size[1], window_size[0], 3), dtype=np.float32)
+        for i, (x, y) in enumerate(positions):
+            windows[i] = image[y:y + window_size[1], x:x + window_size[0]]
+        windows /= 255.0
+        return windows
+
+    def _run_model(self, model, windows, batch_size=128):
+        """
+        Run a model over a window stack in batches
+        
+        Args:
+            model (tf.keras.Model): Classifier to run
+            windows (numpy.ndarray): Window stack
+            batch_size (int): Number of windows per predict call
+            
+        Returns:
+            numpy.ndarray: Class probabilities, one row per window
+        """
+        if len(windows) == 0:
+            return np.zeros((0, len(self.classes)), dtype=np.float32)
+        
+        if getattr(model, 'accepts_any_batch', False):
+            # The model batches on its own, e.g. across concurrent requests
+            predictions = model.predict(windows, verbose=0)
+        else:
+            predictions = np.concatenate([
+                model.predict(windows[i:i + batch_size], verbose=0)
+                for i in range(0, len(windows), batch_size)
+            ])
+        
+        if predictions.shape[-1] != len(self.classes):
+            raise ValueError(
+                f"The model predicts {predictions.shape[-1]} classes, but the detector "
+                f"has {len(self.classes)} ({', '.join(self.classes)})"
+            )
+        return predictions
+
+    def _run_augmented(self, windows, transforms, batch_size=128):
+        """
+        Run the full model over augmented copies of each window
+        
+        The copies of a window are stacked into the same predict batch, so a
+        batch holds ``batch_size // len(transforms)`` windows.
+        
+        Args:
+            windows (numpy.ndarray): Window stack
+            transforms (list): Augmentations from TTA_TRANSFORMS
+            batch_size (int): Number of images per predict call
+            
+        Returns:
+            numpy.ndarray: Summed probabilities over all transforms, one row per window
+        """
+        step = max(batch_size // len(transforms), 1)
+        sums = np.zeros((len(windows), len(self.classes)), dtype=np.float32)
+        
+        for i in range(0, len(windows), step):
+            chunk = windows[i:i + step]
+            stacked = np.concatenate([transform(chunk) for transform in transforms])
+            predictions = self.model.predict(stacked, verbose=0)
+            sums[i:i + len(chunk)] = predictions.reshape(len(transforms), len(chunk), -1).sum(axis=0)
+        
+        return sums
+
+    def _predict_windows(self, windows, batch_size=128):
+        """
+        Predict class probabilities for a window stack
+        
+        With a fast model configured this is a two-stage cascade: the fast
+        model sees every window, and the uncertain ones are gathered and run
+        through the full model in batches of their own. Test-time augmentation,
+        if enabled, is applied on top with the full model.
+        
+        Args:
+            windows (numpy.ndarray): Window stack
+            batch_size (int): Number of windows per predict call
+            
+        Returns:
+            numpy.ndarray: Class probabilities, one row per window
+        """
+        if len(windows) == 0:
+            return np.zeros((0, len(self.classes)), dtype=np.float32)
+        if self.model is None:
+            raise RuntimeError("This detector was created without a model (load_model=False)")
+        
+        self.inference_stats['windows'] += len(windows)
+        
+        if self.tta == 'all':
+            self.inference_stats['augmented'] += len(windows)
+            return self._run_augmented(windows, self.tta_transforms, batch_size) / len(self.tta_transforms)
+        
+        if self.fast_model is None:
+            predictions = self._run_model(self.model, windows, batch_size)
+        else:
+            predictions = self._run_model(self.fast_model, windows, batch_size)
+            escalate = np.nonzero(np.max(predictions, axis=1) < self.cascade_threshold)[0]
+            if len(escalate):
+                predictions[escalate] = self._run_model(self.model, windows[escalate], batch_size)
+            self.inference_stats['escalated'] += len(escalate)
+        
+        if self.tta == 'low_confidence' and len(self.tta_transforms) > 1:
+            # Augment the least confident windows, up to the configured share
+            confidences = np.max(predictions, axis=1)
+            candidates = np.nonzero(confidences < self.tta_threshold)[0]
+            limit = int(np.ceil(self.tta_max_fraction * len(windows)))
+            if len(candidates) > limit:
+                candidates = candidates[np.argsort(confidences[candidates])[:limit]]
+            
+            if len(candidates):
+                # The un-augmented prediction stands in for the identity transform
+                augmented = self._run_augmented(windows[candidates], self.tta_transforms[1:], batch_size)
+                predictions[candidates] = (predictions[candidates] + augmented) / len(self.tta_transforms)
+                self.inference_stats['augmented'] += len(candidates)
+        
+        return predictions
+
+    def _add_model_report(self, report):
+        """
+        Add the cascade and TTA counts collected since the last reset to a report
+        """
+        windows = self.inference_stats['windows']
+        if self.fast_model is not None:
+            escalated = self.inference_stats['escalated']
+            report['cascade_threshold'] = self.cascade_threshold
+            report['escalated_windows'] = escalated
+            report['escalation_rate'] = escalated / windows if windows else 0.0
+        if self.tta is not None:
+            augmented = self.inference_stats['augmented']
+            report['tta'] = self.tta
+            report['tta_transforms'] = len(self.tta_transforms)
+            report['augmented_windows'] = augmented
+            report['augmented_fraction'] = augmented / windows if windows else 0.0
+        self.inference_stats = {'windows': 0, 'escalated': 0, 'augmented': 0}
+
+    def _classify_dense(self, image, window_size, stride, statistics=None, roi_integral=None):
+        """
+        Classify every window on the dense stride grid
+        
+        Returns:
+            tuple: (positions, labels, confidences, report)
+        """
+        xs, ys = self._window_grid(image.shape, window_size, (stride, stride))
+        positions = [(int(x), int(y)) for y in ys for x in xs]
+        if roi_integral is not None:
+            inside = self._roi_windows(roi_integral, positions, window_size)
+            positions = [position for position, keep in zip(positions, inside) if keep]
+        
+        labels, confidences, prefiltered = self._label_windows(
+            image, positions, window_size, statistics
+        )
+        
+        report = {
+            'mode': 'dense',
+            'dense_windows': len(positions),
+            'prefiltered_windows': prefiltered,
+            'windows_evaluated': len(positions) - prefiltered,
+            'windows_saved': prefiltered,
+            'saved_fraction': prefiltered / len(positions) if positions else 0.0
+        }
+        return positions, labels, confidences, report
+
+    def _classify_adaptive(self, image, window_size, stride, refine_threshold, statistics=None,
+                           roi_integral=None):
+        """
+        Classify an image with quadtree-style adaptive refinement
+        
+        A coarse, non-overlapping grid of windows is classified first. A coarse
+        cell is flagged when its confidence is below ``refine_threshold`` or when
+        one of its 4-neighbours was assigned a different class. Only the dense
+        stride-grid windows touching flagged cells (or the strip along the
+        right/bottom edges that the coarse grid does not reach) are evaluated.
+        With a region of interest, windows outside it are skipped in both
+        passes; their coarse cells count as no-data.
+        
+        Returns:
+            tuple: (positions, labels, confidences, report)
         """
-        # Preprocess image
-        windows, positions, original_image, image_shape = self.preprocess_large_image(
-            image_path, window_size, stride
+        width, height = window_size
+        
+        # Coarse pass
+        coarse_xs, coarse_ys = self._window_grid(image.shape, window_size, window_size)
+        nx, ny = len(coarse_xs), len(coarse_ys)
+        coarse_positions = [(int(x), int(y)) for y in coarse_ys for x in coarse_xs]
+        coarse_inside = np.ones(len(coarse_positions), dtype=bool)
+        if roi_integral is not None:
+            coarse_inside = self._roi_windows(roi_integral, coarse_positions, window_size)
+        kept_positions = [p for p, keep in zip(coarse_positions, coarse_inside) if keep]
+        kept_labels, kept_conf, coarse_prefiltered = self._label_windows(
+            image, kept_positions, window_size, statistics
+        )
+        coarse_labels = np.full(len(coarse_positions), NO_DATA_CLASS, dtype=np.uint8)
+        coarse_conf = np.ones(len(coarse_positions), dtype=np.float32)
+        coarse_labels[coarse_inside] = kept_labels
+        coarse_conf[coarse_inside] = kept_conf
+        
+        # Flag uncertain cells and cells on a class boundary. The extra row and
+        # column stand for the edge strip the coarse grid leaves uncovered.
+        flagged = np.ones((ny + 1, nx + 1), dtype=bool)
+        if nx and ny:
+            label_grid = coarse_labels.reshape(ny, nx)
+            cells = coarse_conf.reshape(ny, nx) < refine_threshold
+            horizontal = label_grid[:, 1:] != label_grid[:, :-1]
+            vertical = label_grid[1:, :] != label_grid[:-1, :]
+            cells[:, 1:] |= horizontal
+            cells[:, :-1] |= horizontal
+            cells[1:, :] |= vertical
+            cells[:-1, :] |= vertical
+            flagged[:ny, :nx] = cells
+        
+        # Refinement pass over dense windows that touch a flagged cell
+        xs, ys = self._window_grid(image.shape, window_size, (stride, stride))
+        col0 = np.minimum(xs // width, nx)
+        col1 = np.minimum((xs + width - 1) // width, nx)
+        row0 = np.minimum(ys // height, ny)
+        row1 = np.minimum((ys + height - 1) // height, ny)
+        refine = (
+            flagged[np.ix_(row0, col0)] | flagged[np.ix_(row0, col1)] |
+            flagged[np.ix_(row1, col0)] | flagged[np.ix_(row1, col1)]
+        )
+        # Dense windows that coincide with a coarse window are already done
+        refine &= ~((ys % height == 0)[:, None] & (xs % width == 0)[None, :])
+        
+        rows, cols = np.nonzero(refine)
+        refine_positions = [(int(xs[c]), int(ys[r])) for r, c in zip(rows, cols)]
+        if roi_integral is not None:
+            inside = self._roi_windows(roi_integral, refine_positions, window_size)
+            refine_positions = [p for p, keep in zip(refine_positions, inside) if keep]
+        refine_labels, refine_conf, refine_prefiltered = self._label_windows(
+            image, refine_positions, window_size, statistics
         )
         
-        # Predict in batches to avoid memory issues
-        batch_size = 128
-        predictions = []
+        positions = kept_positions + refine_positions
+        labels = np.concatenate([kept_labels, refine_labels])
+        confidences = np.concatenate([kept_conf, refine_conf])
         
-        for i in range(0, len(windows), batch_size):
-            batch = windows[i:i+batch_size]
-            batch_preds = self.model.predict(np.array(batch), verbose=0)
-            predictions.extend(batch_preds)
+        prefiltered = coarse_prefiltered + refine_prefiltered
+        evaluated = len(positions) - prefiltered
+        dense_windows = len(xs) * len(ys)
+        if roi_integral is not None:
+            dense_positions = [(int(x), int(y)) for y in ys for x in xs]
+            dense_windows = int(self._roi_windows(roi_integral, dense_positions, window_size).sum())
+        report = {
+            'mode': 'adaptive',
+            'refine_threshold': refine_threshold,
+            'coarse_windows': len(kept_positions),
+            'flagged_cells': int(flagged[:ny, :nx].sum()),
+            'refined_windows': len(refine_positions),
+            'dense_windows': dense_windows,
+            'prefiltered_windows': prefiltered,
+            'windows_evaluated': evaluated,
+            'windows_saved': dense_windows - evaluated,
+            'saved_fraction': (dense_windows - evaluated) / dense_windows if dense_windows else 0.0
+        }
+        return positions, labels, confidences, report
+
+    def _classify(self, image, window_size, stride, adaptive=False, refine_threshold=0.6, roi_mask=None):
+        """
+        Classify the windows of an in-memory image
+        
+        Args:
+            roi_mask (numpy.ndarray): uint8 mask of the region of interest;
+                only windows overlapping it are classified
+        
+        Returns:
+            tuple: (positions, labels, confidences, report)
+        """
+        self.inference_stats = {'windows': 0, 'escalated': 0, 'augmented': 0}
+        statistics = self._window_statistics(image) if self.prefilter else None
+        roi_integral = cv2.integral(roi_mask) if roi_mask is not None else None
+        if adaptive:
+            result = self._classify_adaptive(image, window_size, stride, refine_threshold, statistics, roi_integral)
+        else:
+            result = self._classify_dense(image, window_size, stride, statistics, roi_integral)
+        self._add_model_report(result[3])
+        return result
+
+    def _window_statistics(self, image):
+        """
+        Integral images used by the pre-filter to read per-window statistics
+        
+        Args:
+            image (numpy.ndarray): RGB image
             
-            # Clean up to free memory
-            del batch
-            gc.collect()
+        Returns:
+            dict: Integral images of grayscale values, squared values and no-data pixels
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        total, squares = cv2.integral2(gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        nodata = np.all(image == self.prefilter['nodata_value'], axis=2).astype(np.uint8)
+        return {'sum': total, 'sqsum': squares, 'nodata': cv2.integral(nodata)}
+
+    def _label_index(self, label):
+        """
+        Map a pre-filter label (class name or NO_DATA_LABEL) to a class index
+        """
+        if label == NO_DATA_LABEL:
+            return NO_DATA_CLASS
+        return self.classes.index(label)
+
+    def _prefilter_windows(self, statistics, positions, window_size):
+        """
+        Assign labels to no-data, cloud and uniform windows without inference
         
-        # Create class and confidence maps
-        class_map = np.zeros((image_shape[0], image_shape[1]), dtype=np.uint8)
-        confidence_map = np.zeros((image_shape[0], image_shape[1]), dtype=np.float32)
+        Args:
+            statistics (dict): Integral images from _window_statistics
+            positions (list): (x, y) window origins
+            window_size (tuple): Size of sliding window
+            
+        Returns:
+            tuple: (assigned, labels, confidences) where assigned marks the
+            windows that were labeled by a rule
+        """
+        config = self.prefilter
+        mean = self._window_means(statistics['sum'], positions, window_size) / 255.0
+        mean_square = self._window_means(statistics['sqsum'], positions, window_size) / (255.0 ** 2)
+        std = np.sqrt(np.maximum(mean_square - mean ** 2, 0))
+        nodata_fraction = self._window_means(statistics['nodata'], positions, window_size)
+        
+        rules = [
+            (nodata_fraction > config['max_nodata_fraction'], NO_DATA_LABEL),
+            ((mean >= config['cloud_min_mean']) & (std <= config['cloud_max_std']), config['cloud_label'])
+        ]
+        if config['uniform_max_std'] is not None:
+            rules.append((std <= config['uniform_max_std'], config['uniform_label']))
         
-        for (x, y), pred in zip(positions, predictions):
-            class_idx = np.argmax(pred)
-            confidence = pred[class_idx]
+        assigned = np.zeros(len(positions), dtype=bool)
+        labels = np.zeros(len(positions), dtype=np.uint8)
+        confidences = np.zeros(len(positions), dtype=np.float32)
+        
+        # Earlier rules take precedence
+        for mask, label in rules:
+            matched = mask & ~assigned
+            labels[matched] = self._label_index(label)
+            # No-data windows get zero confidence so they never paint over a
+            # real prediction in overlapping regions
+            confidences[matched] = 0.0 if label == NO_DATA_LABEL else config['assigned_confidence']
+            assigned |= matched
+        
+        return assigned, labels, confidences
+
+    def _label_windows(self, image, positions, window_size, statistics=None):
+        """
+        Label windows, using the pre-filter where possible and the model otherwise
+        
+        Args:
+            image (numpy.ndarray): RGB image
+            positions (list): (x, y) window origins
+            window_size (tuple): Size of sliding window
+            statistics (dict): Integral images from _window_statistics, or
+                None to send every window to the model
             
-            # Fill the corresponding region in the maps
-            end_y = min(y + window_size[1], image_shape[0])
-            end_x = min(x + window_size[0], image_shape[1])
+        Returns:
+            tuple: (labels, confidences, prefiltered) where prefiltered is the
+            number of windows labeled without inference
+        """
+        labels = np.zeros(len(positions), dtype=np.uint8)
+        confidences = np.zeros(len(positions), dtype=np.float32)
+        pending = np.arange(len(positions))
+        
+        if statistics is not None and len(positions):
+            assigned, labels, confidences = self._prefilter_windows(statistics, positions, window_size)
+            pending = np.nonzero(~assigned)[0]
+        
+        for start in range(0, len(pending), WINDOW_CHUNK):
+            chunk = pending[start:start + WINDOW_CHUNK]
+            chunk_positions = [positions[i] for i in chunk]
+            predictions = self._predict_windows(self._extract_windows(image, chunk_positions, window_size))
+            labels[chunk] = np.argmax(predictions, axis=1)
+            confidences[chunk] = np.max(predictions, axis=1)
             
-            # Only update if the new confidence is higher
-            region_confidence = confidence_map[y:end_y, x:end_x]
-            update_mask = (region_confidence < confidence) | (region_confidence == 0)
+            done = start + len(chunk)
+            self._report_progress({
+                'event': 'progress',
+                'stage': self._progress_stage,
+                'windows_done': done,
+                'windows_total': len(pending),
+                'percent': round(100.0 * done / len(pending), 1)
+            })
+        
+        return labels, confidences, len(positions) - len(pending)
+
+    def _report_progress(self, event):
+        """
+        Pass a progress event to the callback of the current call, if any
+        """
+        if self.progress_callback is not None:
+            self.progress_callback(event)
+
+    def _window_means(self, integral, positions, window_size):
+        """
+        Mean value of each window, read from an integral image
+        
+        Args:
+            integral (numpy.ndarray): Integral image as returned by cv2.integral
+            positions (list): (x, y) window origins
+            window_size (tuple): Size of sliding window
             
-            # Apply updates only where needed
-            confidence_map[y:end_y, x:end_x][update_mask] = confidence
-            class_map[y:end_y, x:end_x][update_mask] = class_idx
+        Returns:
+            numpy.ndarray: Mean per window
+        """
+        if len(positions) == 0:
+            return np.zeros(0, dtype=np.float64)
         
-        # Free memory
-        del windows, predictions
-        gc.collect()
+        xy = np.asarray(positions)
+        x0, y0 = xy[:, 0], xy[:, 1]
+        x1, y1 = x0 + window_size[0], y0 + window_size[1]
+        sums = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        return sums / (window_size[0] * window_size[1])
+
+    def _classify_changed(self, image1, image2, positions, labels1, confidences1,
+                          window_size, change_threshold):
+        """
+        Classify the second image of a pair, reusing the first image's
+        predictions for windows that did not change visually
         
-        return class_map, confidence_map, original_image, image_shape
+        The per-window distance is the mean absolute pixel difference between
+        the two images, normalized to [0, 1]. Windows below ``change_threshold``
+        inherit the class and confidence from the first image; only the rest
+        are sent through the model.
+        
+        Returns:
+            tuple: (labels, confidences, report)
+        """
+        difference = cv2.absdiff(image1, image2).mean(axis=2, dtype=np.float32)
+        distances = self._window_means(cv2.integral(difference), positions, window_size) / 255.0
+        changed = np.nonzero(distances >= change_threshold)[0]
+        
+        changed_positions = [positions[i] for i in changed]
+        self.inference_stats = {'windows': 0, 'escalated': 0, 'augmented': 0}
+        statistics = self._window_statistics(image2) if self.prefilter else None
+        changed_labels, changed_confidences, prefiltered = self._label_windows(
+            image2, changed_positions, window_size, statistics
+        )
+        
+        labels = np.array(labels1, copy=True)
+        confidences = np.array(confidences1, copy=True)
+        labels[changed] = changed_labels
+        confidences[changed] = changed_confidences
+        
+        report = {
+            'mode': 'change_aware',
+            'change_threshold': change_threshold,
+            'tiles_total': len(positions),
+            'tiles_skipped': len(positions) - len(changed),
+            'tiles_reclassified': len(changed),
+            'prefiltered_windows': prefiltered,
+            'windows_evaluated': len(changed) - prefiltered
+        }
+        self._add_model_report(report)
+        return labels, confidences, report
 
-    def detect_changes(self, image1_path, image2_path, window_size=(64, 64), stride=32):
+    def _predict_grid(self, image_path, window_size, stride, adaptive=False,
+                      refine_threshold=0.6, scale=1.0):
         """
-        Detect changes between two large satellite images
+        Load and classify one image into a grid map
+        
+        Returns:
+            tuple: (label_map, image, report)
+        """
+        image = self._load_image(image_path, scale)
+        positions, labels, confidences, report = self._classify(
+            image, window_size, stride, adaptive, refine_threshold
+        )
+        label_map = GridMap.from_windows(
+            image.shape, positions, labels, confidences, window_size, stride
+        )
+        return label_map, image, report
+
+    def predict_label_map(self, image_path, window_size=(64, 64), stride=32,
+                          adaptive=False, refine_threshold=0.6, scale=1.0,
+                          progress=None, stage='image'):
+        """
+        Classify one image into a grid map, e.g. to store it for later comparisons
         
         Args:
-            image1_path (str): Path to first image
-            image2_path (str): Path to second image
+            image_path (str): Path to image
             window_size (tuple): Size of sliding window
             stride (int): Step size for sliding window
+            adaptive (bool): Use adaptive refinement instead of the dense grid
+            refine_threshold (float): Coarse confidence below which a cell is refined
+            scale (float): Resize factor applied while decoding
+            progress (callable): Receives a progress event dict after every
+                chunk of classified windows
+            stage (str): Stage name put into the progress events
             
         Returns:
-            dict: Change detection results
+            GridMap: Class and confidence map of the image
         """
-        print("Processing first image...")
-        class_map1, confidence_map1, image1, shape1 = self.predict_large_image(
-            image1_path, window_size, stride
+        self.progress_callback, self._progress_stage = progress, stage
+        label_map, _, report = self._predict_grid(
+            image_path, window_size, stride, adaptive, refine_threshold, scale
         )
+        self.last_inference_report = report
+        self._report_progress({'event': 'image_classified', 'stage': stage, 'report': report})
+        return label_map
+
+    def predict_large_image(self, image_path, window_size=(64, 64), stride=32,
+                            adaptive=False, refine_threshold=0.6, scale=1.0):
+        """
+        Predict classes for a large image using sliding window
         
-        print("Processing second image...")
-        class_map2, confidence_map2, image2, shape2 = self.predict_large_image(
-            image2_path, window_size, stride
+        Args:
+            image_path (str): Path to large image
+            window_size (tuple): Size of sliding window
+            stride (int): Step size for sliding window
+            adaptive (bool): Classify a coarse grid first and refine only
+                around class boundaries and low-confidence cells
+            refine_threshold (float): Coarse confidence below which a cell is refined
+            scale (float): Resize factor applied while decoding; the maps and
+                the returned image are at this scale
+            
+        Returns:
+            tuple: (class_map, confidence_map, original_image, image_shape)
+            
+        The window counts of the run are stored in ``self.last_inference_report``.
+        Confidences are quantized to steps of 1/255.
+        """
+        label_map, original_image, report = self._predict_grid(
+            image_path, window_size, stride, adaptive, refine_threshold, scale
         )
+        self.last_inference_report = report
         
-        # Make sure images have the same shape
-        if shape1 != shape2:
-            # Resize second image to match first
-            image2 = cv2.resize(image2, (shape1[1], shape1[0]))
-            class_map2 = cv2.resize(class_map2, (shape1[1], shape1[0]), interpolation=cv2.INTER_NEAREST)
-            confidence_map2 = cv2.resize(confidence_map2, (shape1[1], shape1[0]), interpolation=cv2.INTER_LINEAR)
+        return label_map.expand_classes(), label_map.expand_confidences(), original_image, original_image.shape
+
+    def compare_label_maps(self, label_map1, label_map2, weights=None):
+        """
+        Compute the change grid and class statistics of two grid maps
+        
+        Cells are weighted by their pixel area, so the results match what the
+        expanded pixel maps would give. Cells labeled no-data in either map take
+        no part in the change grid, the transition matrix or the distributions,
+        so every percentage is relative to the same area: the cells valid in
+        both maps (``valid_area``).
+        
+        Args:
+            label_map1 (GridMap): Map of the first image
+            label_map2 (GridMap): Map of the second image, on the same grid
+            weights (numpy.ndarray): Optional per-cell factor on the cell areas,
+                e.g. the region-of-interest coverage
+            
+        Returns:
+            dict: change_grid, class distributions, no-data fractions, common
+            valid area in pixels, transition matrix (pixel counts, from-class
+            rows) and change percentages
+        """
+        num_classes = len(self.classes)
+        areas = label_map1.cell_areas()
+        if weights is not None:
+            areas = areas * weights
+        total_area = areas.sum()
+        classes1, classes2 = label_map1.classes, label_map2.classes
         
-        # Create change map
-        change_map = (class_map1 != class_map2).astype(np.uint8) * 255
+        # Cells labeled no-data in either image take no part in the statistics
+        valid1 = classes1 != NO_DATA_CLASS
+        valid2 = classes2 != NO_DATA_CLASS
+        for label_map, valid in ((label_map1, valid1), (label_map2, valid2)):
+            if valid.any() and label_map.classes[valid].max() >= num_classes:
+                raise ValueError(
+                    f"Label map has class index {int(label_map.classes[valid].max())}, but the "
+                    f"detector has {num_classes} classes; the model's output width must match them"
+                )
+        both_valid = valid1 & valid2
         
-        # Use morphological operations to clean up the change map
-        kernel = np.ones((5, 5), np.uint8)
-        change_map = cv2.morphologyEx(change_map, cv2.MORPH_OPEN, kernel)
-        change_map = cv2.morphologyEx(change_map, cv2.MORPH_CLOSE, kernel)
+        change_grid = (classes1 != classes2) & both_valid
         
-        # Calculate class distribution in both images
-        class_distribution1 = [np.sum(class_map1 == i) / class_map1.size for i in range(len(self.classes))]
-        class_distribution2 = [np.sum(class_map2 == i) / class_map2.size for i in range(len(self.classes))]
+        # Calculate class distribution in both images over the common valid area,
+        # so a class seen only where the other image has no data doesn't count as change
+        counts1 = np.bincount(classes1[both_valid], weights=areas[both_valid], minlength=num_classes)[:num_classes]
+        counts2 = np.bincount(classes2[both_valid], weights=areas[both_valid], minlength=num_classes)[:num_classes]
+        valid_area = float(areas[both_valid].sum())
+        class_distribution1 = [float(c) / max(valid_area, 1) for c in counts1]
+        class_distribution2 = [float(c) / max(valid_area, 1) for c in counts2]
+        
+        # Pixel counts of every from/to class pair
+        pairs = classes1[both_valid].astype(np.int64) * num_classes + classes2[both_valid]
+        transition_matrix = np.bincount(
+            pairs, weights=areas[both_valid], minlength=num_classes * num_classes
+        ).reshape(num_classes, num_classes).round().astype(np.int64)
         
         # Calculate change percentages
         change_percentages = []
-        for i in range(len(self.classes)):
+        for i in range(num_classes):
             change = class_distribution2[i] - class_distribution1[i]
             change_percentages.append({
                 "class": self.classes[i],
@@ -191,72 +1176,381 @@ class HighResolutionChangeDetector:
             })
         
         return {
-            'image1': image1,
-            'image2': image2,
-            'class_map1': class_map1,
-            'class_map2': class_map2,
-            'confidence_map1': confidence_map1,
-            'confidence_map2': confidence_map2,
-            'change_map': change_map,
+            'change_grid': change_grid,
             'class_distribution1': class_distribution1,
             'class_distribution2': class_distribution2,
+            'no_data_fraction1': float(areas[~valid1].sum() / total_area) if total_area else 0.0,
+            'no_data_fraction2': float(areas[~valid2].sum() / total_area) if total_area else 0.0,
+            'valid_area': valid_area,
+            'transition_matrix': transition_matrix,
             'change_percentages': change_percentages
         }
 
-    def generate_change_visualization(self, results, output_path):
-        # Create color-coded class maps
-        class_map1_rgb = np.zeros((results['class_map1'].shape[0], results['class_map1'].shape[1], 3), dtype=np.uint8)
-        class_map2_rgb = np.zeros((results['class_map2'].shape[0], results['class_map2'].shape[1], 3), dtype=np.uint8)
+    def detect_changes(self, image1_path, image2_path, window_size=(64, 64), stride=32,
+                       adaptive=False, refine_threshold=0.6,
+                       skip_unchanged=False, change_threshold=0.08,
+                       scale=None, source_gsd=None, target_gsd=EUROSAT_GSD,
+                       progress=None, roi=None):
+        """
+        Detect changes between two large satellite images
+        
+        Args:
+            image1_path (str): Path to first image
+            image2_path (str): Path to second image
+            window_size (tuple): Size of sliding window
+            stride (int): Step size for sliding window
+            adaptive (bool): Use adaptive refinement instead of the dense grid
+            refine_threshold (float): Coarse confidence below which a cell is refined
+            skip_unchanged (bool): Only reclassify windows of the second image
+                that differ visually from the first image
+            change_threshold (float): Normalized mean pixel difference below
+                which a window is considered unchanged
+            scale (float): Resize factor to run inference at
+            source_gsd (float): Ground sample distance of the inputs in m/pixel,
+                used to derive the scale when none is given
+            target_gsd (float): Ground sample distance to run inference at
+            progress (callable): Receives progress events: 'progress' after
+                every chunk of classified windows (percent of the current
+                pass) and 'image_classified' once an image's map is done
+            roi: Region of interest as a bounding box (x0, y0, x1, y1) or a
+                list of (x, y) polygon vertices in native pixels. The images
+                are cropped to the ROI plus a halo of one window, only windows
+                overlapping it are classified and the statistics cover the ROI
+                only. The second image is brought to the first one's size
+                before cropping.
+            
+        Returns:
+            dict: Change detection results. Class and confidence maps are
+            GridMap objects ('label_map1', 'label_map2') and the change map is
+            kept at grid resolution ('change_grid'); use expand_change_map or
+            the GridMap expand methods for pixel maps. With an ROI, the maps
+            and images cover the crop given by 'roi_box' (native pixels) and
+            'roi_coverage' holds the fraction of each cell inside the ROI.
+        """
+        scale = self.resolve_scale(scale, source_gsd, target_gsd)
+        if scale < 1.0:
+            print(f"Running inference at {scale:.3f}x native resolution")
+        
+        self.progress_callback = progress
+        
+        print("Processing first image...")
+        self._progress_stage = 'image1'
+        image1 = self._load_image(image1_path, scale)
+        full_shape = image1.shape
+        roi_box = roi_mask = None
+        if roi is not None:
+            # JPEG has no random access, so the full image is decoded and cropped
+            roi_box, roi_mask = self._roi_region(roi, full_shape, scale, max(window_size), stride)
+            image1 = image1[roi_box[1]:roi_box[3], roi_box[0]:roi_box[2]].copy()
+        shape1 = image1.shape
+        positions1, labels1, confidences1, report1 = self._classify(
+            image1, window_size, stride, adaptive, refine_threshold, roi_mask
+        )
+        label_map1 = GridMap.from_windows(
+            shape1, positions1, labels1, confidences1, window_size, stride
+        )
+        self._report_progress({'event': 'image_classified', 'stage': 'image1', 'report': report1})
+        
+        print("Processing second image...")
+        self._progress_stage = 'image2'
+        if roi is not None:
+            image2 = self._load_image(image2_path, scale)
+            if image2.shape != full_shape:
+                image2 = cv2.resize(image2, (full_shape[1], full_shape[0]), interpolation=cv2.INTER_AREA)
+            image2 = image2[roi_box[1]:roi_box[3], roi_box[0]:roi_box[2]].copy()
+        
+        if skip_unchanged:
+            if roi is None:
+                image2 = self._load_image(image2_path, scale)
+                if image2.shape != shape1:
+                    image2 = cv2.resize(image2, (shape1[1], shape1[0]), interpolation=cv2.INTER_AREA)
+            
+            labels2, confidences2, report2 = self._classify_changed(
+                image1, image2, positions1, labels1, confidences1, window_size, change_threshold
+            )
+            dense_windows = report1['dense_windows']
+            report2['dense_windows'] = dense_windows
+            report2['windows_saved'] = dense_windows - report2['windows_evaluated']
+            report2['saved_fraction'] = report2['windows_saved'] / dense_windows if dense_windows else 0.0
+            label_map2 = GridMap.from_windows(
+                shape1, positions1, labels2, confidences2, window_size, stride
+            )
+            print(f"Skipped {report2['tiles_skipped']} of {report2['tiles_total']} unchanged tiles")
+        elif roi is not None:
+            positions2, labels2, confidences2, report2 = self._classify(
+                image2, window_size, stride, adaptive, refine_threshold, roi_mask
+            )
+            label_map2 = GridMap.from_windows(
+                shape1, positions2, labels2, confidences2, window_size, stride
+            )
+        else:
+            label_map2, image2, report2 = self._predict_grid(
+                image2_path, window_size, stride, adaptive, refine_threshold, scale
+            )
+        
+        self._report_progress({'event': 'image_classified', 'stage': 'image2', 'report': report2})
+        del positions1, labels1, confidences1
+        
+        # Make sure images have the same shape
+        if image2.shape != shape1:
+            # Resize second image to match first
+            image2 = cv2.resize(image2, (shape1[1], shape1[0]))
+            label_map2 = label_map2.resample(shape1, label_map1.cell_size)
+        
+        results = self._compare_in_roi(label_map1, label_map2, roi_mask)
+        results.update({
+            'image1': image1,
+            'image2': image2,
+            'label_map1': label_map1,
+            'label_map2': label_map2,
+            'scale': scale,
+            'native_shape': tuple(int(round(d / scale)) for d in shape1[:2]),
+            'roi_box': self._native_box(roi_box, scale),
+            'inference_report': {'image1': report1, 'image2': report2}
+        })
+        return results
+
+    def _compare_in_roi(self, label_map1, label_map2, roi_mask=None):
+        """
+        compare_label_maps restricted to a region of interest
+        
+        Cells outside the ROI are set to no-data in both maps and partially
+        covered cells count with the covered fraction of their area.
+        
+        Returns:
+            dict: compare_label_maps results plus 'roi_coverage' (None without ROI)
+        """
+        coverage = None
+        if roi_mask is not None:
+            coverage = label_map1.coverage(roi_mask)
+            label_map1.mask_outside(coverage)
+            label_map2.mask_outside(coverage)
+        results = self.compare_label_maps(label_map1, label_map2, coverage)
+        results['roi_coverage'] = coverage
+        return results
+
+    def _native_box(self, box, scale):
+        """
+        Convert a crop box at inference scale to native pixels
+        """
+        if box is None:
+            return None
+        return tuple(int(round(v / scale)) for v in box)
+
+    def detect_changes_from_maps(self, image1_path, image2_path, label_map1, label_map2, roi=None):
+        """
+        Build detect_changes results from grid maps classified earlier
         
+        No inference runs; the images are only decoded for rendering and are
+        brought to the shape the maps cover.
+        
+        Args:
+            image1_path (str): Path to first image
+            image2_path (str): Path to second image
+            label_map1 (GridMap): Stored map of the first image
+            label_map2 (GridMap): Stored map of the second image
+            roi: Region of interest in native pixels, see detect_changes; the
+                maps and images are cropped to it
+            
+        Returns:
+            dict: Change detection results in the format of detect_changes
+        """
+        shape = label_map1.image_shape
+        image1 = self._load_image(image1_path)
+        image2 = self._load_image(image2_path)
+        native_shape = image1.shape[:2]
+        scale = shape[0] / native_shape[0]
+        
+        if label_map2.image_shape != shape or label_map2.cell_size != label_map1.cell_size:
+            label_map2 = label_map2.resample(shape, label_map1.cell_size)
+        
+        roi_box = roi_mask = None
+        if roi is not None:
+            roi_box, roi_mask = self._roi_region(roi, shape, scale, align=label_map1.cell_size)
+            label_map1, label_map2 = label_map1.crop(roi_box), label_map2.crop(roi_box)
+        
+        images = []
+        for image in (image1, image2):
+            if image.shape[:2] != shape:
+                image = cv2.resize(image, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+            if roi_box is not None:
+                image = image[roi_box[1]:roi_box[3], roi_box[0]:roi_box[2]].copy()
+            images.append(image)
+        
+        results = self._compare_in_roi(label_map1, label_map2, roi_mask)
+        results.update({
+            'image1': images[0],
+            'image2': images[1],
+            'label_map1': label_map1,
+            'label_map2': label_map2,
+            'scale': scale,
+            'native_shape': tuple(native_shape) if roi_box is None else
+                            tuple(int(round(d / scale)) for d in label_map1.image_shape),
+            'roi_box': self._native_box(roi_box, scale),
+            'inference_report': {'image1': {'mode': 'precomputed'}, 'image2': {'mode': 'precomputed'}}
+        })
+        return results
+
+    def change_map_bands(self, results, band_rows=CHANGE_MAP_BAND_ROWS):
+        """
+        Expand the change grid of a result to a cleaned-up pixel change map,
+        one band of rows at a time
+        
+        Each band is expanded from the grid together with CHANGE_MAP_HALO rows
+        above and below, so the opening and closing give exactly the pixels of
+        a full-image pass. The expansion and the morphology run in place in
+        buffers allocated once per call.
+        
+        Args:
+            results (dict): Output of detect_changes
+            band_rows (int): Rows per band
+            
+        Yields:
+            tuple: (y0, y1, band) where band holds rows y0:y1 of the uint8
+            change map, 255 where the class changed. The band is a view of a
+            buffer that the next band overwrites; copy it to keep it.
+        """
+        label_map = results['label_map1']
+        cell = label_map.cell_size
+        height, width = label_map.image_shape
+        grid = results['change_grid'].astype(np.uint8) * np.uint8(255)
+        kernel = np.ones((CHANGE_MAP_KERNEL, CHANGE_MAP_KERNEL), np.uint8)
+        
+        band_rows = max(min(band_rows, height), 1)
+        pixel_rows = np.arange(height) // cell
+        pixel_cols = np.arange(width) // cell
+        # Grid rows expanded to full width, and the pixel rows of one band with its halo
+        grid_buffer = np.empty(((band_rows + 2 * CHANGE_MAP_HALO) // cell + 2, width), dtype=np.uint8)
+        band_buffer = np.empty((band_rows + 2 * CHANGE_MAP_HALO, width), dtype=np.uint8)
+        
+        for y0 in range(0, height, band_rows):
+            y1 = min(y0 + band_rows, height)
+            top, bottom = max(y0 - CHANGE_MAP_HALO, 0), min(y1 + CHANGE_MAP_HALO, height)
+            first_row, last_row = pixel_rows[top], pixel_rows[bottom - 1] + 1
+            
+            cells = grid_buffer[:last_row - first_row]
+            np.take(grid[first_row:last_row], pixel_cols, axis=1, out=cells, mode='clip')
+            band = band_buffer[:bottom - top]
+            np.take(cells, pixel_rows[top:bottom] - first_row, axis=0, out=band, mode='clip')
+            
+            # Use morphological operations to clean up the change map
+            cv2.morphologyEx(band, cv2.MORPH_OPEN, kernel, dst=band)
+            cv2.morphologyEx(band, cv2.MORPH_CLOSE, kernel, dst=band)
+            yield y0, y1, band[y0 - top:y1 - top]
+    
+    def expand_change_map(self, results, packed=False, band_rows=CHANGE_MAP_BAND_ROWS):
+        """
+        Expand the change grid of a result to a cleaned-up pixel change map
+        
+        The map is built in row bands (see change_map_bands), so apart from
+        the result only one band is held at a time.
+        
+        Args:
+            results (dict): Output of detect_changes
+            packed (bool): Return the mask bit-packed, 8 pixels per byte along
+                rows (an eighth of the memory); see unpack_change_mask
+            band_rows (int): Rows processed per band
+            
+        Returns:
+            numpy.ndarray: uint8 change map, 255 where the class changed, or
+            the (height, ceil(width / 8)) packed mask
+        """
+        height, width = results['label_map1'].image_shape
+        if packed:
+            change_map = np.empty((height, -(-width // 8)), dtype=np.uint8)
+        else:
+            change_map = np.empty((height, width), dtype=np.uint8)
+        
+        for y0, y1, band in self.change_map_bands(results, band_rows):
+            change_map[y0:y1] = np.packbits(band, axis=1) if packed else band
+        return change_map
+
+    def tile_layers(self, results):
+        """
+        Pixel layers of a result for a tile pyramid (see tile_pyramid.py)
+        
+        Args:
+            results (dict): Output of detect_changes
+            
+        Returns:
+            dict: 'before' and 'after' images (RGB), 'classes_before' and
+            'classes_after' class maps (RGBA, no-data transparent) and
+            'changes' (RGBA, translucent red where the class changed)
+        """
+        palette = np.zeros((256, 4), dtype=np.uint8)
         for i, class_name in enumerate(self.classes):
-            class_map1_rgb[results['class_map1'] == i] = self.class_colors[class_name]
-            class_map2_rgb[results['class_map2'] == i] = self.class_colors[class_name]
+            palette[i] = (*self.class_colors[class_name], 255)
         
-        # Create change highlight overlay (using red for all changes)
-        change_overlay = np.zeros_like(results['image2'])
-        change_overlay[results['change_map'] > 0] = [255, 0, 0]  # Red for changes
+        changes = np.zeros((*results['label_map1'].image_shape, 4), dtype=np.uint8)
+        for y0, y1, band in self.change_map_bands(results):
+            changes[y0:y1][band > 0] = [255, 0, 0, 160]
         
-        # Combine with second image
+        return {
+            'before': results['image1'],
+            'after': results['image2'],
+            'classes_before': results['label_map1'].expand(palette[results['label_map1'].classes]),
+            'classes_after': results['label_map2'].expand(palette[results['label_map2'].classes]),
+            'changes': changes
+        }
+
+    def generate_change_visualization(self, results, output_path):
+        # Figures are built without pyplot's global state, so concurrent
+        # analyses can render from several threads
+        from matplotlib.figure import Figure
+        from matplotlib.lines import Line2D
+        
+        label_map1, label_map2 = results['label_map1'], results['label_map2']
+        
+        # Create color-coded class maps, colored on the grid and expanded afterwards
+        palette = np.zeros((256, 3), dtype=np.uint8)
+        for i, class_name in enumerate(self.classes):
+            palette[i] = self.class_colors[class_name]
+        class_map1_rgb = label_map1.expand(palette[label_map1.classes])
+        
+        # Highlight changes in red on the second image, one band of the change map at a time
         alpha = 0.5
-        change_highlighted = cv2.addWeighted(results['image2'], 1, change_overlay, alpha, 0)
+        change_highlighted = results['image2'].copy()
+        for y0, y1, band in self.change_map_bands(results):
+            change_overlay = np.zeros_like(change_highlighted[y0:y1])
+            change_overlay[band > 0] = [255, 0, 0]  # Red for changes
+            cv2.addWeighted(results['image2'][y0:y1], 1, change_overlay, alpha, 0, dst=change_highlighted[y0:y1])
         
         # Generate visualization
-        plt.figure(figsize=(20, 15))
+        fig = Figure(figsize=(20, 15))
         
         # Original images
-        plt.subplot(2, 2, 1)
-        plt.title('Initial Image', fontsize=12)
-        plt.imshow(results['image1'])
-        plt.axis('off')
+        ax = fig.add_subplot(2, 2, 1)
+        ax.set_title('Initial Image', fontsize=12)
+        ax.imshow(results['image1'])
+        ax.axis('off')
         
-        plt.subplot(2, 2, 2)
-        plt.title('Recent Image', fontsize=12)
-        plt.imshow(results['image2'])
-        plt.axis('off')
+        ax = fig.add_subplot(2, 2, 2)
+        ax.set_title('Recent Image', fontsize=12)
+        ax.imshow(results['image2'])
+        ax.axis('off')
         
         # Classification results
-        plt.subplot(2, 2, 3)
-        plt.title('Land Use Classification - Initial', fontsize=12)
-        plt.imshow(class_map1_rgb)
-        plt.axis('off')
+        ax = fig.add_subplot(2, 2, 3)
+        ax.set_title('Land Use Classification - Initial', fontsize=12)
+        ax.imshow(class_map1_rgb)
+        ax.axis('off')
         
         # Create a legend for classes
         legend_elements = []
         for class_name, color in self.class_colors.items():
             color_normalized = [c/255 for c in color]
-            legend_elements.append(plt.Line2D([0], [0], marker='s', color='w', 
+            legend_elements.append(Line2D([0], [0], marker='s', color='w', 
                                 markerfacecolor=color_normalized, markersize=10, label=class_name))
         
-        plt.legend(handles=legend_elements, loc='lower right', fontsize=8)
+        ax.legend(handles=legend_elements, loc='lower right', fontsize=8)
         
         # Change detection results
-        plt.subplot(2, 2, 4)
-        plt.title('Land Use Changes with Percentages', fontsize=12)
-        plt.imshow(change_highlighted)
-        plt.axis('off')
+        ax = fig.add_subplot(2, 2, 4)
+        ax.set_title('Land Use Changes with Percentages', fontsize=12)
+        ax.imshow(change_highlighted)
+        ax.axis('off')
         
         # Add change percentages in small text in the right corner
-        ax = plt.gca()
         text_box = ""
         for change_data in sorted(results['change_percentages'], key=lambda x: x['class']):
             sign = "+" if change_data['change'] > 0 else ""
@@ -268,21 +1562,21 @@ class HighResolutionChangeDetector:
                 verticalalignment='bottom', horizontalalignment='right',
                 bbox=props)
         
-        plt.tight_layout()
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
-        plt.close()
+        fig.tight_layout()
+        fig.savefig(output_path, **SAVEFIG_OPTIONS)
 
         # Create a specialized visualization highlighting deforestation, urbanization, and water body changes
-        plt.figure(figsize=(15, 10))
+        fig = Figure(figsize=(15, 10))
         
         # Create a new axis for the image
-        ax = plt.gca()
-        plt.title('Critical Environmental Changes', fontsize=16)
+        ax = fig.add_subplot()
+        ax.set_title('Critical Environmental Changes', fontsize=16)
         
-        # Create a mask for each critical change type
-        deforestation_mask = np.zeros_like(results['change_map'], dtype=bool)
-        urbanization_mask = np.zeros_like(results['change_map'], dtype=bool)
-        water_change_mask = np.zeros_like(results['change_map'], dtype=bool)
+        # Create a mask for each critical change type, at grid resolution
+        classes1, classes2 = label_map1.classes, label_map2.classes
+        deforestation_grid = np.zeros(label_map1.shape, dtype=bool)
+        urbanization_grid = np.zeros(label_map1.shape, dtype=bool)
+        water_change_grid = np.zeros(label_map1.shape, dtype=bool)
         
         # Identify the class indices for forest, urban, and water classes
         forest_indices = [i for i, class_name in enumerate(self.classes) if 'forest' in class_name.lower()]
@@ -293,22 +1587,36 @@ class HighResolutionChangeDetector:
         for i in forest_indices:
             for j in range(len(self.classes)):
                 if i != j and j not in forest_indices:
-                    deforestation_mask |= (results['class_map1'] == i) & (results['class_map2'] == j)
+                    deforestation_grid |= (classes1 == i) & (classes2 == j)
         
         # Detect urbanization (non-urban to urban)
         for i in range(len(self.classes)):
             for j in urban_indices:
                 if i != j and i not in urban_indices:
-                    urbanization_mask |= (results['class_map1'] == i) & (results['class_map2'] == j)
+                    urbanization_grid |= (classes1 == i) & (classes2 == j)
         
         # Detect water body changes (water to non-water or non-water to water)
         for i in range(len(self.classes)):
             for j in range(len(self.classes)):
                 if (i in water_indices and j not in water_indices) or (i not in water_indices and j in water_indices):
-                    water_change_mask |= (results['class_map1'] == i) & (results['class_map2'] == j)
+                    water_change_grid |= (classes1 == i) & (classes2 == j)
+        
+        # Calculate critical change percentages from cell areas, within the ROI if any,
+        # relative to the area valid in both images like the class distributions
+        areas = label_map1.cell_areas()
+        if results.get('roi_coverage') is not None:
+            areas = areas * results['roi_coverage']
+        valid_area = max(results['valid_area'], 1)
+        deforestation_percent = areas[deforestation_grid].sum() / valid_area * 100
+        urbanization_percent = areas[urbanization_grid].sum() / valid_area * 100
+        water_change_percent = areas[water_change_grid].sum() / valid_area * 100
+        
+        deforestation_mask = label_map1.expand(deforestation_grid)
+        urbanization_mask = label_map1.expand(urbanization_grid)
+        water_change_mask = label_map1.expand(water_change_grid)
         
         # Create a combined RGB image to highlight different change types
-        critical_changes = np.zeros((*results['change_map'].shape, 3), dtype=np.uint8)
+        critical_changes = np.zeros((*label_map1.image_shape, 3), dtype=np.uint8)
         critical_changes[deforestation_mask] = [255, 150, 150]  # Lighter red for deforestation
         critical_changes[urbanization_mask] = [200, 150, 255]  # Light purple for urbanization
         critical_changes[water_change_mask] = [150, 150, 255]  # Lighter blue for water changes
@@ -317,25 +1625,26 @@ class HighResolutionChangeDetector:
         alpha = 0.5  # Reduced alpha for lighter overlay
         overlay = results['image2'].copy()
         mask = deforestation_mask | urbanization_mask | water_change_mask
-        overlay[mask] = cv2.addWeighted(results['image2'][mask], 1-alpha, critical_changes[mask], alpha, 0)
+        if mask.any():
+            overlay[mask] = cv2.addWeighted(results['image2'][mask], 1-alpha, critical_changes[mask], alpha, 0)
         
         # Display the image
-        plt.imshow(overlay)
-        plt.axis('off')
+        ax.imshow(overlay)
+        ax.axis('off')
         
         # Create legend
         legend_elements = [
-            plt.Line2D([0], [0], marker='s', color='w', markerfacecolor=(1, 0.59, 0.59), markersize=10, label='Deforestation'),
-            plt.Line2D([0], [0], marker='s', color='w', markerfacecolor=(0.78, 0.59, 1), markersize=10, label='Urbanization'),
-            plt.Line2D([0], [0], marker='s', color='w', markerfacecolor=(0.59, 0.59, 1), markersize=10, label='Water Body Changes')
+            Line2D([0], [0], marker='s', color='w', markerfacecolor=(1, 0.59, 0.59), markersize=10, label='Deforestation'),
+            Line2D([0], [0], marker='s', color='w', markerfacecolor=(0.78, 0.59, 1), markersize=10, label='Urbanization'),
+            Line2D([0], [0], marker='s', color='w', markerfacecolor=(0.59, 0.59, 1), markersize=10, label='Water Body Changes')
         ]
-        plt.legend(handles=legend_elements, loc='lower right', fontsize=10)
+        ax.legend(handles=legend_elements, loc='lower right', fontsize=10)
         
         # Add statistics in a text box
         stats_text = (
-            f"Deforestation: {np.sum(deforestation_mask) / deforestation_mask.size * 100:.2f}%\n"
-            f"Urbanization: {np.sum(urbanization_mask) / urbanization_mask.size * 100:.2f}%\n"
-            f"Water Changes: {np.sum(water_change_mask) / water_change_mask.size * 100:.2f}%"
+            f"Deforestation: {deforestation_percent:.2f}%\n"
+            f"Urbanization: {urbanization_percent:.2f}%\n"
+            f"Water Changes: {water_change_percent:.2f}%"
         )
         
         props = dict(boxstyle='round', facecolor='white', alpha=0.7)
@@ -345,13 +1654,7 @@ class HighResolutionChangeDetector:
         
         # Save the critical changes map
         critical_map_path = os.path.splitext(output_path)[0] + "_critical_changes.jpg"
-        plt.savefig(critical_map_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        # Calculate critical change percentages
-        deforestation_percent = np.sum(deforestation_mask) / deforestation_mask.size * 100
-        urbanization_percent = np.sum(urbanization_mask) / urbanization_mask.size * 100
-        water_change_percent = np.sum(water_change_mask) / water_change_mask.size * 100
+        fig.savefig(critical_map_path, **SAVEFIG_OPTIONS)
         
         # Add critical changes to the results
         critical_changes = {
@@ -403,6 +1706,12 @@ def main():
     print(f"Full visualization saved to: {vis_path}")
     print(f"Change map saved to: {change_map_path}")
     
+    # Summary of inference cost
+    print("\nWindows classified:")
+    for name, report in results['inference_report'].items():
+        print(f"- {name}: {report['windows_evaluated']} of {report['dense_windows']} dense windows "
+              f"({report['saved_fraction'] * 100:.1f}% saved, {report['mode']} mode)")
+    
     # Summary of changes
     print("\nSummary of changes:")
     for change in results['change_percentages']:
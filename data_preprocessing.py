@@ -1,12 +1,78 @@
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # Add this before importing tensorflow
+import json
+import shutil
+import hashlib
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-from tensorflow.keras.utils import to_categorical
-import splitfolders
 import cv2
 
+# TensorFlow is only imported by the generator and tf.data methods, so loading
+# and packing samples with NumPy starts without it
+
+# Split names and shares, as used by split_dataset
+SPLITS = ('train', 'val', 'test')
+SPLIT_RATIO = (0.7, 0.2, 0.1)
+SPLIT_SEED = 42
+
+# Training augmentation, in ImageDataGenerator terms; the tf.data pipelines
+# build the equivalent preprocessing layers from it
+AUGMENTATION = {
+    'rotation_range': 20,
+    'width_shift_range': 0.2,
+    'height_shift_range': 0.2,
+    'shear_range': 0.2,
+    'zoom_range': 0.2,
+    'horizontal_flip': True
+}
+
+def one_hot(labels, num_classes):
+    """
+    One-hot encode class indices, like keras.utils.to_categorical
+    
+    Args:
+        labels (numpy.ndarray): Class index per sample
+        num_classes (int): Number of classes
+    
+    Returns:
+        numpy.ndarray: float32 array of shape (len(labels), num_classes)
+    """
+    return np.eye(num_classes, dtype=np.float32)[np.asarray(labels, dtype=np.int64)]
+
+def stable_split(key, ratio=SPLIT_RATIO, seed=SPLIT_SEED):
+    """
+    Assign a sample to a split from a hash of its name
+    
+    Unlike a shuffled split, the split of a sample doesn't depend on the other
+    samples, so adding files never moves existing ones between splits.
+    
+    Args:
+        key (str): Sample name, e.g. '<class>/<file>'
+        ratio (tuple): Shares of the train, val and test splits
+        seed (int): Changes the assignment as a whole
+    
+    Returns:
+        str: 'train', 'val' or 'test'
+    """
+    digest = hashlib.sha1(f"{seed}:{key}".encode()).digest()
+    position = int.from_bytes(digest[:8], 'big') / 2**64
+    bound = 0.0
+    for split, share in zip(SPLITS, ratio):
+        bound += share
+        if position < bound:
+            return split
+    return SPLITS[-1]
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Returns:
+        str: SHA-256 hex digest of a file's content
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 class EuroSATDataProcessor:
     def __init__(self, dataset_path, img_size=(64, 64), test_split=0.2):
         """
@@ -30,11 +96,13 @@ class EuroSATDataProcessor:
         """
         Split dataset into train, validation, and test sets
         """
+        import splitfolders
+        
         splitfolders.ratio(
             self.dataset_path, 
             output=output_path, 
-            seed=42, 
-            ratio=(0.7, 0.2, 0.1)
+            seed=SPLIT_SEED, 
+            ratio=SPLIT_RATIO
         )
 
     def load_and_preprocess_data(self, data_path):
@@ -66,40 +134,478 @@ class EuroSATDataProcessor:
 
         return (
             np.array(images), 
-            to_categorical(np.array(labels), num_classes=len(self.classes))
+            one_hot(np.array(labels), len(self.classes))
         )
 
-    def create_data_generators(self, train_path, val_path):
+    def list_samples(self, data_path):
+        """
+        List image files and their class indices
+        
+        Returns:
+            list: (img_path, class_idx) tuples
+        """
+        samples = []
+        for class_idx, class_name in enumerate(self.classes):
+            class_path = os.path.join(data_path, class_name)
+            
+            for img_name in sorted(os.listdir(class_path)):
+                samples.append((os.path.join(class_path, img_name), class_idx))
+        
+        return samples
+
+    def read_image(self, img_path):
+        """
+        Read an image as RGB uint8 at the processor's image size
+        
+        Returns:
+            numpy.ndarray: Image, or None if the file can't be decoded
+        """
+        img = cv2.imread(img_path)
+        if img is None:
+            return None
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return cv2.resize(img, self.img_size)
+
+    def iter_batches(self, data_path, batch_size=256):
+        """
+        Stream preprocessed images in batches with bounded memory
+        
+        Args:
+            data_path (str): Directory with one sub-folder per class
+            batch_size (int): Number of images per batch
+            
+        Yields:
+            tuple: (images, labels) with float32 images in [0, 1] and integer
+            labels; files that can't be decoded are left out, so a batch may
+            be smaller than ``batch_size``
+        """
+        samples = self.list_samples(data_path)
+        
+        for start in range(0, len(samples), batch_size):
+            chunk = samples[start:start + batch_size]
+            images = np.empty((len(chunk), self.img_size[1], self.img_size[0], 3), dtype=np.float32)
+            labels = []
+            
+            for img_path, class_idx in chunk:
+                img = self.read_image(img_path)
+                if img is None:
+                    print(f"Could not decode {img_path}, skipping it")
+                    continue
+                images[len(labels)] = img
+                labels.append(class_idx)
+            
+            if not labels:
+                continue
+            images = images[:len(labels)]
+            images /= 255.0
+            yield images, np.array(labels)
+
+    def create_data_generators(self, train_path, val_path, batch_size=32):
         """
         Create data generators with augmentation
         
         Returns:
             tuple: (train_generator, validation_generator)
         """
-        train_datagen = ImageDataGenerator(
-            rescale=1./255,
-            rotation_range=20,
-            width_shift_range=0.2,
-            height_shift_range=0.2,
-            shear_range=0.2,
-            zoom_range=0.2,
-            horizontal_flip=True
-        )
+        from tensorflow.keras.preprocessing.image import ImageDataGenerator
+        
+        train_datagen = ImageDataGenerator(rescale=1./255, **AUGMENTATION)
 
         validation_datagen = ImageDataGenerator(rescale=1./255)
 
         train_generator = train_datagen.flow_from_directory(
             train_path,
             target_size=self.img_size,
-            batch_size=32,
+            batch_size=batch_size,
             class_mode='categorical'
         )
 
         validation_generator = validation_datagen.flow_from_directory(
             val_path,
             target_size=self.img_size,
-            batch_size=32,
+            batch_size=batch_size,
             class_mode='categorical'
         )
 
-        return train_generator, validation_generator
\ No newline at end of file
+        return train_generator, validation_generator
+
+    def create_datasets(self, train_path, val_path, batch_size=32, shard=False):
+        """
+        Create tf.data pipelines with the same augmentation as the generators
+        
+        Unlike ImageDataGenerator, tf.data pipelines can be sharded across the
+        workers of a tf.distribute strategy.
+        
+        Args:
+            train_path (str): Path to training split
+            val_path (str): Path to validation split
+            batch_size (int): Global batch size
+            shard (bool): Shard the datasets by element across workers
+        
+        Returns:
+            tuple: (train_dataset, validation_dataset)
+        """
+        import tensorflow as tf
+        
+        def load(path, shuffle):
+            return tf.keras.utils.image_dataset_from_directory(
+                path,
+                labels='inferred',
+                label_mode='categorical',
+                class_names=self.classes,
+                image_size=self.img_size,
+                batch_size=batch_size,
+                shuffle=shuffle,
+                seed=42
+            )
+
+        normalize = lambda x, y: (x / 255.0, y)
+        train_dataset = load(train_path, shuffle=True).map(normalize, num_parallel_calls=tf.data.AUTOTUNE)
+        validation_dataset = load(val_path, shuffle=False).map(normalize, num_parallel_calls=tf.data.AUTOTUNE)
+        
+        return self._finish_datasets(train_dataset, validation_dataset, shard)
+
+    def create_array_generators(self, train_data, val_data, batch_size=32):
+        """
+        Create data generators over preprocessed arrays, such as the splits
+        of a DatasetIndex, with the same augmentation as create_data_generators
+        
+        Args:
+            train_data (tuple): (images, labels) of the training split
+            val_data (tuple): (images, labels) of the validation split
+            batch_size (int): Batch size
+        
+        Returns:
+            tuple: (train_generator, validation_generator)
+        """
+        from tensorflow.keras.preprocessing.image import ImageDataGenerator
+        
+        # The arrays are already scaled to [0, 1]
+        train_generator = ImageDataGenerator(**AUGMENTATION).flow(
+            *train_data, batch_size=batch_size, shuffle=True, seed=42
+        )
+        validation_generator = ImageDataGenerator().flow(
+            *val_data, batch_size=batch_size, shuffle=False
+        )
+        
+        return train_generator, validation_generator
+
+    def create_array_datasets(self, train_data, val_data, batch_size=32, shard=False):
+        """
+        Create tf.data pipelines over preprocessed arrays, such as the splits
+        of a DatasetIndex, with the same augmentation as create_datasets
+        
+        Args:
+            train_data (tuple): (images, labels) of the training split
+            val_data (tuple): (images, labels) of the validation split
+            batch_size (int): Global batch size
+            shard (bool): Shard the datasets by element across workers
+        
+        Returns:
+            tuple: (train_dataset, validation_dataset)
+        """
+        import tensorflow as tf
+        
+        train_dataset = tf.data.Dataset.from_tensor_slices(train_data).shuffle(
+            len(train_data[0]), seed=42, reshuffle_each_iteration=True
+        ).batch(batch_size)
+        validation_dataset = tf.data.Dataset.from_tensor_slices(val_data).batch(batch_size)
+        
+        return self._finish_datasets(train_dataset, validation_dataset, shard)
+
+    def _finish_datasets(self, train_dataset, validation_dataset, shard):
+        """Augment, shard and prefetch batched datasets of images in [0, 1]"""
+        import tensorflow as tf
+        
+        augmentation = tf.keras.Sequential([
+            tf.keras.layers.RandomRotation(AUGMENTATION['rotation_range'] / 360),
+            tf.keras.layers.RandomTranslation(AUGMENTATION['height_shift_range'], AUGMENTATION['width_shift_range']),
+            tf.keras.layers.RandomZoom(AUGMENTATION['zoom_range']),
+            tf.keras.layers.RandomFlip('horizontal')
+        ])
+        
+        train_dataset = train_dataset.map(
+            lambda x, y: (augmentation(x, training=True), y),
+            num_parallel_calls=tf.data.AUTOTUNE
+        )
+        
+        if shard:
+            options = tf.data.Options()
+            options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.DATA
+            train_dataset = train_dataset.with_options(options)
+            validation_dataset = validation_dataset.with_options(options)
+        
+        return (
+            train_dataset.prefetch(tf.data.AUTOTUNE),
+            validation_dataset.prefetch(tf.data.AUTOTUNE)
+        )
+
+class DatasetIndex:
+    """
+    Incremental index of the labeled samples in ``<dataset>/<class>/``
+    
+    Every file is tracked by its content hash and keeps the split it was
+    first given: the one it already sits in under the split directory, or
+    stable_split otherwise. A refresh only hashes files whose size or
+    modification time changed, and only decodes and copies new or changed
+    files, so its cost follows the size of the addition rather than the
+    size of the dataset.
+    
+    Decoded images are kept as uint8 in append-only shards
+    (``<store>/shard_<n>.npy``) and the index (``<store>/index.json``)
+    points every file at its row. Rows of changed or removed files stay
+    behind until compact() rewrites the store. Files that can't be decoded
+    stay in the index without a row, keeping their split for the next try.
+    """
+    def __init__(self, processor, store_path='./dataset/store', split_path='./dataset/split'):
+        """
+        Args:
+            processor (EuroSATDataProcessor): Gives the dataset path, classes and image size
+            store_path (str): Directory of the index and the decoded shards
+            split_path (str): Split directory kept in sync, as used for training
+        """
+        self.processor = processor
+        self.store_path = store_path
+        self.split_path = split_path
+        self.index_path = os.path.join(store_path, 'index.json')
+        self.files = {}
+        self.next_shard = 0
+        
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                index = json.load(f)
+            self.files = index['files']
+            self.next_shard = index['next_shard']
+            if tuple(index['img_size']) != tuple(processor.img_size):
+                # Splits stay, but every image is decoded again at the new size
+                print(f"Image size changed to {processor.img_size}, all samples will be decoded again")
+                for entry in self.files.values():
+                    entry['shard'] = entry['row'] = None
+
+    def _existing_split(self, class_name, name):
+        for split in SPLITS:
+            if os.path.exists(os.path.join(self.split_path, split, class_name, name)):
+                return split
+        return None
+
+    def _write_shard(self, images):
+        """
+        Store decoded images as a new shard
+        
+        Returns:
+            int: Shard number
+        """
+        shard = self.next_shard
+        self.next_shard += 1
+        path = os.path.join(self.store_path, f"shard_{shard}.npy")
+        with open(f"{path}.tmp", 'wb') as f:
+            np.save(f, images)
+        os.replace(f"{path}.tmp", path)
+        return shard
+
+    def save(self):
+        """
+        Write the index atomically
+        """
+        os.makedirs(self.store_path, exist_ok=True)
+        index = {
+            'img_size': list(self.processor.img_size),
+            'next_shard': self.next_shard,
+            'files': self.files
+        }
+        with open(f"{self.index_path}.tmp", 'w') as f:
+            json.dump(index, f)
+        os.replace(f"{self.index_path}.tmp", self.index_path)
+
+    def refresh(self, shard_size=4096):
+        """
+        Bring the index, the store and the split directory up to date
+        
+        Args:
+            shard_size (int): Maximum number of images per new shard
+        
+        Returns:
+            dict: Keys ('<class>/<file>') that were 'added', 'changed',
+            'removed' or 'failed' to decode, the number of 'unchanged'
+            files, the number of images 'decoded' and the sample count per
+            split ('splits')
+        """
+        report = {'added': [], 'changed': [], 'removed': [], 'failed': [], 'unchanged': 0, 'decoded': 0}
+        pending = []
+        seen = set()
+        
+        for class_name in self.processor.classes:
+            class_path = os.path.join(self.processor.dataset_path, class_name)
+            if not os.path.isdir(class_path):
+                continue
+            
+            for name in sorted(os.listdir(class_path)):
+                key = f"{class_name}/{name}"
+                path = os.path.join(class_path, name)
+                stat = os.stat(path)
+                seen.add(key)
+                entry = self.files.get(key)
+                
+                # Unchanged size and modification time: skip without reading the file
+                if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                    if entry['shard'] is None:
+                        pending.append((key, path, entry))
+                    else:
+                        report['unchanged'] += 1
+                    continue
+                
+                sha256 = file_hash(path)
+                if entry is None:
+                    split = self._existing_split(class_name, name) or stable_split(key)
+                    entry = self.files[key] = {'class': class_name, 'split': split, 'sha256': sha256,
+                                               'shard': None, 'row': None}
+                    report['added'].append(key)
+                elif entry['sha256'] != sha256:
+                    entry.update(sha256=sha256, shard=None, row=None)
+                    report['changed'].append(key)
+                elif entry['shard'] is not None:
+                    # Touched but identical
+                    report['unchanged'] += 1
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                if entry['shard'] is None:
+                    pending.append((key, path, entry))
+        
+        # Removed files leave the index and the split directory
+        for key in sorted(set(self.files) - seen):
+            entry = self.files.pop(key)
+            split_file = os.path.join(self.split_path, entry['split'], key)
+            if os.path.exists(split_file):
+                os.remove(split_file)
+            report['removed'].append(key)
+        
+        # Decode new and changed files into new shards and copy them into their split
+        os.makedirs(self.store_path, exist_ok=True)
+        for start in range(0, len(pending), shard_size):
+            chunk = pending[start:start + shard_size]
+            images, entries = [], []
+            for key, path, entry in chunk:
+                split_file = os.path.join(self.split_path, entry['split'], key)
+                img = self.processor.read_image(path)
+                if img is None:
+                    # Kept without a row, so the next refresh tries it again and
+                    # reuses the recorded split rather than assigning a new one
+                    print(f"Could not decode {path}, skipping it")
+                    entry['failed'] = True
+                    for changes in (report['added'], report['changed']):
+                        if key in changes:
+                            changes.remove(key)
+                    report['failed'].append(key)
+                    if os.path.exists(split_file):
+                        os.remove(split_file)
+                    continue
+                entry.pop('failed', None)
+                images.append(img)
+                entries.append(entry)
+                
+                os.makedirs(os.path.dirname(split_file), exist_ok=True)
+                shutil.copy2(path, split_file)
+            
+            if images:
+                shard = self._write_shard(np.stack(images))
+                for row, entry in enumerate(entries):
+                    entry.update(shard=shard, row=row)
+                report['decoded'] += len(images)
+        
+        self.save()
+        
+        report['splits'] = {split: 0 for split in SPLITS}
+        for entry in self.files.values():
+            if entry['shard'] is not None:
+                report['splits'][entry['split']] += 1
+        print(f"Dataset index: {len(report['added'])} added, {len(report['changed'])} changed, "
+              f"{len(report['removed'])} removed, {len(report['failed'])} failed, {report['unchanged']} unchanged, "
+              f"{report['decoded']} decoded; "
+              + ", ".join(f"{split} {count}" for split, count in report['splits'].items()))
+        return report
+
+    def load_split(self, split):
+        """
+        Load a split from the store, without decoding any JPEG
+        
+        Args:
+            split (str): 'train', 'val' or 'test'
+        
+        Returns:
+            tuple: (images, labels) as returned by load_and_preprocess_data
+        """
+        images, labels = self._read_rows(self.split_keys(split))
+        return images, one_hot(labels, len(self.processor.classes))
+
+    def iter_batches(self, split, batch_size=256):
+        """
+        Stream a split from the store in batches with bounded memory
+        
+        Args:
+            split (str): 'train', 'val' or 'test'
+            batch_size (int): Number of images per batch
+        
+        Yields:
+            tuple: (images, labels) as yielded by EuroSATDataProcessor.iter_batches
+        """
+        keys = self.split_keys(split)
+        
+        for start in range(0, len(keys), batch_size):
+            yield self._read_rows(keys[start:start + batch_size])
+
+    def split_keys(self, split):
+        """Keys of the stored files in a split, in a stable order"""
+        return sorted(key for key, entry in self.files.items()
+                      if entry['split'] == split and entry['shard'] is not None)
+
+    def _read_rows(self, keys):
+        """Read the stored rows of some files as float32 images in [0, 1] and integer labels"""
+        images = np.empty((len(keys), self.processor.img_size[1], self.processor.img_size[0], 3), dtype=np.float32)
+        labels = np.empty(len(keys), dtype=np.int64)
+        
+        by_shard = {}
+        for i, key in enumerate(keys):
+            entry = self.files[key]
+            by_shard.setdefault(entry['shard'], []).append((i, entry['row']))
+            labels[i] = self.processor.classes.index(entry['class'])
+        
+        for shard, rows in by_shard.items():
+            # Memory-mapped, so only the requested rows are read
+            data = np.load(os.path.join(self.store_path, f"shard_{shard}.npy"), mmap_mode='r')
+            positions, shard_rows = zip(*rows)
+            images[list(positions)] = data[list(shard_rows)]
+        
+        images /= 255.0
+        return images, labels
+
+    def compact(self, shard_size=4096):
+        """
+        Rewrite the store without the rows of changed or removed files
+        
+        Run it after refresh(), which leaves every file that could be decoded
+        with a stored row.
+        """
+        keys = sorted(key for key, entry in self.files.items() if entry['shard'] is not None)
+        old_shards = [name for name in os.listdir(self.store_path)
+                      if name.startswith('shard_') and name.endswith('.npy')]
+        shards = {}
+        
+        for start in range(0, len(keys), shard_size):
+            chunk = keys[start:start + shard_size]
+            rows = []
+            for key in chunk:
+                entry = self.files[key]
+                if entry['shard'] not in shards:
+                    shards[entry['shard']] = np.load(
+                        os.path.join(self.store_path, f"shard_{entry['shard']}.npy"), mmap_mode='r'
+                    )
+                rows.append(shards[entry['shard']][entry['row']])
+            images = np.stack(rows)
+            shard = self._write_shard(images)
+            for row, key in enumerate(chunk):
+                self.files[key].update(shard=shard, row=row)
+        
+        # The new index has to be in place before the old shards go
+        self.save()
+        shards.clear()
+        for name in old_shards:
+            os.remove(os.path.join(self.store_path, name))
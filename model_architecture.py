@@ -1,18 +1,269 @@
-import tensorflow as tf
-from tensorflow.keras import layers, models, optimizers
+import os
+import functools
+
+# TensorFlow is imported inside the functions that build, train or load
+# models, so the variant registry and model_variant_path work without it
+
+def _scaled(filters, width_multiplier):
+    """
+    Scale a filter count by a width multiplier, keeping at least 8 filters
+    """
+    return max(8, int(round(filters * width_multiplier)))
+
+def build_baseline(input_shape, num_classes):
+    """
+    Original 3-block CNN with a Flatten -> Dense(256) head
+    
+    Args:
+        input_shape (tuple): Input image dimensions
+        num_classes (int): Number of land cover classes
+    
+    Returns:
+        tf.keras.Model: Uncompiled model
+    """
+    from tensorflow.keras import layers, models
+    
+    return models.Sequential([
+        # First Convolutional Block
+        layers.Conv2D(32, (3, 3), activation='relu', input_shape=input_shape),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+        layers.Dropout(0.25),
+
+        # Second Convolutional Block
+        layers.Conv2D(64, (3, 3), activation='relu'),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+        layers.Dropout(0.25),
+
+        # Third Convolutional Block
+        layers.Conv2D(128, (3, 3), activation='relu'),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+        layers.Dropout(0.25),
+
+        # Flatten and Dense Layers
+        layers.Flatten(),
+        layers.Dense(256, activation='relu'),
+        layers.BatchNormalization(),
+        layers.Dropout(0.5),
+
+        # Output Layer
+        layers.Dense(num_classes, activation='softmax')
+    ])
+
+def build_gap(input_shape, num_classes, width_multiplier=1.0):
+    """
+    Baseline conv blocks with a global average pooling head
+    
+    The Flatten -> Dense(256) head holds most of the baseline's parameters;
+    pooling the last feature map first removes nearly all of them.
+    
+    Args:
+        input_shape (tuple): Input image dimensions
+        num_classes (int): Number of land cover classes
+        width_multiplier (float): Scale factor for the number of filters
+    
+    Returns:
+        tf.keras.Model: Uncompiled model
+    """
+    from tensorflow.keras import layers, models
+    
+    return models.Sequential([
+        layers.Conv2D(_scaled(32, width_multiplier), (3, 3), activation='relu', input_shape=input_shape),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+        layers.Dropout(0.25),
+
+        layers.Conv2D(_scaled(64, width_multiplier), (3, 3), activation='relu'),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+        layers.Dropout(0.25),
+
+        layers.Conv2D(_scaled(128, width_multiplier), (3, 3), activation='relu'),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+        layers.Dropout(0.25),
+
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.3),
+        layers.Dense(num_classes, activation='softmax')
+    ])
+
+def build_separable(input_shape, num_classes, width_multiplier=1.0):
+    """
+    Depthwise-separable conv blocks with a global average pooling head
+    
+    The first block keeps a regular convolution (it only sees 3 channels);
+    later blocks use SeparableConv2D, which costs roughly 1/9 of the FLOPs of a
+    3x3 convolution of the same width.
+    
+    Args:
+        input_shape (tuple): Input image dimensions
+        num_classes (int): Number of land cover classes
+        width_multiplier (float): Scale factor for the number of filters
+    
+    Returns:
+        tf.keras.Model: Uncompiled model
+    """
+    from tensorflow.keras import layers, models
+    
+    return models.Sequential([
+        layers.Conv2D(_scaled(32, width_multiplier), (3, 3), activation='relu', input_shape=input_shape),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+
+        layers.SeparableConv2D(_scaled(64, width_multiplier), (3, 3), activation='relu'),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+
+        layers.SeparableConv2D(_scaled(128, width_multiplier), (3, 3), activation='relu'),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+        layers.Dropout(0.25),
+
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.3),
+        layers.Dense(num_classes, activation='softmax')
+    ])
+
+# Registered model variants, selectable by name at training and inference time
+MODEL_VARIANTS = {
+    'baseline': build_baseline,
+    'gap': build_gap,
+    'gap_0.5': functools.partial(build_gap, width_multiplier=0.5),
+    'separable': build_separable,
+    'separable_0.5': functools.partial(build_separable, width_multiplier=0.5),
+    'separable_0.25': functools.partial(build_separable, width_multiplier=0.25)
+}
+
+def model_variant_path(variant='baseline', models_dir='./models'):
+    """
+    File path of a trained model variant
+    
+    The baseline keeps the historical file name so existing deployments pick it
+    up unchanged; other variants are stored next to it with a name suffix.
+    
+    Args:
+        variant (str): Name registered in MODEL_VARIANTS
+        models_dir (str): Directory holding the trained models
+    
+    Returns:
+        str: Path to the variant's .keras file
+    """
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model variant '{variant}'. Available: {', '.join(MODEL_VARIANTS)}")
+    if variant == 'baseline':
+        return os.path.join(models_dir, 'change_detection.keras')
+    return os.path.join(models_dir, f'change_detection_{variant}.keras')
+
+@functools.lru_cache(maxsize=None)
+def _distiller_class():
+    """
+    Define Distiller on first use; it subclasses tf.keras.Model
+    """
+    import tensorflow as tf
+    
+    class Distiller(tf.keras.Model):
+        """
+        Train a student model to match a teacher's softened predictions
+        
+        The loss mixes the cross-entropy on the true labels with the KL divergence
+        between temperature-softened teacher and student distributions. Both models
+        end in a softmax, so the probabilities are softened through their logs.
+        """
+
+        def __init__(self, student, teacher, temperature=4.0, alpha=0.1):
+            """
+            Args:
+                student (tf.keras.Model): Model being trained
+                teacher (tf.keras.Model): Trained model providing soft targets
+                temperature (float): Softening temperature
+                alpha (float): Weight of the hard-label loss
+            """
+            super().__init__()
+            self.student = student
+            self.teacher = teacher
+            self.teacher.trainable = False
+            self.temperature = temperature
+            self.alpha = alpha
+            self.loss_tracker = tf.keras.metrics.Mean(name='loss')
+            self.accuracy_tracker = tf.keras.metrics.CategoricalAccuracy(name='accuracy')
+
+        @property
+        def metrics(self):
+            return [self.loss_tracker, self.accuracy_tracker]
+
+        def call(self, inputs, training=False):
+            return self.student(inputs, training=training)
+
+        def _soften(self, probabilities):
+            return tf.nn.softmax(tf.math.log(probabilities + 1e-7) / self.temperature)
+
+        def train_step(self, data):
+            x, y = data
+            teacher_probs = self.teacher(x, training=False)
+
+            with tf.GradientTape() as tape:
+                student_probs = self.student(x, training=True)
+                hard_loss = tf.keras.losses.categorical_crossentropy(y, student_probs)
+                soft_loss = tf.keras.losses.kl_divergence(
+                    self._soften(teacher_probs), self._soften(student_probs)
+                ) * self.temperature ** 2
+                loss = tf.reduce_mean(self.alpha * hard_loss + (1 - self.alpha) * soft_loss)
+
+            gradients = tape.gradient(loss, self.student.trainable_variables)
+            self.optimizer.apply_gradients(zip(gradients, self.student.trainable_variables))
+
+            self.loss_tracker.update_state(loss)
+            self.accuracy_tracker.update_state(y, student_probs)
+            return {metric.name: metric.result() for metric in self.metrics}
+
+        def test_step(self, data):
+            x, y = data
+            student_probs = self.student(x, training=False)
+            loss = tf.reduce_mean(tf.keras.losses.categorical_crossentropy(y, student_probs))
+
+            self.loss_tracker.update_state(loss)
+            self.accuracy_tracker.update_state(y, student_probs)
+            return {metric.name: metric.result() for metric in self.metrics}
+    
+    return Distiller
+
+def __getattr__(name):
+    # model_architecture.Distiller still works, defined when first accessed
+    if name == 'Distiller':
+        return _distiller_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class EuroSATChangeDetectionModel:
-    def __init__(self, input_shape=(64, 64, 3), num_classes=8):
+    def __init__(self, input_shape=(64, 64, 3), num_classes=8, learning_rate=1e-4, strategy=None,
+                 variant='baseline'):
         """
         Initialize Change Detection Model
         
         Args:
             input_shape (tuple): Input image dimensions
             num_classes (int): Number of land cover classes (updated to 8)
+            learning_rate (float): Initial Adam learning rate
+            strategy (tf.distribute.Strategy): Distribution strategy whose scope
+                the model and optimizer are created in, or None for a single process
+            variant (str): Architecture name registered in MODEL_VARIANTS
         """
+        if variant not in MODEL_VARIANTS:
+            raise ValueError(f"Unknown model variant '{variant}'. Available: {', '.join(MODEL_VARIANTS)}")
+        
         self.input_shape = input_shape
         self.num_classes = num_classes
-        self.model = self.build_model()
+        self.learning_rate = learning_rate
+        self.strategy = strategy
+        self.variant = variant
+        
+        if strategy is not None:
+            with strategy.scope():
+                self.model = self.build_model()
+        else:
+            self.model = self.build_model()
 
     def build_model(self):
         """
@@ -21,45 +272,20 @@ class EuroSATChangeDetectionModel:
         Returns:
             tf.keras.Model: Compiled neural network
         """
-        model = models.Sequential([
-            # First Convolutional Block
-            layers.Conv2D(32, (3, 3), activation='relu', input_shape=self.input_shape),
-            layers.BatchNormalization(),
-            layers.MaxPooling2D((2, 2)),
-            layers.Dropout(0.25),
-
-            # Second Convolutional Block
-            layers.Conv2D(64, (3, 3), activation='relu'),
-            layers.BatchNormalization(),
-            layers.MaxPooling2D((2, 2)),
-            layers.Dropout(0.25),
-
-            # Third Convolutional Block
-            layers.Conv2D(128, (3, 3), activation='relu'),
-            layers.BatchNormalization(),
-            layers.MaxPooling2D((2, 2)),
-            layers.Dropout(0.25),
-
-            # Flatten and Dense Layers
-            layers.Flatten(),
-            layers.Dense(256, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dropout(0.5),
-
-            # Output Layer
-            layers.Dense(self.num_classes, activation='softmax')
-        ])
+        from tensorflow.keras import optimizers
+        
+        model = MODEL_VARIANTS[self.variant](self.input_shape, self.num_classes)
 
         # Compile Model
         model.compile(
-            optimizer=optimizers.Adam(learning_rate=1e-4),
+            optimizer=optimizers.Adam(learning_rate=self.learning_rate),
             loss='categorical_crossentropy',
             metrics=['accuracy']
         )
 
         return model
 
-    def train(self, train_generator, validation_generator, epochs=50):
+    def train(self, train_generator, validation_generator, epochs=50, backup_dir=None):
         """
         Train the change detection model
         
@@ -67,10 +293,15 @@ class EuroSATChangeDetectionModel:
             train_generator (ImageDataGenerator): Training data generator
             validation_generator (ImageDataGenerator): Validation data generator
             epochs (int): Number of training epochs
+            backup_dir (str): Directory for per-epoch checkpoints of the weights,
+                optimizer state and epoch counter. An interrupted run started
+                again with the same directory resumes from the last epoch.
         
         Returns:
             History of model training
         """
+        import tensorflow as tf
+        
         early_stopping = tf.keras.callbacks.EarlyStopping(
             monitor='val_loss', 
             patience=25, 
@@ -83,15 +314,115 @@ class EuroSATChangeDetectionModel:
             patience=5
         )
 
+        callbacks = [early_stopping, reduce_lr]
+        if backup_dir:
+            callbacks.append(tf.keras.callbacks.BackupAndRestore(backup_dir, save_freq='epoch'))
+
         history = self.model.fit(
             train_generator,
             validation_data=validation_generator,
             epochs=epochs,
-            callbacks=[early_stopping, reduce_lr]
+            callbacks=callbacks
         )
 
         return history
 
+    def distill(self, teacher, train_generator, validation_generator, epochs=30,
+                temperature=4.0, alpha=0.1, backup_dir=None):
+        """
+        Train this model as a student of an already trained teacher
+        
+        Args:
+            teacher (tf.keras.Model): Trained model providing soft targets
+            train_generator (ImageDataGenerator): Training data generator
+            validation_generator (ImageDataGenerator): Validation data generator
+            epochs (int): Number of training epochs
+            temperature (float): Softening temperature
+            alpha (float): Weight of the hard-label loss
+            backup_dir (str): Directory for per-epoch checkpoints
+        
+        Returns:
+            History of model training
+        """
+        import tensorflow as tf
+        
+        def build_distiller():
+            distiller = _distiller_class()(self.model, teacher, temperature, alpha)
+            distiller.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=self.learning_rate))
+            return distiller
+        
+        # The optimizer's variables must be created under the strategy, like the model's
+        if self.strategy is not None:
+            with self.strategy.scope():
+                distiller = build_distiller()
+        else:
+            distiller = build_distiller()
+
+        callbacks = [
+            tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True),
+            tf.keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=5)
+        ]
+        if backup_dir:
+            callbacks.append(tf.keras.callbacks.BackupAndRestore(backup_dir, save_freq='epoch'))
+
+        return distiller.fit(
+            train_generator,
+            validation_data=validation_generator,
+            epochs=epochs,
+            callbacks=callbacks
+        )
+
+    def conv_blocks(self):
+        """
+        Group the model's layers into convolutional blocks
+        
+        A block starts at a Conv2D layer and runs up to the next one, so block 0
+        is Conv2D -> BatchNormalization -> MaxPooling2D -> Dropout of the first
+        stage. Layers after the last block's pooling stage (the dense head) are
+        not part of any block.
+        
+        Returns:
+            list: One list of layers per block
+        """
+        from tensorflow.keras import layers
+        
+        blocks = []
+        for layer in self.model.layers:
+            if isinstance(layer, (layers.Conv2D, layers.SeparableConv2D)):
+                blocks.append([layer])
+            elif isinstance(layer, (layers.Flatten, layers.GlobalAveragePooling2D, layers.Dense)):
+                break
+            elif blocks:
+                blocks[-1].append(layer)
+        return blocks
+
+    def prepare_fine_tuning(self, freeze_blocks=(), learning_rate=1e-5):
+        """
+        Freeze selected convolutional blocks and recompile for fine-tuning
+        
+        Frozen BatchNormalization layers keep their moving statistics, so the
+        features of the frozen blocks stay exactly as they were.
+        
+        Args:
+            freeze_blocks (iterable): Indices of the blocks from conv_blocks() to freeze
+            learning_rate (float): Learning rate for the remaining trainable layers
+        """
+        from tensorflow.keras import optimizers
+        
+        blocks = self.conv_blocks()
+        for index in freeze_blocks:
+            if not 0 <= index < len(blocks):
+                raise ValueError(f"Model has {len(blocks)} conv blocks, cannot freeze block {index}")
+            for layer in blocks[index]:
+                layer.trainable = False
+
+        self.learning_rate = learning_rate
+        self.model.compile(
+            optimizer=optimizers.Adam(learning_rate=learning_rate),
+            loss='categorical_crossentropy',
+            metrics=['accuracy']
+        )
+
     def save_model(self, filepath='./models/change_detection.keras'):
         """
         Save trained model weights
@@ -108,4 +439,10 @@ class EuroSATChangeDetectionModel:
         Args:
             filepath (str): Path to load model
         """
-        self.model = tf.keras.models.load_model(filepath)
\ No newline at end of file
+        import tensorflow as tf
+        
+        if self.strategy is not None:
+            with self.strategy.scope():
+                self.model = tf.keras.models.load_model(filepath)
+        else:
+            self.model = tf.keras.models.load_model(filepath)
\ No newline at end of file
@@ -0,0 +1,137 @@
+import os
+import csv
+import time
+import argparse
+import importlib.util
+import numpy as np
+from model_architecture import MODEL_VARIANTS, model_variant_path
+from data_preprocessing import EuroSATDataProcessor
+
+# test.py shares its name with the standard library's test package, which
+# ``import test`` can resolve to, so it is loaded from its path instead
+_spec = importlib.util.spec_from_file_location(
+    'eurosat_test', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test.py')
+)
+_evaluation = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_evaluation)
+stream_evaluate = _evaluation.stream_evaluate
+
+def measure_latency(model, batch_size=128, repeats=20, input_shape=(64, 64, 3)):
+    """
+    Measure the median latency of one predict batch
+    
+    Args:
+        model (tf.keras.Model): Model to benchmark
+        batch_size (int): Windows per batch, as used by the change detector
+        repeats (int): Number of timed batches
+        input_shape (tuple): Window shape
+    
+    Returns:
+        tuple: (median batch latency in ms, windows per second)
+    """
+    windows = np.random.default_rng(0).random((batch_size,) + input_shape, dtype=np.float32)
+    
+    # Warm-up call so graph tracing is not timed
+    model.predict_on_batch(windows)
+    
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_on_batch(windows)
+        timings.append(time.perf_counter() - start)
+    
+    median = float(np.median(timings))
+    return median * 1000, batch_size / median
+
+def benchmark_variants(models_dir='./models', test_data_path='./dataset/split/test',
+                       batch_size=128, variants=None, store_path=None):
+    """
+    Build a latency/accuracy table for every trained model variant
+    
+    Args:
+        models_dir (str): Directory holding the trained variants
+        test_data_path (str): Test split used for accuracy, skipped if missing
+        batch_size (int): Windows per batch for the latency measurement
+        variants (list): Variant names to include, defaults to all registered ones
+        store_path (str): Dataset index store whose test split is used for
+            accuracy instead of ``test_data_path``
+    
+    Returns:
+        list: One dict per trained variant
+    """
+    import tensorflow as tf
+    
+    data_processor = EuroSATDataProcessor(dataset_path=None)
+    rows = []
+    
+    for name in variants or MODEL_VARIANTS:
+        path = model_variant_path(name, models_dir)
+        if not os.path.exists(path):
+            print(f"Skipping {name}: no trained model at {path}")
+            continue
+        
+        print(f"Benchmarking {name}...")
+        model = tf.keras.models.load_model(path)
+        latency_ms, throughput = measure_latency(model, batch_size)
+        
+        row = {
+            'variant': name,
+            'parameters': model.count_params(),
+            'batch_latency_ms': round(latency_ms, 2),
+            'windows_per_second': round(throughput, 1),
+            'accuracy': None
+        }
+        if store_path or (test_data_path and os.path.exists(test_data_path)):
+            evaluation = stream_evaluate(model, data_processor, test_data_path, store_path=store_path)
+            row['accuracy'] = round(float(evaluation['accuracy']), 4)
+        rows.append(row)
+    
+    return rows
+
+def write_report(rows, output_dir='./results'):
+    """
+    Save the benchmark table as CSV and Markdown
+    
+    Returns:
+        tuple: (csv_path, markdown_path)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    columns = ['variant', 'parameters', 'batch_latency_ms', 'windows_per_second', 'accuracy']
+    
+    csv_path = os.path.join(output_dir, 'model_zoo.csv')
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    
+    markdown_path = os.path.join(output_dir, 'model_zoo.md')
+    with open(markdown_path, 'w') as f:
+        f.write('| ' + ' | '.join(columns) + ' |\n')
+        f.write('|' + '---|' * len(columns) + '\n')
+        for row in rows:
+            f.write('| ' + ' | '.join('-' if row[c] is None else str(row[c]) for c in columns) + ' |\n')
+    
+    return csv_path, markdown_path
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare latency and accuracy of the trained model variants')
+    parser.add_argument('--models-dir', default='./models')
+    parser.add_argument('--test-data-path', default='./dataset/split/test')
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--variants', nargs='*', choices=list(MODEL_VARIANTS), default=None)
+    parser.add_argument('--store-path', default=None,
+                        help='Measure accuracy on the test split of this dataset index store')
+    args = parser.parse_args()
+    
+    rows = benchmark_variants(args.models_dir, args.test_data_path, args.batch_size, args.variants, args.store_path)
+    csv_path, markdown_path = write_report(rows)
+    
+    print("\nModel zoo:")
+    for row in rows:
+        accuracy = '-' if row['accuracy'] is None else f"{row['accuracy']:.4f}"
+        print(f"- {row['variant']}: {row['parameters']:,} params, {row['batch_latency_ms']:.1f} ms/batch, "
+              f"{row['windows_per_second']:.0f} windows/s, accuracy {accuracy}")
+    print(f"\nTable saved to {csv_path} and {markdown_path}")
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,175 @@
 import os
+import heapq
+import argparse
 import numpy as np
-import tensorflow as tf
-import matplotlib.pyplot as plt
-from tensorflow.keras.models import load_model
-from data_preprocessing import EuroSATDataProcessor
-from sklearn.metrics import classification_report, confusion_matrix
-import seaborn as sns
+from data_preprocessing import EuroSATDataProcessor, DatasetIndex
+
+# TensorFlow, matplotlib and seaborn are imported by the functions that need
+# them, so importing stream_evaluate (e.g. from model_zoo.py) stays cheap
+
+def _per_class_metrics(cm, classes):
+    """
+    Derive precision, recall and F1 per class from a confusion matrix
+    
+    Args:
+        cm (numpy.ndarray): Confusion matrix, rows are true classes
+        classes (list): Class names
+    
+    Returns:
+        dict: Report in the layout of sklearn's classification_report(output_dict=True)
+    """
+    true_positives = np.diag(cm).astype(np.float64)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.nan_to_num(true_positives / predicted)
+        recall = np.nan_to_num(true_positives / support)
+        f1 = np.nan_to_num(2 * precision * recall / (precision + recall))
+    
+    report = {}
+    for i, cls in enumerate(classes):
+        report[cls] = {
+            'precision': precision[i],
+            'recall': recall[i],
+            'f1-score': f1[i],
+            'support': int(support[i])
+        }
+    
+    total = max(int(support.sum()), 1)
+    report['accuracy'] = true_positives.sum() / total
+    report['macro avg'] = {
+        'precision': precision.mean(),
+        'recall': recall.mean(),
+        'f1-score': f1.mean(),
+        'support': int(support.sum())
+    }
+    report['weighted avg'] = {
+        'precision': np.sum(precision * support) / total,
+        'recall': np.sum(recall * support) / total,
+        'f1-score': np.sum(f1 * support) / total,
+        'support': int(support.sum())
+    }
+    return report
+
+def _format_classification_report(report, classes):
+    """
+    Render a per-class report as a text table
+    """
+    width = max(len(name) for name in classes + ['weighted avg'])
+    lines = [f"{'':>{width}} {'precision':>9} {'recall':>9} {'f1-score':>9} {'support':>9}", ""]
+    for name in classes:
+        row = report[name]
+        lines.append(f"{name:>{width}} {row['precision']:>9.2f} {row['recall']:>9.2f} "
+                     f"{row['f1-score']:>9.2f} {row['support']:>9}")
+    lines.append("")
+    total = report['macro avg']['support']
+    lines.append(f"{'accuracy':>{width}} {'':>9} {'':>9} {report['accuracy']:>9.2f} {total:>9}")
+    for name in ['macro avg', 'weighted avg']:
+        row = report[name]
+        lines.append(f"{name:>{width}} {row['precision']:>9.2f} {row['recall']:>9.2f} "
+                     f"{row['f1-score']:>9.2f} {row['support']:>9}")
+    return "\n".join(lines) + "\n"
+
+def _keep_extremes(heap, candidates, k, largest):
+    """
+    Maintain a bounded heap of the k highest (or lowest) confidence examples
+    
+    Args:
+        heap (list): Heap of (key, counter, example) tuples
+        candidates (list): (confidence, counter, example) tuples
+        k (int): Number of examples to keep
+        largest (bool): Keep the highest confidences instead of the lowest
+    """
+    for confidence, counter, example in candidates:
+        key = confidence if largest else -confidence
+        if len(heap) < k:
+            heapq.heappush(heap, (key, counter, example))
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, (key, counter, example))
+
+def test_batches(data_processor, test_data_path, batch_size=256, store_path=None):
+    """
+    Stream the test split in batches
+    
+    Args:
+        data_processor (EuroSATDataProcessor): Processor used to read the test set
+        test_data_path (str): Path to test data
+        batch_size (int): Number of images per batch
+        store_path (str): Dataset index store to read the decoded test split
+            from instead of decoding the images under ``test_data_path``
+    
+    Returns:
+        iterator: (images, labels) batches as yielded by EuroSATDataProcessor.iter_batches
+    """
+    if store_path:
+        return DatasetIndex(data_processor, store_path).iter_batches('test', batch_size)
+    return data_processor.iter_batches(test_data_path, batch_size)
+
+def stream_evaluate(model, data_processor, test_data_path, batch_size=256, num_examples=5, store_path=None):
+    """
+    Evaluate a model with one forward pass over the test set in batches
+    
+    Only one batch of images is held in memory at a time. Loss, accuracy and the
+    confusion matrix are accumulated per batch, and only the ``num_examples``
+    lowest and highest confidence examples are retained for visualization.
+    
+    Args:
+        model (tf.keras.Model): Trained classifier
+        data_processor (EuroSATDataProcessor): Processor used to read the test set
+        test_data_path (str): Path to test data
+        batch_size (int): Number of images per forward pass
+        num_examples (int): Number of lowest/highest confidence examples to keep
+        store_path (str): Dataset index store to read the test split from
+    
+    Returns:
+        dict: loss, accuracy, confusion_matrix, class distribution and the
+        retained examples as (image, true_class, pred_class, confidence) tuples
+    """
+    num_classes = len(data_processor.classes)
+    cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+    loss_sum = 0.0
+    seen = 0
+    lowest, highest = [], []
+    epsilon = 1e-7
+    
+    for images, labels in test_batches(data_processor, test_data_path, batch_size, store_path):
+        y_pred = np.asarray(model.predict_on_batch(images))
+        y_pred_classes = np.argmax(y_pred, axis=1)
+        confidence_scores = np.max(y_pred, axis=1)
+        
+        # Categorical cross-entropy of the true class
+        true_probs = np.clip(y_pred[np.arange(len(labels)), labels], epsilon, 1 - epsilon)
+        loss_sum += float(-np.log(true_probs).sum())
+        np.add.at(cm, (labels, y_pred_classes), 1)
+        
+        # Only the batch's own extremes can enter the global top/bottom k
+        order = np.argsort(confidence_scores)
+        for indices, heap, largest in [(order[:num_examples], lowest, False),
+                                       (order[-num_examples:], highest, True)]:
+            _keep_extremes(heap, [
+                (float(confidence_scores[i]), seen + int(i),
+                 (images[i].copy(), int(labels[i]), int(y_pred_classes[i]), float(confidence_scores[i])))
+                for i in indices
+            ], num_examples, largest)
+        
+        seen += len(labels)
+    
+    return {
+        'loss': loss_sum / max(seen, 1),
+        'accuracy': np.trace(cm) / max(seen, 1),
+        'confusion_matrix': cm,
+        'lowest_confidence': [entry[2] for entry in sorted(lowest, key=lambda e: -e[0])],
+        'highest_confidence': [entry[2] for entry in sorted(highest, key=lambda e: e[0])],
+        'num_samples': seen
+    }
 
 def evaluate_model_accuracy(
     model_path='./models/change_detection.keras',
     test_data_path='./dataset/split/test',
-    img_size=(64, 64)
+    img_size=(64, 64),
+    batch_size=256,
+    store_path=None
 ):
     """
     Evaluate the trained model on test data
@@ -19,10 +178,16 @@ def evaluate_model_accuracy(
         model_path (str): Path to the trained model
         test_data_path (str): Path to test data
         img_size (tuple): Image dimensions
+        batch_size (int): Number of images per forward pass
+        store_path (str): Dataset index store to read the test split from
     
     Returns:
         dict: Evaluation metrics
     """
+    from tensorflow.keras.models import load_model
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    
     # Make sure directories exist
     os.makedirs('./evaluation_results', exist_ok=True)
     
@@ -33,29 +198,14 @@ def evaluate_model_accuracy(
     # Initialize data processor
     data_processor = EuroSATDataProcessor(dataset_path=None, img_size=img_size)
     
-    # Load test data
-    print(f"Loading test data from {test_data_path}...")
-    X_test, y_test = data_processor.load_and_preprocess_data(test_data_path)
-    
-    # Evaluate model
-    print("Evaluating model on test data...")
-    test_loss, test_accuracy = model.evaluate(X_test, y_test, verbose=1)
-    
-    # Get predictions
-    y_pred = model.predict(X_test)
-    y_pred_classes = np.argmax(y_pred, axis=1)
-    y_true_classes = np.argmax(y_test, axis=1)
+    # Evaluate model in a single streaming pass
+    print(f"Evaluating model on test data from {store_path or test_data_path}...")
+    evaluation = stream_evaluate(model, data_processor, test_data_path, batch_size, store_path=store_path)
+    test_loss, test_accuracy = evaluation['loss'], evaluation['accuracy']
+    cm = evaluation['confusion_matrix']
     
     # Calculate class-wise performance
-    class_report = classification_report(
-        y_true_classes, 
-        y_pred_classes, 
-        target_names=data_processor.classes,
-        output_dict=True
-    )
-    
-    # Create confusion matrix
-    cm = confusion_matrix(y_true_classes, y_pred_classes)
+    class_report = _per_class_metrics(cm, data_processor.classes)
     
     # Plot confusion matrix
     plt.figure(figsize=(10, 8))
@@ -97,35 +247,21 @@ def evaluate_model_accuracy(
     plt.tight_layout()
     plt.savefig('./evaluation_results/class_performance.png', dpi=300)
     
-    # Analyze examples with highest confidence and lowest confidence
-    confidence_scores = np.max(y_pred, axis=1)
-    
-    # Sort by confidence
-    sorted_indices = np.argsort(confidence_scores)
-    lowest_conf_indices = sorted_indices[:5]  # 5 lowest confidence predictions
-    highest_conf_indices = sorted_indices[-5:]  # 5 highest confidence predictions
-    
-    # Create a visualization of these examples
+    # Visualize the examples with lowest and highest confidence
     plt.figure(figsize=(15, 8))
     
     # Plot lowest confidence examples
-    for i, idx in enumerate(lowest_conf_indices):
+    for i, (image, true_idx, pred_idx, conf) in enumerate(evaluation['lowest_confidence']):
         plt.subplot(2, 5, i+1)
-        plt.imshow(X_test[idx])
-        true_class = classes[y_true_classes[idx]]
-        pred_class = classes[y_pred_classes[idx]]
-        conf = confidence_scores[idx]
-        plt.title(f"True: {true_class}\nPred: {pred_class}\nConf: {conf:.2f}", fontsize=8)
+        plt.imshow(image)
+        plt.title(f"True: {classes[true_idx]}\nPred: {classes[pred_idx]}\nConf: {conf:.2f}", fontsize=8)
         plt.axis('off')
     
     # Plot highest confidence examples
-    for i, idx in enumerate(highest_conf_indices):
+    for i, (image, true_idx, pred_idx, conf) in enumerate(evaluation['highest_confidence']):
         plt.subplot(2, 5, i+6)
-        plt.imshow(X_test[idx])
-        true_class = classes[y_true_classes[idx]]
-        pred_class = classes[y_pred_classes[idx]]
-        conf = confidence_scores[idx]
-        plt.title(f"True: {true_class}\nPred: {pred_class}\nConf: {conf:.2f}", fontsize=8)
+        plt.imshow(image)
+        plt.title(f"True: {classes[true_idx]}\nPred: {classes[pred_idx]}\nConf: {conf:.2f}", fontsize=8)
         plt.axis('off')
     
     plt.suptitle('Lowest (top) and Highest (bottom) Confidence Predictions')
@@ -140,13 +276,13 @@ def evaluate_model_accuracy(
         f.write(f"Test Loss: {test_loss:.4f}\n\n")
         f.write(f"Classification Report:\n")
         f.write(f"--------------------\n")
-        f.write(classification_report(y_true_classes, y_pred_classes, target_names=classes))
+        f.write(_format_classification_report(class_report, classes))
         
         # Add class distribution
         f.write(f"\nClass Distribution in Test Set:\n")
         for i, cls in enumerate(classes):
-            count = np.sum(y_true_classes == i)
-            percentage = count / len(y_true_classes) * 100
+            count = int(cm[i].sum())
+            percentage = count / max(evaluation['num_samples'], 1) * 100
             f.write(f"{cls}: {count} ({percentage:.2f}%)\n")
     
     # Print summary
@@ -163,26 +299,130 @@ def evaluate_model_accuracy(
         'confusion_matrix': cm
     }
 
+def calibrate_cascade_threshold(
+    fast_model_path,
+    full_model_path='./models/change_detection.keras',
+    test_data_path='./dataset/split/test',
+    thresholds=None,
+    tolerance=0.005,
+    img_size=(64, 64),
+    batch_size=256,
+    store_path=None
+):
+    """
+    Sweep the confidence threshold of a fast/full model cascade on the test set
+    
+    Both models are run once over every test batch. For each threshold, windows
+    whose fast-model confidence falls below it take the full model's answer,
+    which gives the cascade accuracy and escalation rate without re-running
+    anything.
+    
+    Args:
+        fast_model_path (str): Path to the fast first-stage model
+        full_model_path (str): Path to the full model
+        test_data_path (str): Path to test data
+        thresholds (list): Thresholds to evaluate, defaults to 0.50-0.99
+        tolerance (float): Accuracy the cascade may lose against the full model
+        img_size (tuple): Image dimensions
+        batch_size (int): Number of images per forward pass
+        store_path (str): Dataset index store to read the test split from
+    
+    Returns:
+        dict: Per-threshold table, full/fast model accuracy and the recommended
+        threshold (lowest escalation rate within ``tolerance`` of the full model)
+    """
+    from tensorflow.keras.models import load_model
+    
+    if thresholds is None:
+        thresholds = np.round(np.arange(0.50, 1.0, 0.01), 2)
+    
+    fast_model = load_model(fast_model_path)
+    full_model = load_model(full_model_path)
+    data_processor = EuroSATDataProcessor(dataset_path=None, img_size=img_size)
+    
+    fast_confidences, fast_correct, full_correct = [], [], []
+    for images, labels in test_batches(data_processor, test_data_path, batch_size, store_path):
+        fast_pred = np.asarray(fast_model.predict_on_batch(images))
+        full_pred = np.asarray(full_model.predict_on_batch(images))
+        fast_confidences.append(np.max(fast_pred, axis=1))
+        fast_correct.append(np.argmax(fast_pred, axis=1) == labels)
+        full_correct.append(np.argmax(full_pred, axis=1) == labels)
+    
+    fast_confidences = np.concatenate(fast_confidences)
+    fast_correct = np.concatenate(fast_correct)
+    full_correct = np.concatenate(full_correct)
+    full_accuracy = float(full_correct.mean())
+    
+    table = []
+    for threshold in thresholds:
+        escalated = fast_confidences < threshold
+        table.append({
+            'threshold': float(threshold),
+            'escalation_rate': float(escalated.mean()),
+            'accuracy': float(np.where(escalated, full_correct, fast_correct).mean())
+        })
+    
+    acceptable = [row for row in table if row['accuracy'] >= full_accuracy - tolerance]
+    recommended = min(acceptable, key=lambda row: row['escalation_rate']) if acceptable else table[-1]
+    
+    return {
+        'table': table,
+        'full_accuracy': full_accuracy,
+        'fast_accuracy': float(fast_correct.mean()),
+        'recommended': recommended
+    }
+
 def main():
     """
     Main execution function
     """
+    parser = argparse.ArgumentParser(description='Evaluate the trained model on the test split')
+    parser.add_argument('--model-path', default='./models/change_detection.keras')
+    parser.add_argument('--test-data-path', default='./dataset/split/test')
+    parser.add_argument('--calibrate-cascade', metavar='FAST_MODEL_PATH', default=None,
+                        help='Sweep the cascade threshold for this fast model against --model-path')
+    parser.add_argument('--tolerance', type=float, default=0.005,
+                        help='Accuracy the cascade may lose against the full model')
+    parser.add_argument('--store-path', default=None,
+                        help='Evaluate on the test split of this dataset index store (train_model.py --incremental)')
+    args = parser.parse_args()
+    
     # Check if model exists
-    model_path = './models/change_detection.keras'
-    test_data_path = './dataset/split/test'
+    model_path = args.model_path
+    test_data_path = args.test_data_path
     
     if not os.path.exists(model_path):
         print("Model not found. Please run train_model.py first.")
         return
     
-    if not os.path.exists(test_data_path):
+    if args.store_path and not os.path.exists(os.path.join(args.store_path, 'index.json')):
+        print("Dataset index not found. Please run train_model.py --incremental first.")
+        return
+    
+    if not args.store_path and not os.path.exists(test_data_path):
         print("Test data not found. Please run train_model.py first to split the dataset.")
         return
     
+    if args.calibrate_cascade:
+        calibration = calibrate_cascade_threshold(
+            args.calibrate_cascade, model_path, test_data_path,
+            tolerance=args.tolerance, store_path=args.store_path
+        )
+        print(f"Full model accuracy: {calibration['full_accuracy']:.4f}")
+        print(f"Fast model accuracy: {calibration['fast_accuracy']:.4f}")
+        print("\nThreshold  Escalation  Accuracy")
+        for row in calibration['table']:
+            print(f"{row['threshold']:>9.2f}  {row['escalation_rate'] * 100:>9.1f}%  {row['accuracy']:.4f}")
+        best = calibration['recommended']
+        print(f"\nRecommended cascade threshold: {best['threshold']:.2f} "
+              f"({best['escalation_rate'] * 100:.1f}% escalated, accuracy {best['accuracy']:.4f})")
+        return
+    
     # Evaluate model accuracy
     metrics = evaluate_model_accuracy(
         model_path=model_path,
-        test_data_path=test_data_path
+        test_data_path=test_data_path,
+        store_path=args.store_path
     )
     
     # Calculate per-class accuracy from confusion matrix
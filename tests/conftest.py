@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules are run from the repository root and from _backend rather than installed
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, '_backend')]
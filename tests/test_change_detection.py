@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+import pytest
+from change_detection import (
+    GridMap, HighResolutionChangeDetector, NO_DATA_CLASS,
+    CHANGE_MAP_BAND_ROWS, CHANGE_MAP_KERNEL, unpack_change_mask
+)
+
+def _label_map(classes, cell_size=16):
+    classes = np.asarray(classes, dtype=np.uint8)
+    confidences = np.full(classes.shape, 255, dtype=np.uint8)
+    return GridMap(classes, confidences, cell_size, (classes.shape[0] * cell_size, classes.shape[1] * cell_size))
+
+def test_percentages_use_area_valid_in_both_maps(tmp_path):
+    detector = HighResolutionChangeDetector(load_model=False)
+    crop, forest, residential = (detector.classes.index(name) for name in ('AnnualCrop', 'Forest', 'Residential'))
+    
+    # Left half crop before and no data after; right half forest, half of which becomes residential
+    label_map1 = _label_map([[crop, crop, forest, forest]] * 4)
+    label_map2 = _label_map([[NO_DATA_CLASS, NO_DATA_CLASS, forest, residential]] * 4)
+    
+    results = detector.compare_label_maps(label_map1, label_map2)
+    
+    assert results['valid_area'] == 32 * 64
+    assert results['no_data_fraction1'] == 0.0
+    assert results['no_data_fraction2'] == 0.5
+    
+    # The crop half is only seen before, so it is neither part of the distributions nor a loss
+    changes = {change['class']: change for change in results['change_percentages']}
+    assert changes['AnnualCrop']['initial'] == changes['AnnualCrop']['change'] == 0.0
+    assert np.isclose(changes['Forest']['initial'], 100.0)
+    assert np.isclose(changes['Forest']['change'], -50.0)
+    assert np.isclose(changes['Residential']['change'], 50.0)
+    assert np.isclose(sum(results['class_distribution1']), 1.0)
+    assert np.isclose(sum(results['class_distribution2']), 1.0)
+    
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+    results.update(label_map1=label_map1, label_map2=label_map2, image1=image, image2=image)
+    _, _, critical_changes = detector.generate_change_visualization(results, str(tmp_path / 'changes.png'))
+    
+    # Forest to residential covers half of the common valid area
+    assert np.isclose(critical_changes['deforestation'], 50.0)
+    assert np.isclose(critical_changes['urbanization'], 50.0)
+    assert critical_changes['water_changes'] == 0.0
+
+def _full_image_change_map(results):
+    """The cleaned-up change map computed on the fully expanded grid in one pass"""
+    change_map = results['label_map1'].expand(results['change_grid']).astype(np.uint8) * np.uint8(255)
+    kernel = np.ones((CHANGE_MAP_KERNEL, CHANGE_MAP_KERNEL), np.uint8)
+    change_map = cv2.morphologyEx(change_map, cv2.MORPH_OPEN, kernel)
+    return cv2.morphologyEx(change_map, cv2.MORPH_CLOSE, kernel)
+
+@pytest.mark.parametrize('cell_size', [1, 3, 8, 16, 32])
+@pytest.mark.parametrize('band_rows', [1, 7, 61, CHANGE_MAP_BAND_ROWS])
+def test_change_map_bands_match_full_image(cell_size, band_rows):
+    detector = HighResolutionChangeDetector(load_model=False)
+    rng = np.random.default_rng(cell_size * 1000 + band_rows)
+    
+    for _ in range(5):
+        height, width = (int(n) for n in rng.integers(1, 400, size=2))
+        rows, cols = -(-height // cell_size), -(-width // cell_size)
+        grid = rng.random((rows, cols)) < rng.random()
+        label_map = GridMap(np.zeros((rows, cols), np.uint8), np.zeros((rows, cols), np.uint8),
+                            cell_size, (height, width))
+        results = {'label_map1': label_map, 'change_grid': grid}
+        expected = _full_image_change_map(results)
+    
+        bands = [(y0, y1, band.copy()) for y0, y1, band in detector.change_map_bands(results, band_rows)]
+        assert [y0 for y0, _, _ in bands] == list(range(0, height, max(min(band_rows, height), 1)))
+        np.testing.assert_array_equal(np.concatenate([band for _, _, band in bands]), expected)
+    
+        np.testing.assert_array_equal(detector.expand_change_map(results, band_rows=band_rows), expected)
+        packed = detector.expand_change_map(results, packed=True, band_rows=band_rows)
+        np.testing.assert_array_equal(unpack_change_mask(packed, width), expected)
@@ -0,0 +1,104 @@
+import os
+import cv2
+import numpy as np
+import pytest
+from data_preprocessing import EuroSATDataProcessor, DatasetIndex
+
+def _write_png(dataset, key, value):
+    path = os.path.join(dataset, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cv2.imwrite(path, np.full((8, 8, 3), value, dtype=np.uint8))
+    return path
+
+@pytest.fixture
+def dataset(tmp_path):
+    dataset = str(tmp_path / 'EuroSAT')
+    for i in range(12):
+        _write_png(dataset, f"Forest/forest_{i}.png", i)
+        _write_png(dataset, f"SeaLake/lake_{i}.png", 100 + i)
+    return dataset
+
+def _index(dataset):
+    tmp = os.path.dirname(dataset)
+    processor = EuroSATDataProcessor(dataset, img_size=(16, 16))
+    return DatasetIndex(processor, os.path.join(tmp, 'store'), os.path.join(tmp, 'split'))
+
+def test_added_files_leave_existing_splits_alone(dataset):
+    index = _index(dataset)
+    index.refresh()
+    splits = {key: entry['split'] for key, entry in index.files.items()}
+    
+    for i in range(12, 40):
+        _write_png(dataset, f"Forest/forest_{i}.png", i)
+    index = _index(dataset)
+    report = index.refresh()
+    
+    assert len(report['added']) == 28
+    assert report['unchanged'] == 24
+    assert {key: index.files[key]['split'] for key in splits} == splits
+
+def test_touched_file_is_unchanged(dataset):
+    _index(dataset).refresh()
+    path = os.path.join(dataset, 'Forest', 'forest_3.png')
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10**9))
+    
+    report = _index(dataset).refresh()
+    
+    assert report['unchanged'] == 24
+    assert report['decoded'] == 0
+    assert not report['added'] and not report['changed']
+
+def test_changed_file_gets_a_new_shard(dataset):
+    index = _index(dataset)
+    index.refresh()
+    old = dict(index.files['SeaLake/lake_5.png'])
+    
+    _write_png(dataset, 'SeaLake/lake_5.png', 250)
+    index = _index(dataset)
+    report = index.refresh()
+    entry = index.files['SeaLake/lake_5.png']
+    
+    assert report['changed'] == ['SeaLake/lake_5.png']
+    assert report['decoded'] == 1
+    assert entry['shard'] != old['shard']
+    assert entry['split'] == old['split']
+    assert entry['sha256'] != old['sha256']
+
+def test_removed_file_leaves_the_split(dataset):
+    index = _index(dataset)
+    index.refresh()
+    split_file = os.path.join(index.split_path, index.files['Forest/forest_7.png']['split'], 'Forest', 'forest_7.png')
+    assert os.path.exists(split_file)
+    
+    os.remove(os.path.join(dataset, 'Forest', 'forest_7.png'))
+    index = _index(dataset)
+    report = index.refresh()
+    
+    assert report['removed'] == ['Forest/forest_7.png']
+    assert 'Forest/forest_7.png' not in index.files
+    assert not os.path.exists(split_file)
+
+def test_compact_keeps_the_splits(dataset):
+    index = _index(dataset)
+    index.refresh()
+    _write_png(dataset, 'Forest/forest_0.png', 200)
+    os.remove(os.path.join(dataset, 'SeaLake', 'lake_1.png'))
+    _write_png(dataset, 'SeaLake/lake_new.png', 50)
+    index = _index(dataset)
+    index.refresh()
+    
+    splits = ('train', 'val', 'test')
+    before = {split: index.load_split(split) for split in splits}
+    batches = {split: list(index.iter_batches(split, batch_size=3)) for split in splits}
+    index.compact()
+    index = _index(dataset)
+    
+    assert len([name for name in os.listdir(index.store_path) if name.endswith('.npy')]) == 1
+    for split in splits:
+        images, labels = index.load_split(split)
+        np.testing.assert_array_equal(images, before[split][0])
+        np.testing.assert_array_equal(labels, before[split][1])
+        for (images, labels), (old_images, old_labels) in zip(index.iter_batches(split, batch_size=3), batches[split]):
+            np.testing.assert_array_equal(images, old_images)
+            np.testing.assert_array_equal(labels, old_labels)
+        assert len(list(index.iter_batches(split, batch_size=3))) == len(batches[split])
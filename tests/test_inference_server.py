@@ -0,0 +1,95 @@
+import sys
+import types
+import threading
+import pytest
+import numpy as np
+
+class FakeReplica:
+    """
+    Numpy stand-in for a Keras model; windows are (request id, row) pairs and
+    the prediction of a window is the window itself
+    """
+    output_shape = (None, 2)
+
+    def __init__(self, poison=None):
+        self.poison = poison
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def predict(self, batch, verbose=0):
+        failed = self.poison is not None and bool((batch[:, 0] == self.poison).any())
+        with self.lock:
+            self.batches.append((set(batch[:, 0].astype(int)), len(batch), failed))
+        if failed:
+            raise ValueError("poisoned batch")
+        return batch.copy()
+
+@pytest.fixture
+def make_server(monkeypatch):
+    servers = []
+    
+    def make(replica, replicas=2, batch_size=7, max_delay=0.005):
+        # A TensorFlow module just big enough for InferenceServer.__init__
+        tf = types.ModuleType('tensorflow')
+        tf.config = types.SimpleNamespace(threading=types.SimpleNamespace(
+            set_intra_op_parallelism_threads=lambda n: None,
+            set_inter_op_parallelism_threads=lambda n: None
+        ))
+        tf.keras = types.SimpleNamespace(models=types.SimpleNamespace(load_model=lambda path: replica))
+        monkeypatch.setitem(sys.modules, 'tensorflow', tf)
+    
+        from inference_server import InferenceServer
+        server = InferenceServer('fake.keras', replicas=replicas, batch_size=batch_size, max_delay=max_delay)
+        servers.append(server)
+        return server
+    
+    yield make
+    for server in servers:
+        server.close()
+
+def _windows(request_id, size):
+    return np.stack([np.full(size, request_id), np.arange(size)], axis=1).astype(np.float32)
+
+def test_concurrent_requests_get_their_own_rows_in_order(make_server):
+    server = make_server(FakeReplica())
+    sizes = [1, 3, 7, 8, 20, 0, 5, 33, 2, 13]
+    
+    # Submitted from several threads at once, so their windows share batches
+    futures = {}
+    def submit(request_id):
+        futures[request_id] = server.submit(_windows(request_id, sizes[request_id - 1]))
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(1, len(sizes) + 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    for request_id, size in enumerate(sizes, 1):
+        np.testing.assert_array_equal(futures[request_id].result(timeout=5), _windows(request_id, size))
+    
+    report = server.report()
+    assert report['windows'] == sum(sizes)
+    assert report['queued_windows'] == 0
+
+def test_failed_batch_fails_only_its_requests(make_server):
+    replica = FakeReplica(poison=2)
+    server = make_server(replica, replicas=1, batch_size=8, max_delay=0.05)
+    sizes = {1: 3, 2: 40, 3: 4, 4: 6}
+    futures = {request_id: server.submit(_windows(request_id, size)) for request_id, size in sizes.items()}
+    
+    for future in futures.values():
+        future.exception(timeout=5)
+    
+    failed_ids = set().union(*(ids for ids, _, failed in replica.batches if failed))
+    for request_id, future in futures.items():
+        if request_id in failed_ids:
+            assert isinstance(future.exception(), ValueError)
+        else:
+            np.testing.assert_array_equal(future.result(), _windows(request_id, sizes[request_id]))
+    assert 2 in failed_ids
+    assert failed_ids != set(sizes)
+    
+    # The rest of the failed request was dropped instead of being predicted
+    poisoned_batches = [ids for ids, _, _ in replica.batches if 2 in ids]
+    assert len(poisoned_batches) == 1
+    assert server.report()['queued_windows'] == 0
@@ -0,0 +1,203 @@
+import os
+import json
+import math
+import uuid
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+TILE_SIZE = 256
+TILE_FORMAT = 'webp'
+METADATA_FILE = 'tiles.json'
+
+# Tiles queued per encoder thread; bounds the tiles held in memory at once
+TILES_PER_WORKER = 4
+
+def max_zoom(image_shape, tile_size=TILE_SIZE):
+    """
+    Zoom level at which the image is shown at full resolution
+    
+    Zoom 0 fits the whole image into a single tile and every further level
+    doubles the resolution, as in XYZ slippy maps.
+    
+    Args:
+        image_shape (tuple): Shape of the full-resolution image
+        tile_size (int): Tile edge length in pixels
+    
+    Returns:
+        int: Highest zoom level
+    """
+    return max(math.ceil(math.log2(max(image_shape[:2]) / tile_size)), 0)
+
+def _downsample(image):
+    """
+    Halve an image, leaving odd edges one pixel larger
+    """
+    height, width = image.shape[:2]
+    size = (max(-(-width // 2), 1), max(-(-height // 2), 1))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+def _to_bgra(image):
+    """
+    Convert an RGB or RGBA image to BGRA for OpenCV's encoder
+    """
+    if image.shape[2] == 3:
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGRA)
+    return cv2.cvtColor(image, cv2.COLOR_RGBA2BGRA)
+
+def _write_tile(path, tile, quality):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Unique per write, so concurrent writers of the same pyramid never share a temp file
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp.{TILE_FORMAT}"
+    cv2.imwrite(temp_path, tile, [cv2.IMWRITE_WEBP_QUALITY, quality])
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+def write_tile_pyramid(layers, output_dir, tile_size=TILE_SIZE, quality=80, max_workers=None):
+    """
+    Write images as XYZ pyramids of WebP tiles
+    
+    Each layer is written to ``<output_dir>/<layer>/<z>/<x>/<y>.webp``. Level
+    ``max_zoom`` holds the full-resolution pixels; each lower level is the one
+    above downsampled by two. Edge tiles are padded with transparent pixels
+    so every tile is ``tile_size`` square. Tiles are encoded in parallel;
+    OpenCV releases the GIL while encoding. Only a few tiles per thread are
+    queued at a time, so memory stays bounded for large images. A ``tiles.json`` with the image
+    size, zoom range and layer names is written last, so its presence marks
+    a complete pyramid, and records the pyramid's size on disk for
+    evict_pyramids.
+    
+    Args:
+        layers (dict): Layer name to RGB or RGBA uint8 image, all of the same size
+        output_dir (str): Directory of the pyramid
+        tile_size (int): Tile edge length in pixels
+        quality (int): WebP quality, 1-100 (above 100 is lossless)
+        max_workers (int): Encoder threads, defaults to the CPU count
+    
+    Returns:
+        dict: The pyramid metadata stored in tiles.json
+    """
+    shapes = {image.shape[:2] for image in layers.values()}
+    if len(shapes) != 1:
+        raise ValueError("All layers of a tile pyramid must have the same size")
+    height, width = shapes.pop()
+    top = max_zoom((height, width), tile_size)
+    
+    max_workers = max_workers or os.cpu_count()
+    size = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = deque()
+        for name, image in layers.items():
+            level = _to_bgra(image)
+            for zoom in range(top, -1, -1):
+                if zoom < top:
+                    level = _downsample(level)
+                
+                level_height, level_width = level.shape[:2]
+                for y in range(-(-level_height // tile_size)):
+                    for x in range(-(-level_width // tile_size)):
+                        tile = np.zeros((tile_size, tile_size, 4), dtype=np.uint8)
+                        block = level[y * tile_size:(y + 1) * tile_size, x * tile_size:(x + 1) * tile_size]
+                        tile[:block.shape[0], :block.shape[1]] = block
+                        path = os.path.join(output_dir, name, str(zoom), str(x), f"{y}.{TILE_FORMAT}")
+                        futures.append(executor.submit(_write_tile, path, tile, quality))
+                        
+                        # Wait for the oldest tile before queueing more; also surfaces encoder errors
+                        if len(futures) >= max_workers * TILES_PER_WORKER:
+                            size += futures.popleft().result()
+        
+        for future in futures:
+            size += future.result()
+    
+    metadata = {
+        'width': int(width),
+        'height': int(height),
+        'tile_size': tile_size,
+        'min_zoom': 0,
+        'max_zoom': top,
+        'format': TILE_FORMAT,
+        'layers': list(layers),
+        'bytes': size
+    }
+    path = os.path.join(output_dir, METADATA_FILE)
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(metadata, f)
+    os.replace(temp_path, path)
+    return metadata
+
+def read_metadata(output_dir):
+    """
+    Load the metadata of a complete pyramid
+    
+    Returns:
+        dict: Contents of tiles.json, or None if the pyramid is missing or incomplete
+    """
+    path = os.path.join(output_dir, METADATA_FILE)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def touch_pyramid(output_dir):
+    """
+    Mark a complete pyramid as used, so evict_pyramids keeps it longer
+    """
+    try:
+        os.utime(os.path.join(output_dir, METADATA_FILE))
+    except FileNotFoundError:
+        pass
+
+def _directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+def evict_pyramids(tiles_dir, max_bytes, keep=()):
+    """
+    Delete the least recently used pyramids until the rest fit into max_bytes
+    
+    A pyramid counts as used when it is written or touched (touch_pyramid).
+    Pyramids still being written have no tiles.json yet and are left alone.
+    
+    Args:
+        tiles_dir (str): Directory holding one pyramid per sub-directory
+        max_bytes (int): Disk space the pyramids may take
+        keep (iterable): Pyramid names never to delete, e.g. the one just written
+    
+    Returns:
+        list: Names of the deleted pyramids
+    """
+    if not os.path.isdir(tiles_dir):
+        return []
+    
+    pyramids = []
+    for name in os.listdir(tiles_dir):
+        output_dir = os.path.join(tiles_dir, name)
+        try:
+            used = os.stat(os.path.join(output_dir, METADATA_FILE)).st_mtime
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        metadata = read_metadata(output_dir) or {}
+        # Pyramids written before sizes were recorded are measured on disk
+        pyramids.append((used, name, metadata.get('bytes') or _directory_bytes(output_dir)))
+    
+    total = sum(size for _, _, size in pyramids)
+    evicted = []
+    for _, name, size in sorted(pyramids):
+        if total <= max_bytes:
+            break
+        if name in keep:
+            continue
+        output_dir = os.path.join(tiles_dir, name)
+        # Without tiles.json the pyramid reads as missing while its tiles go
+        try:
+            os.remove(os.path.join(output_dir, METADATA_FILE))
+        except FileNotFoundError:
+            continue
+        shutil.rmtree(output_dir, ignore_errors=True)
+        total -= size
+        evicted.append(name)
+    return evicted
@@ -1,44 +1,193 @@
 import os
-import tensorflow as tf
-from data_preprocessing import EuroSATDataProcessor
-from model_architecture import EuroSATChangeDetectionModel
-import matplotlib.pyplot as plt
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from data_preprocessing import EuroSATDataProcessor, DatasetIndex
+from model_architecture import EuroSATChangeDetectionModel, MODEL_VARIANTS, model_variant_path
 
-def train_eurosat_model(dataset_path='./dataset/EuroSAT', 
-                        split_path='./dataset/split', 
-                        model_save_path='./models/change_detection.keras'):
+# Batch size and learning rate the single-process schedule was tuned for
+BASE_BATCH_SIZE = 32
+BASE_LEARNING_RATE = 1e-4
+
+# Defaults for warm-starting from an already trained model
+FINE_TUNE_LEARNING_RATE = 1e-5
+FINE_TUNE_EPOCHS = 10
+
+def is_chief():
+    """
+    Check whether this process is the chief of a multi-worker cluster
+    
+    Worker 0 acts as chief when TF_CONFIG defines no explicit chief task.
+    A process without TF_CONFIG is always the chief.
+    
+    Returns:
+        bool: True if this process should write checkpoints and the final model
+    """
+    tf_config = json.loads(os.environ.get('TF_CONFIG', '{}'))
+    task = tf_config.get('task', {})
+    task_type, task_index = task.get('type'), task.get('index', 0)
+    
+    if task_type is None or task_type == 'chief':
+        return True
+    return task_type == 'worker' and task_index == 0 and 'chief' not in tf_config.get('cluster', {})
+
+def train_eurosat_model(dataset_path='./dataset/EuroSAT',
+                        split_path='./dataset/split',
+                        model_save_path=None,
+                        epochs=50,
+                        batch_size=BASE_BATCH_SIZE,
+                        distributed=False,
+                        skip_split=False,
+                        resplit=False,
+                        incremental=False,
+                        store_path='./dataset/store',
+                        backup_dir='./models/backup',
+                        fine_tune_from=None,
+                        freeze_blocks=(),
+                        fine_tune_learning_rate=FINE_TUNE_LEARNING_RATE,
+                        variant='baseline',
+                        distill_from=None):
     """
     Complete training pipeline for EuroSAT change detection model
     
     Args:
         dataset_path (str): Path to original dataset
         split_path (str): Path to split dataset
-        model_save_path (str): Path to save trained model
+        model_save_path (str): Path to save trained model, defaults to the
+            variant's path in ./models
+        epochs (int): Number of training epochs
+        batch_size (int): Batch size per worker
+        distributed (bool): Train with MultiWorkerMirroredStrategy using the
+            cluster described by the TF_CONFIG environment variable
+        skip_split (bool): Never split, even if no split exists yet
+        resplit (bool): Split again even if a split already exists
+        incremental (bool): Keep the split in sync with the dataset through a
+            DatasetIndex: only new or changed samples are hashed, decoded and
+            copied, and existing samples keep their split. Training then reads
+            the decoded samples from the store instead of the split folders.
+        store_path (str): Directory of the dataset index and decoded samples
+        backup_dir (str): Directory for per-epoch checkpoints; a run that was
+            interrupted resumes from there automatically. None disables it.
+        fine_tune_from (str): Path of a trained model to warm-start from
+        freeze_blocks (iterable): Conv block indices to freeze when fine-tuning
+        fine_tune_learning_rate (float): Learning rate for fine-tuning at the
+            base batch size
+        variant (str): Architecture registered in MODEL_VARIANTS
+        distill_from (str): Path of a trained teacher model; the new model is
+            trained by knowledge distillation from it
     """
+    # Imported here so the launcher of local workers and --help stay light
+    import tensorflow as tf
+    import matplotlib.pyplot as plt
+    
+    # The strategy has to exist before any other TensorFlow op runs
+    strategy = tf.distribute.MultiWorkerMirroredStrategy() if distributed else None
+    chief = is_chief()
+    model_save_path = model_save_path or model_variant_path(variant)
+    
     # Initialize data processor
     data_processor = EuroSATDataProcessor(dataset_path)
     
-    # Split dataset
-    data_processor.split_dataset(split_path)
+    # Split dataset, keeping an existing split so resumed runs see the same data
+    if incremental:
+        index = DatasetIndex(data_processor, store_path, split_path)
+        if not skip_split:
+            index.refresh()
+        
+        # Train from the decoded samples in the store, so no JPEG is read again
+        train_data, val_data = index.load_split('train'), index.load_split('val')
+        print(f"Using {len(train_data[0])} training and {len(val_data[0])} validation samples from {store_path}")
+    elif not skip_split and (resplit or not os.path.isdir(split_path)):
+        data_processor.split_dataset(split_path)
+    else:
+        print(f"Using existing dataset split in {split_path}")
     
-    # Create data generators
-    train_generator, validation_generator = data_processor.create_data_generators(
-        os.path.join(split_path, 'train'), 
-        os.path.join(split_path, 'val')
-    )
+    base_learning_rate = fine_tune_learning_rate if fine_tune_from else BASE_LEARNING_RATE
+    
+    if strategy is not None:
+        # Scale the learning rate linearly with the global batch size
+        global_batch_size = batch_size * strategy.num_replicas_in_sync
+        learning_rate = base_learning_rate * global_batch_size / BASE_BATCH_SIZE
+        print(f"Training on {strategy.num_replicas_in_sync} replicas, "
+              f"global batch size {global_batch_size}, learning rate {learning_rate:g}")
+        
+        if incremental:
+            train_generator, validation_generator = data_processor.create_array_datasets(
+                train_data, val_data, batch_size=global_batch_size, shard=True
+            )
+        else:
+            train_generator, validation_generator = data_processor.create_datasets(
+                os.path.join(split_path, 'train'),
+                os.path.join(split_path, 'val'),
+                batch_size=global_batch_size,
+                shard=True
+            )
+    else:
+        learning_rate = base_learning_rate * batch_size / BASE_BATCH_SIZE
+        
+        # Create data generators
+        if incremental:
+            train_generator, validation_generator = data_processor.create_array_generators(
+                train_data, val_data, batch_size=batch_size
+            )
+        else:
+            train_generator, validation_generator = data_processor.create_data_generators(
+                os.path.join(split_path, 'train'),
+                os.path.join(split_path, 'val'),
+                batch_size=batch_size
+            )
     
     # Initialize model with 8 classes instead of 10
-    change_detection_model = EuroSATChangeDetectionModel(num_classes=8)
+    change_detection_model = EuroSATChangeDetectionModel(
+        num_classes=8, learning_rate=learning_rate, strategy=strategy, variant=variant
+    )
+    
+    if fine_tune_from:
+        # Warm-start from the trained model and only adapt the unfrozen layers
+        print(f"Fine-tuning {fine_tune_from} with conv blocks {list(freeze_blocks)} frozen")
+        change_detection_model.load_model(fine_tune_from)
+        change_detection_model.prepare_fine_tuning(freeze_blocks, learning_rate)
+    
+    # Keep checkpoints of different variants and run types apart
+    if backup_dir:
+        run_type = 'fine_tune' if fine_tune_from else 'distill' if distill_from else 'train'
+        backup_dir = os.path.join(backup_dir, variant, run_type)
     
     # Train model
-    history = change_detection_model.train(
-        train_generator, 
-        validation_generator, 
-        epochs=50
-    )
+    if distill_from:
+        print(f"Distilling {variant} from teacher {distill_from}")
+        if strategy is not None:
+            with strategy.scope():
+                teacher = tf.keras.models.load_model(distill_from)
+        else:
+            teacher = tf.keras.models.load_model(distill_from)
+        history = change_detection_model.distill(
+            teacher,
+            train_generator,
+            validation_generator,
+            epochs=epochs,
+            backup_dir=backup_dir
+        )
+    else:
+        history = change_detection_model.train(
+            train_generator,
+            validation_generator,
+            epochs=epochs,
+            backup_dir=backup_dir
+        )
     
-    # Save model
-    change_detection_model.save_model(model_save_path)
+    # Save model. Every worker has to take part in saving; non-chief workers
+    # write to a scratch directory that is removed right away.
+    if chief:
+        change_detection_model.save_model(model_save_path)
+    else:
+        scratch_dir = tempfile.mkdtemp()
+        change_detection_model.save_model(os.path.join(scratch_dir, os.path.basename(model_save_path)))
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        return history
     
     # Plot training history
     plt.figure(figsize=(12, 4))
@@ -58,6 +207,121 @@ def train_eurosat_model(dataset_path='./dataset/EuroSAT',
     plt.tight_layout()
     plt.savefig('./results/training_history.png')
     plt.close()
+    
+    return history
+
+def launch_local_workers(num_workers, worker_args, base_port=12345):
+    """
+    Run a multi-worker training cluster as processes on this machine
+    
+    Each worker gets its own TF_CONFIG pointing at localhost ports, which is
+    enough to exercise the distributed code path without a real cluster.
+    
+    Args:
+        num_workers (int): Number of worker processes
+        worker_args (list): Command line arguments passed to every worker
+        base_port (int): Port of worker 0; worker i listens on base_port + i
+    
+    Returns:
+        int: 0 if every worker succeeded, otherwise the first non-zero exit code
+    """
+    cluster = {'worker': [f'localhost:{base_port + i}' for i in range(num_workers)]}
+    processes = []
+    
+    for index in range(num_workers):
+        env = dict(os.environ)
+        env['TF_CONFIG'] = json.dumps({'cluster': cluster, 'task': {'type': 'worker', 'index': index}})
+        processes.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--distributed', '--skip-split'] + worker_args,
+            env=env
+        ))
+    
+    exit_codes = [process.wait() for process in processes]
+    return next((code for code in exit_codes if code != 0), 0)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train the EuroSAT land cover classifier')
+    parser.add_argument('--dataset-path', default='./dataset/EuroSAT')
+    parser.add_argument('--split-path', default='./dataset/split')
+    parser.add_argument('--model-save-path', default=None,
+                        help="Defaults to the variant's path in ./models")
+    parser.add_argument('--variant', default='baseline', choices=list(MODEL_VARIANTS),
+                        help='Model architecture to train')
+    parser.add_argument('--distill', nargs='?', const='./models/change_detection.keras', default=None,
+                        metavar='TEACHER_PATH', help='Train by knowledge distillation from a teacher model')
+    parser.add_argument('--epochs', type=int, default=None,
+                        help=f'Defaults to 50, or {FINE_TUNE_EPOCHS} when fine-tuning')
+    parser.add_argument('--batch-size', type=int, default=BASE_BATCH_SIZE, help='Batch size per worker')
+    parser.add_argument('--distributed', action='store_true',
+                        help='Join the multi-worker cluster described by TF_CONFIG')
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help='Launch this many local worker processes and train across them')
+    parser.add_argument('--base-port', type=int, default=12345)
+    parser.add_argument('--skip-split', action='store_true', help='Never split the dataset')
+    parser.add_argument('--resplit', action='store_true', help='Split again even if a split exists')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only add new or changed samples to the split, keeping existing ones in place')
+    parser.add_argument('--store-path', default='./dataset/store',
+                        help='Dataset index and decoded samples that --incremental trains from')
+    parser.add_argument('--backup-dir', default='./models/backup',
+                        help='Checkpoint directory used to resume interrupted runs')
+    parser.add_argument('--no-backup', action='store_true', help='Disable per-epoch checkpoints')
+    parser.add_argument('--fine-tune', nargs='?', const='./models/change_detection.keras', default=None,
+                        metavar='MODEL_PATH', help='Warm-start from a trained model')
+    parser.add_argument('--freeze-blocks', type=int, nargs='*', default=[],
+                        help='Conv block indices (0-based) to freeze when fine-tuning')
+    parser.add_argument('--fine-tune-lr', type=float, default=FINE_TUNE_LEARNING_RATE)
+    args = parser.parse_args()
+    
+    if args.epochs is None:
+        args.epochs = FINE_TUNE_EPOCHS if args.fine_tune else 50
+    return args
 
 if __name__ == '__main__':
-    train_eurosat_model()
\ No newline at end of file
+    args = parse_args()
+    backup_dir = None if args.no_backup else args.backup_dir
+    
+    if args.local_workers:
+        # Split once up front so the workers don't race on the same folders
+        if args.incremental and not args.skip_split:
+            DatasetIndex(EuroSATDataProcessor(args.dataset_path), args.store_path, args.split_path).refresh()
+        elif not args.skip_split and (args.resplit or not os.path.isdir(args.split_path)):
+            EuroSATDataProcessor(args.dataset_path).split_dataset(args.split_path)
+        worker_args = [
+            '--dataset-path', args.dataset_path,
+            '--split-path', args.split_path,
+            '--variant', args.variant,
+            '--epochs', str(args.epochs),
+            '--batch-size', str(args.batch_size),
+            '--fine-tune-lr', str(args.fine_tune_lr)
+        ]
+        worker_args += ['--no-backup'] if backup_dir is None else ['--backup-dir', backup_dir]
+        if args.model_save_path:
+            worker_args += ['--model-save-path', args.model_save_path]
+        if args.incremental:
+            # Refreshed above; the workers only read the store
+            worker_args += ['--incremental', '--store-path', args.store_path]
+        if args.distill:
+            worker_args += ['--distill', args.distill]
+        if args.fine_tune:
+            worker_args += ['--fine-tune', args.fine_tune, '--freeze-blocks'] + [str(b) for b in args.freeze_blocks]
+        sys.exit(launch_local_workers(args.local_workers, worker_args, args.base_port))
+    
+    train_eurosat_model(
+        dataset_path=args.dataset_path,
+        split_path=args.split_path,
+        model_save_path=args.model_save_path,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        distributed=args.distributed,
+        skip_split=args.skip_split,
+        resplit=args.resplit,
+        incremental=args.incremental,
+        store_path=args.store_path,
+        backup_dir=backup_dir,
+        fine_tune_from=args.fine_tune,
+        freeze_blocks=args.freeze_blocks,
+        fine_tune_learning_rate=args.fine_tune_lr,
+        variant=args.variant,
+        distill_from=args.distill
+    )